@@ -13,8 +13,25 @@ DEFAULT_APP_FILE = "src/app/app.py"
 if str(SRC_DIR) not in sys.path:
     sys.path.insert(0, str(SRC_DIR))
 
-from db_artifact import download_remote_db, has_remote_db_artifact, upload_remote_db
-from runtime_config import get_db_path, get_remote_db_uri
+from db_artifact import (
+    download_cold_tier,
+    download_remote_db,
+    has_remote_cold_tier,
+    has_remote_db_artifact,
+    upload_remote_db,
+)
+from db_compaction import compact_db_file
+from query_stats import QUERY_LOG_TABLE_NAME, load_query_stats
+from runtime_config import (
+    DUCKDB_PROFILE_COLLECTOR,
+    DUCKDB_PROFILE_DASHBOARD,
+    DUCKDB_PROFILE_MAINTENANCE,
+    get_cold_storage_dir,
+    get_db_path,
+    get_query_log_sidecar_path,
+    get_remote_cold_uri,
+    get_remote_db_uri,
+)
 
 
 def log(message: str) -> None:
@@ -33,6 +50,12 @@ def build_env(extra_env: dict[str, str] | None = None) -> dict[str, str]:
     return env
 
 
+def with_duckdb_profile(
+    profile: str, extra_env: dict[str, str] | None = None
+) -> dict[str, str]:
+    return {"DUCKDB_PROFILE": profile, **(extra_env or {})}
+
+
 def resolve_python_bin() -> str:
     configured_python = os.environ.get("PYTHON_BIN", "").strip()
     return configured_python or sys.executable
@@ -45,8 +68,12 @@ def resolve_streamlit_command(app_file: str) -> list[str]:
     return [resolve_python_bin(), "-m", "streamlit", "run", app_file]
 
 
-def run_python_script(script_path: str, extra_env: dict[str, str] | None = None) -> None:
-    command = [resolve_python_bin(), str(ROOT_DIR / script_path)]
+def run_python_script(
+    script_path: str,
+    extra_env: dict[str, str] | None = None,
+    args: list[str] | None = None,
+) -> None:
+    command = [resolve_python_bin(), str(ROOT_DIR / script_path), *(args or [])]
     log(f"Eseguo {' '.join(command)}")
     completed = subprocess.run(
         command,
@@ -59,11 +86,23 @@ def run_python_script(script_path: str, extra_env: dict[str, str] | None = None)
 
 
 def run_collectors(extra_env: dict[str, str] | None = None) -> None:
-    run_python_script("src/collector.py", extra_env=extra_env)
-    run_python_script("src/pod_collector.py", extra_env=extra_env)
+    collector_env = with_duckdb_profile(DUCKDB_PROFILE_COLLECTOR, extra_env)
+    run_python_script("src/collector.py", extra_env=collector_env)
+    run_python_script("src/pod_collector.py", extra_env=collector_env)
+
+
+def maybe_download_cold_tier(db_path: Path) -> None:
+    if not has_remote_cold_tier():
+        return
+
+    cold_dir = get_cold_storage_dir(db_path)
+    log(f"Sincronizzo tier freddo da {get_remote_cold_uri()} -> {cold_dir}")
+    downloaded = download_cold_tier(cold_dir)
+    log(f"Tier freddo sincronizzato: {len(downloaded)} file scaricati")
 
 
 def maybe_download_db(*, allow_missing: bool) -> None:
+    maybe_download_cold_tier(get_db_path())
     if not has_remote_db_artifact():
         return
 
@@ -81,6 +120,22 @@ def maybe_upload_db() -> None:
     upload_remote_db()
 
 
+def format_size(size_bytes: int) -> str:
+    return f"{size_bytes / (1024 * 1024):.1f} MB"
+
+
+def compact_db(db_path: Path) -> None:
+    log(f"Compatto DuckDB {db_path}")
+    size_before, size_after = compact_db_file(db_path)
+    saved = size_before - size_after
+    saved_pct = (saved / size_before * 100) if size_before else 0.0
+    log(
+        "Compattazione completata: "
+        f"{format_size(size_before)} -> {format_size(size_after)} "
+        f"(risparmio {format_size(saved)}, {saved_pct:.1f}%)"
+    )
+
+
 def build_refresh_work_db_path(live_db_path: Path) -> Path:
     return live_db_path.with_name(f"{live_db_path.stem}.refresh{live_db_path.suffix}")
 
@@ -125,8 +180,14 @@ def promote_refresh_work_db(work_db_path: Path, live_db_path: Path) -> None:
         upload_remote_db(local_path=live_db_path)
 
 
-def command_collect(_args: argparse.Namespace) -> int:
-    run_collectors()
+def build_shard_env(shard_workers: int | None) -> dict[str, str]:
+    if shard_workers is None:
+        return {}
+    return {"COSTS_SHARD_WORKERS": str(shard_workers)}
+
+
+def command_collect(args: argparse.Namespace) -> int:
+    run_collectors(extra_env=build_shard_env(args.shard_workers))
     return 0
 
 
@@ -145,9 +206,17 @@ def command_refresh_db(args: argparse.Namespace) -> int:
     work_db_path = prepare_refresh_work_db(
         live_db_path, allow_missing_remote_db=args.allow_missing_remote_db
     )
+    maybe_download_cold_tier(live_db_path)
 
     try:
-        run_collectors(extra_env={"DUCKDB_PATH": str(work_db_path)})
+        run_collectors(
+            extra_env={
+                "DUCKDB_PATH": str(work_db_path),
+                **build_shard_env(args.shard_workers),
+            }
+        )
+        if args.compact:
+            compact_db(work_db_path)
         promote_refresh_work_db(work_db_path, live_db_path)
     finally:
         if work_db_path.exists():
@@ -155,6 +224,74 @@ def command_refresh_db(args: argparse.Namespace) -> int:
     return 0
 
 
+def command_tier_db(args: argparse.Namespace) -> int:
+    live_db_path = get_db_path()
+    work_db_path = prepare_refresh_work_db(live_db_path, allow_missing_remote_db=False)
+    if not work_db_path.exists():
+        log(f"File DuckDB non trovato: {live_db_path}")
+        return 1
+    maybe_download_cold_tier(live_db_path)
+
+    try:
+        run_python_script(
+            "src/tiering.py",
+            extra_env=with_duckdb_profile(
+                DUCKDB_PROFILE_MAINTENANCE, {"DUCKDB_PATH": str(work_db_path)}
+            ),
+            args=["--keep-months", str(args.keep_months)],
+        )
+        promote_refresh_work_db(work_db_path, live_db_path)
+    finally:
+        if work_db_path.exists():
+            work_db_path.unlink()
+    return 0
+
+
+def command_compact_db(args: argparse.Namespace) -> int:
+    db_path = get_db_path()
+    if not db_path.exists():
+        log(f"File DuckDB non trovato: {db_path}")
+        return 1
+
+    compact_db(db_path)
+    if args.upload_db:
+        maybe_upload_db()
+    return 0
+
+
+def command_rebuild_derived(args: argparse.Namespace) -> int:
+    run_python_script(
+        "src/pod_collector.py",
+        extra_env=with_duckdb_profile(DUCKDB_PROFILE_MAINTENANCE),
+        args=["rebuild-derived"],
+    )
+    if args.upload_db:
+        maybe_upload_db()
+    return 0
+
+
+def command_query_stats(args: argparse.Namespace) -> int:
+    db_path = get_db_path()
+    if not db_path.exists():
+        log(f"File DuckDB non trovato: {db_path}")
+        return 1
+
+    stats = load_query_stats(db_path, since_days=args.since_days)
+    if stats is None:
+        log(
+            f"Tabella {QUERY_LOG_TABLE_NAME} assente in {db_path} e in "
+            f"{get_query_log_sidecar_path(db_path)}: esegui collector e "
+            "dashboard con DUCKDB_QUERY_LOG=1."
+        )
+        return 1
+    if stats.empty:
+        log(f"Nessuna query registrata negli ultimi {args.since_days} giorni.")
+        return 0
+
+    print(stats.to_string(index=False, float_format=lambda value: f"{value:.1f}"))
+    return 0
+
+
 def command_dashboard(args: argparse.Namespace) -> int:
     if not args.skip_db_download:
         maybe_download_db(allow_missing=args.allow_missing_remote_db)
@@ -167,10 +304,26 @@ def command_dashboard(args: argparse.Namespace) -> int:
     command = resolve_streamlit_command(args.app_file)
     log(f"Avvio dashboard con {' '.join(command)}")
     os.chdir(ROOT_DIR)
-    os.execvpe(command[0], command, build_env())
+    dashboard_env = with_duckdb_profile(DUCKDB_PROFILE_DASHBOARD)
+    if args.in_memory:
+        dashboard_env["DUCKDB_IN_MEMORY"] = "1"
+    os.execvpe(command[0], command, build_env(dashboard_env))
     return 0
 
 
+def add_shard_workers_argument(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--shard-workers",
+        type=int,
+        default=None,
+        help=(
+            "Scrive i costi di ogni account su file shard con N writer paralleli "
+            "e li unisce nel DB principale. 0 disattiva. "
+            "Default: COSTS_SHARD_WORKERS"
+        ),
+    )
+
+
 def build_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(description="Runtime CLI per Checker.")
     subparsers = parser.add_subparsers(dest="command", required=True)
@@ -178,6 +331,7 @@ def build_parser() -> argparse.ArgumentParser:
     collect_parser = subparsers.add_parser(
         "collect", help="Esegue i collector senza sincronizzazione S3."
     )
+    add_shard_workers_argument(collect_parser)
     collect_parser.set_defaults(handler=command_collect)
 
     download_parser = subparsers.add_parser(
@@ -206,8 +360,69 @@ def build_parser() -> argparse.ArgumentParser:
         action="store_true",
         help="Consente il bootstrap se l'oggetto remoto non esiste ancora.",
     )
+    refresh_parser.add_argument(
+        "--compact",
+        action="store_true",
+        help="Compatta la working copy prima di promuoverla e caricarla.",
+    )
+    add_shard_workers_argument(refresh_parser)
     refresh_parser.set_defaults(handler=command_refresh_db)
 
+    compact_parser = subparsers.add_parser(
+        "compact-db",
+        help=(
+            "Riscrive il DuckDB locale in un file nuovo senza spazio morto "
+            "e lo sostituisce in modo atomico."
+        ),
+    )
+    compact_parser.add_argument(
+        "--upload-db",
+        action="store_true",
+        help="Carica su S3 il DB compattato al termine.",
+    )
+    compact_parser.set_defaults(handler=command_compact_db)
+
+    tier_parser = subparsers.add_parser(
+        "tier-db",
+        help=(
+            "Sposta i mesi chiusi piu' vecchi di N in Parquet partizionato "
+            "e ripubblica il DB caldo."
+        ),
+    )
+    tier_parser.add_argument(
+        "--keep-months",
+        type=int,
+        default=13,
+        help="Mesi chiusi da mantenere nel DB oltre al corrente. Default: 13",
+    )
+    tier_parser.set_defaults(handler=command_tier_db)
+
+    rebuild_derived_parser = subparsers.add_parser(
+        "rebuild-derived",
+        help=(
+            "Ricalcola delta pod e tabella mensile dai totali giornalieri "
+            "salvati nel DuckDB locale, senza accesso a S3."
+        ),
+    )
+    rebuild_derived_parser.add_argument(
+        "--upload-db",
+        action="store_true",
+        help="Carica su S3 il DB aggiornato al termine.",
+    )
+    rebuild_derived_parser.set_defaults(handler=command_rebuild_derived)
+
+    query_stats_parser = subparsers.add_parser(
+        "query-stats",
+        help="Riepiloga p50/p95 per tag delle query registrate in query_log.",
+    )
+    query_stats_parser.add_argument(
+        "--since-days",
+        type=int,
+        default=7,
+        help="Considera solo le query degli ultimi N giorni. Default: 7",
+    )
+    query_stats_parser.set_defaults(handler=command_query_stats)
+
     dashboard_parser = subparsers.add_parser(
         "dashboard",
         help="Scarica opzionalmente il DuckDB remoto e avvia Streamlit.",
@@ -237,6 +452,14 @@ def build_parser() -> argparse.ArgumentParser:
         action="store_true",
         help="Non fallire se il DB remoto non esiste ancora.",
     )
+    dashboard_parser.add_argument(
+        "--in-memory",
+        action="store_true",
+        help=(
+            "Carica il DuckDB in memoria a ogni nuova versione del file, "
+            "entro DUCKDB_IN_MEMORY_MAX_BYTES (default 512 MiB)."
+        ),
+    )
     dashboard_parser.set_defaults(handler=command_dashboard)
 
     return parser
@@ -1,6 +1,9 @@
+from functools import wraps
 from pathlib import Path
 
 import pandas as pd
+import streamlit as st
+from duckdb_client import ReadOnlyConnectionPool
 from runtime_config import get_db_mtime_ns, get_db_path as resolve_db_path
 
 
@@ -28,6 +31,39 @@ def get_db_cache_buster(db_name: str) -> int:
     return get_db_mtime_ns(db_name)
 
 
+@st.cache_resource(show_spinner=False)
+def get_read_only_pool() -> ReadOnlyConnectionPool:
+    return ReadOnlyConnectionPool()
+
+
+def open_read_only_client(db_name: str):
+    return get_read_only_pool().client(db_name)
+
+
+def arrow_to_pandas(table, date_as_object=True) -> pd.DataFrame:
+    # split_blocks evita di consolidare (copiando) le colonne dello stesso tipo.
+    return table.to_pandas(
+        date_as_object=date_as_object,
+        coerce_temporal_nanoseconds=True,
+        split_blocks=True,
+    )
+
+
+def cache_arrow_data(date_as_object=True):
+    # La tabella Arrow del loader viene convertita una sola volta e il
+    # DataFrame resta in st.cache_resource: nessun pickle ne' conversione a
+    # ogni rerun. Il DataFrame e' condiviso tra le sessioni, quindi chi deve
+    # modificarlo ne fa prima una copia.
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            return arrow_to_pandas(func(*args, **kwargs), date_as_object=date_as_object)
+
+        return st.cache_resource(show_spinner=False)(wrapper)
+
+    return decorator
+
+
 def safe_div(numerator, denominator):
     if denominator in (0, None) or pd.isna(denominator):
         return pd.NA
@@ -1,74 +1,105 @@
 import re
 
 import pandas as pd
-import streamlit as st
 
-from duckdb_client import get_duckdb_client
+from duckdb_client import build_services_metric_defs, get_month_metric_name
+from runtime_config import get_costs_average_windows, get_costs_lookback_months
+
 try:
-    from app.page_shared import format_month_label, safe_div
+    from app.page_shared import (
+        cache_arrow_data,
+        format_month_label,
+        open_read_only_client,
+        safe_div,
+    )
 except ModuleNotFoundError:
-    from page_shared import format_month_label, safe_div
+    from page_shared import (
+        cache_arrow_data,
+        format_month_label,
+        open_read_only_client,
+        safe_div,
+    )
 
 
 TABLE_NAME_PATTERN = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+# Righe della tabella costi derivate dalla stessa configurazione della query
+# (COSTS_METRICS_LOOKBACK_MONTHS, COSTS_METRICS_AVERAGE_MONTHS).
+SERVICES_METRIC_DEFS = build_services_metric_defs()
 ROW_DEFS = [
-    ("mtd", "delta_prev", "pct_prev"),
-    ("prev_mtd", "delta_prev2", "pct_prev2"),
-    ("prev2_mtd", "delta_prev3", "pct_prev3"),
-    ("prev3_mtd", "delta_prev4", "pct_prev4"),
-    ("prev4_mtd", "delta_prev5", "pct_prev5"),
-    ("avg6", "delta_avg6", "pct_avg6"),
-    ("avg12", "delta_avg12", "pct_avg12"),
+    (metric, delta_col, pct_col)
+    for metric, delta_col, pct_col, _value, _reference in SERVICES_METRIC_DEFS
+]
+MONTH_METRICS = [
+    get_month_metric_name(months_back)
+    for months_back in range(get_costs_lookback_months())
 ]
+AVERAGE_METRICS = [f"avg{window}" for window in get_costs_average_windows()]
 ROW_LABELS = {
-    "mtd": "Mese corrente",
-    "prev_mtd": "Mese precedente",
-    "prev2_mtd": "2 mesi fa",
-    "prev3_mtd": "3 mesi fa",
-    "prev4_mtd": "4 mesi fa",
-    "avg6": "Media 6M",
-    "avg12": "Media 12M",
+    **{
+        metric: (
+            "Mese corrente"
+            if months_back == 0
+            else "Mese precedente"
+            if months_back == 1
+            else f"{months_back} mesi fa"
+        )
+        for months_back, metric in enumerate(MONTH_METRICS)
+    },
+    **{f"avg{window}": f"Media {window}M" for window in get_costs_average_windows()},
 }
 
 
-@st.cache_data(show_spinner=False)
+@cache_arrow_data()
 def load_data(db_name: str, table_name: str, _db_cache_buster: int):
-    client = get_duckdb_client(db_name)
-    try:
-        return client.get_services_metrics(table_name)
-    finally:
-        client.close()
+    with open_read_only_client(db_name) as client:
+        return client.get_services_metrics(table_name, as_arrow=True)
 
 
-@st.cache_data(show_spinner=False)
+@cache_arrow_data()
 def load_data_for_anchor(
     db_name: str, table_name: str, anchor_date: str, _db_cache_buster: int
 ):
-    client = get_duckdb_client(db_name)
-    try:
-        return client.get_services_metrics(table_name, anchor_date=anchor_date)
-    finally:
-        client.close()
+    with open_read_only_client(db_name) as client:
+        return client.get_services_metrics(
+            table_name, anchor_date=anchor_date, as_arrow=True
+        )
 
 
-@st.cache_data(show_spinner=False)
+@cache_arrow_data()
 def load_data_for_month(
     db_name: str, table_name: str, month_start: str, _db_cache_buster: int
 ):
-    client = get_duckdb_client(db_name)
-    try:
-        return client.get_services_metrics_for_month(table_name, month_start=month_start)
-    finally:
-        client.close()
+    with open_read_only_client(db_name) as client:
+        return client.get_services_metrics_for_month(
+            table_name, month_start=month_start, as_arrow=True
+        )
 
 
-@st.cache_data(show_spinner=False)
+@cache_arrow_data()
 def load_available_month_anchors(db_name: str, table_name: str, _db_cache_buster: int):
-    client = get_duckdb_client(db_name)
-    try:
-        return client.get_available_month_anchors(table_name)
-    finally:
-        client.close()
+    with open_read_only_client(db_name) as client:
+        return client.get_available_month_anchors(table_name, as_arrow=True)
+
+
+@cache_arrow_data()
+def load_range_comparison(
+    db_name: str,
+    table_name: str,
+    current_start: str,
+    current_end: str,
+    reference_start: str,
+    reference_end: str,
+    _db_cache_buster: int,
+):
+    with open_read_only_client(db_name) as client:
+        return client.get_services_range_comparison(
+            table_name,
+            current_start,
+            current_end,
+            reference_start,
+            reference_end,
+            as_arrow=True,
+        )
 
 
 def is_valid_table_name(table_name: str) -> bool:
@@ -83,16 +114,9 @@ def normalize_costs_dataframe(df: pd.DataFrame) -> pd.DataFrame:
 
 
 def normalize_month_anchors(month_anchors: pd.DataFrame) -> pd.DataFrame:
+    # month_start e anchor_date arrivano gia' come DATE dalla query.
     if month_anchors.empty:
         return month_anchors
-
-    month_anchors = month_anchors.copy()
-    month_anchors["month_start"] = pd.to_datetime(
-        month_anchors["month_start"], errors="coerce"
-    ).dt.date
-    month_anchors["anchor_date"] = pd.to_datetime(
-        month_anchors["anchor_date"], errors="coerce"
-    ).dt.date
     return month_anchors.dropna(subset=["account", "month_start", "anchor_date"])
 
 
@@ -138,14 +162,7 @@ def build_row_labels(anchor_date) -> dict[str, str]:
         return labels
 
     anchor_month = anchor_ts.to_period("M").to_timestamp()
-    month_metrics = [
-        ("mtd", 0),
-        ("prev_mtd", 1),
-        ("prev2_mtd", 2),
-        ("prev3_mtd", 3),
-        ("prev4_mtd", 4),
-    ]
-    for metric, months_back in month_metrics:
+    for months_back, metric in enumerate(MONTH_METRICS):
         month_start = anchor_month - pd.DateOffset(months=months_back)
         labels[metric] = format_month_label(month_start.date())
     return labels
@@ -167,49 +184,19 @@ def build_total_series(df: pd.DataFrame, metric_cols: list[str]) -> pd.Series:
         totals["delta_7d"] = sums["cost"] - sums["avg7"]
     if "delta_30d" in metric_cols and {"cost", "avg30"} <= sums.keys():
         totals["delta_30d"] = sums["cost"] - sums["avg30"]
-    if "delta_prev" in metric_cols and {"mtd", "prev_mtd"} <= sums.keys():
-        totals["delta_prev"] = sums["mtd"] - sums["prev_mtd"]
-    if "delta_prev2" in metric_cols and {"mtd", "prev2_mtd"} <= sums.keys():
-        totals["delta_prev2"] = sums["prev_mtd"] - sums["prev2_mtd"]
-    if "delta_prev3" in metric_cols and {"mtd", "prev3_mtd"} <= sums.keys():
-        totals["delta_prev3"] = sums["prev2_mtd"] - sums["prev3_mtd"]
-    if "delta_prev4" in metric_cols and {"mtd", "prev4_mtd"} <= sums.keys():
-        totals["delta_prev4"] = sums["prev3_mtd"] - sums["prev4_mtd"]
-    if "delta_prev5" in metric_cols and {"mtd", "prev5_mtd"} <= sums.keys():
-        totals["delta_prev5"] = sums["prev4_mtd"] - sums["prev5_mtd"]
-    if "delta_avg6" in metric_cols and {"mtd", "avg6"} <= sums.keys():
-        totals["delta_avg6"] = sums["mtd"] - sums["avg6"]
-    if "delta_avg12" in metric_cols and {"mtd", "avg12"} <= sums.keys():
-        totals["delta_avg12"] = sums["mtd"] - sums["avg12"]
-
     if "pct_7d" in metric_cols and {"cost", "avg7"} <= sums.keys():
         totals["pct_7d"] = safe_div(sums["cost"] - sums["avg7"], sums["avg7"])
     if "pct_week" in metric_cols and {"cost", "prev_week"} <= sums.keys():
         totals["pct_week"] = safe_div(
             sums["cost"] - sums["prev_week"], sums["prev_week"]
         )
-    if "pct_prev" in metric_cols and {"mtd", "prev_mtd"} <= sums.keys():
-        totals["pct_prev"] = safe_div(sums["mtd"] - sums["prev_mtd"], sums["prev_mtd"])
-    if "pct_prev2" in metric_cols and {"mtd", "prev2_mtd"} <= sums.keys():
-        totals["pct_prev2"] = safe_div(
-            sums["prev_mtd"] - sums["prev2_mtd"], sums["prev2_mtd"]
-        )
-    if "pct_prev3" in metric_cols and {"mtd", "prev3_mtd"} <= sums.keys():
-        totals["pct_prev3"] = safe_div(
-            sums["prev2_mtd"] - sums["prev3_mtd"], sums["prev3_mtd"]
-        )
-    if "pct_prev4" in metric_cols and {"mtd", "prev4_mtd"} <= sums.keys():
-        totals["pct_prev4"] = safe_div(
-            sums["prev3_mtd"] - sums["prev4_mtd"], sums["prev4_mtd"]
-        )
-    if "pct_prev5" in metric_cols and {"mtd", "prev5_mtd"} <= sums.keys():
-        totals["pct_prev5"] = safe_div(
-            sums["prev4_mtd"] - sums["prev5_mtd"], sums["prev5_mtd"]
-        )
-    if "pct_avg6" in metric_cols and {"mtd", "avg6"} <= sums.keys():
-        totals["pct_avg6"] = safe_div(sums["mtd"] - sums["avg6"], sums["avg6"])
-    if "pct_avg12" in metric_cols and {"mtd", "avg12"} <= sums.keys():
-        totals["pct_avg12"] = safe_div(sums["mtd"] - sums["avg12"], sums["avg12"])
+    for _metric, delta_col, pct_col, value, reference in SERVICES_METRIC_DEFS:
+        if not {value, reference} <= sums.keys():
+            continue
+        if delta_col in metric_cols:
+            totals[delta_col] = sums[value] - sums[reference]
+        if pct_col in metric_cols:
+            totals[pct_col] = safe_div(sums[value] - sums[reference], sums[reference])
 
     return pd.Series(totals)
 
@@ -238,3 +225,56 @@ def build_account_matrix(
 
     totals = build_total_series(account_df, metric_cols)
     return service_rows, service_order, totals
+
+
+def build_default_comparison_ranges(anchor_date):
+    anchor_ts = pd.to_datetime(anchor_date, errors="coerce")
+    if pd.isna(anchor_ts):
+        anchor_ts = pd.Timestamp.today().normalize()
+    current_start = anchor_ts.to_period("M").to_timestamp()
+    reference_start = current_start - pd.DateOffset(months=1)
+    reference_end = anchor_ts - pd.DateOffset(months=1)
+    return (
+        (current_start.date(), anchor_ts.date()),
+        (reference_start.date(), reference_end.date()),
+    )
+
+
+def normalize_date_range(value):
+    # st.date_input restituisce un solo estremo finche' l'intervallo non e' completo.
+    if not isinstance(value, (list, tuple)) or len(value) != 2:
+        return None
+    start, end = value
+    return (start, end) if start <= end else (end, start)
+
+
+def format_date_range(date_range) -> str:
+    start, end = date_range
+    return f"{start:%d/%m/%Y} - {end:%d/%m/%Y}"
+
+
+def build_range_comparison_matrix(
+    comparison_df: pd.DataFrame,
+) -> tuple[pd.DataFrame, list[str], pd.Series]:
+    if comparison_df.empty:
+        return (
+            pd.DataFrame(index=pd.Index([], name="service")),
+            [],
+            pd.Series(dtype="object"),
+        )
+
+    service_rows = comparison_df.set_index("service")
+    service_order = (
+        service_rows["current_amount"].sort_values(ascending=False).index.tolist()
+    )
+    current_total = comparison_df["current_amount"].sum()
+    reference_total = comparison_df["reference_amount"].sum()
+    totals = pd.Series(
+        {
+            "current_amount": current_total,
+            "reference_amount": reference_total,
+            "delta": current_total - reference_total,
+            "pct": safe_div(current_total - reference_total, reference_total),
+        }
+    )
+    return service_rows, service_order, totals
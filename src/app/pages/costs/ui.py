@@ -8,10 +8,15 @@ try:
     from app.page_shared import get_db_cache_buster, get_db_path
     from app.pages.costs.css import inject_styles
     from app.pages.costs.logic import (
+        AVERAGE_METRICS,
+        MONTH_METRICS,
         ROW_DEFS,
         build_row_labels,
         build_account_matrix,
+        build_default_comparison_ranges,
         build_period_options,
+        build_range_comparison_matrix,
+        format_date_range,
         get_accounts,
         get_metric_cols,
         is_valid_table_name,
@@ -19,7 +24,9 @@ try:
         load_data,
         load_data_for_anchor,
         load_data_for_month,
+        load_range_comparison,
         normalize_costs_dataframe,
+        normalize_date_range,
         normalize_month_anchors,
         period_label,
     )
@@ -27,10 +34,15 @@ except ModuleNotFoundError:
     from page_shared import get_db_cache_buster, get_db_path
     from pages.costs.css import inject_styles
     from pages.costs.logic import (
+        AVERAGE_METRICS,
+        MONTH_METRICS,
         ROW_DEFS,
         build_row_labels,
         build_account_matrix,
+        build_default_comparison_ranges,
         build_period_options,
+        build_range_comparison_matrix,
+        format_date_range,
         get_accounts,
         get_metric_cols,
         is_valid_table_name,
@@ -38,7 +50,9 @@ except ModuleNotFoundError:
         load_data,
         load_data_for_anchor,
         load_data_for_month,
+        load_range_comparison,
         normalize_costs_dataframe,
+        normalize_date_range,
         normalize_month_anchors,
         period_label,
     )
@@ -434,11 +448,11 @@ def render_page(db_name: str, table_name: str) -> None:
             if metric == "mtd":
                 row_classes.append("row-current")
                 row_classes.append("row-white")
-            if metric in {"prev_mtd", "prev2_mtd", "prev3_mtd", "prev4_mtd"}:
+            if metric in MONTH_METRICS[1:]:
                 row_classes.append("row-highlight row-grey")
-            if metric in {"prev2_mtd", "prev4_mtd"}:
+            if metric in MONTH_METRICS[2::2]:
                 row_classes.append("row-grey")
-            if metric in {"avg6", "avg12"}:
+            if metric in AVERAGE_METRICS:
                 row_classes.append("row-white")
             row_class = f' class="{" ".join(row_classes)}"' if row_classes else ""
             row_cells = [
@@ -468,4 +482,96 @@ def render_page(db_name: str, table_name: str) -> None:
             "</div>"
         )
         st.markdown(table_html, unsafe_allow_html=True)
+
+        latest_anchor_date = (
+            account_months.iloc[0]["anchor_date"] if not account_months.empty else None
+        )
+        with st.expander("Confronto periodi personalizzati"):
+            default_current, default_reference = build_default_comparison_ranges(
+                latest_anchor_date
+            )
+            range_left, range_right = st.columns([1, 1])
+            with range_left:
+                current_range = normalize_date_range(
+                    st.date_input(
+                        "Periodo",
+                        value=default_current,
+                        format="DD/MM/YYYY",
+                        key=f"range-current-{account}",
+                    )
+                )
+            with range_right:
+                reference_range = normalize_date_range(
+                    st.date_input(
+                        "Confronto con",
+                        value=default_reference,
+                        format="DD/MM/YYYY",
+                        key=f"range-reference-{account}",
+                    )
+                )
+
+            if current_range is None or reference_range is None:
+                st.info("Seleziona data di inizio e fine per entrambi i periodi.")
+            else:
+                comparison_df = load_range_comparison(
+                    db_name,
+                    table_name,
+                    current_range[0].isoformat(),
+                    current_range[1].isoformat(),
+                    reference_range[0].isoformat(),
+                    reference_range[1].isoformat(),
+                    db_cache_buster,
+                )
+                comparison_df = apply_tax_filter(
+                    comparison_df[comparison_df["account"] == account],
+                    selected_tax_mode,
+                )
+                comparison_rows, comparison_services, comparison_totals = (
+                    build_range_comparison_matrix(comparison_df)
+                )
+                comparison_header = [
+                    '<th class="metric-col">Metric</th>',
+                    '<th class="total-col">Total</th>',
+                ] + [
+                    f"<th>{html.escape(service)}</th>"
+                    for service in comparison_services
+                ]
+                comparison_body = []
+                for date_range, value_col, with_delta in (
+                    (current_range, "current_amount", True),
+                    (reference_range, "reference_amount", False),
+                ):
+                    row_cells = [
+                        f'<th class="metric-col">{html.escape(format_date_range(date_range))}</th>',
+                        '<td class="total-col">'
+                        + format_cell(
+                            comparison_totals.get(value_col),
+                            comparison_totals.get("delta") if with_delta else None,
+                            comparison_totals.get("pct") if with_delta else None,
+                        )
+                        + "</td>",
+                    ]
+                    for service in comparison_services:
+                        row = comparison_rows.loc[service]
+                        cell = format_cell(
+                            row.get(value_col),
+                            row.get("delta") if with_delta else None,
+                            row.get("pct") if with_delta else None,
+                        )
+                        row_cells.append(f"<td>{cell}</td>")
+                    row_class = ' class="row-current row-white"' if with_delta else ""
+                    comparison_body.append(f"<tr{row_class}>{''.join(row_cells)}</tr>")
+
+                st.markdown(
+                    (
+                        '<div class="table-wrap">'
+                        '<table class="costs-table">'
+                        f"<thead><tr>{''.join(comparison_header)}</tr></thead>"
+                        f"<tbody>{''.join(comparison_body)}</tbody>"
+                        "</table>"
+                        "</div>"
+                    ),
+                    unsafe_allow_html=True,
+                )
+
         st.markdown('<div class="account-sep"></div>', unsafe_allow_html=True)
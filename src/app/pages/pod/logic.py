@@ -1,14 +1,11 @@
 from dataclasses import dataclass
 
 import pandas as pd
-import streamlit as st
-
-from duckdb_client import get_duckdb_client
 
 try:
-    from app.page_shared import safe_div
+    from app.page_shared import cache_arrow_data, open_read_only_client, safe_div
 except ModuleNotFoundError:
-    from page_shared import safe_div
+    from page_shared import cache_arrow_data, open_read_only_client, safe_div
 
 
 POD_METRIC_COLUMNS = {
@@ -46,26 +43,20 @@ class PodTableState:
     last_30_days: PodWindowRow | None
 
 
-@st.cache_data(show_spinner=False)
+@cache_arrow_data(date_as_object=False)
 def load_monthly_data(
     db_name: str, table_name: str, months: int = 12, _db_cache_buster: int = 0
 ):
-    client = get_duckdb_client(db_name)
-    try:
-        return client.get_pod_monthly_trend(table_name, months=months)
-    finally:
-        client.close()
+    with open_read_only_client(db_name) as client:
+        return client.get_pod_monthly_trend(table_name, months=months, as_arrow=True)
 
 
-@st.cache_data(show_spinner=False)
+@cache_arrow_data(date_as_object=False)
 def load_daily_data(
     db_name: str, table_name: str, days: int = 60, _db_cache_buster: int = 0
 ):
-    client = get_duckdb_client(db_name)
-    try:
-        return client.get_pod_daily_trend(table_name, days=days)
-    finally:
-        client.close()
+    with open_read_only_client(db_name) as client:
+        return client.get_pod_daily_trend(table_name, days=days, as_arrow=True)
 
 
 def _resolve_metric_column(metric: str) -> str:
@@ -75,15 +66,26 @@ def _resolve_metric_column(metric: str) -> str:
         raise ValueError(f"Metrica pod non supportata: {metric}") from exc
 
 
-def _normalize_monthly_df(pod_monthly_df: pd.DataFrame) -> pd.DataFrame:
-    pod_monthly_df = pod_monthly_df.copy()
-    pod_monthly_df["month_start"] = pd.to_datetime(
-        pod_monthly_df["month_start"], errors="coerce"
-    ).dt.to_period("M").dt.to_timestamp()
+def _normalize_numeric_columns(pod_df: pd.DataFrame) -> dict[str, pd.Series]:
+    updates = {}
     for column in ("total_pods", "onboarded_pods"):
-        if column not in pod_monthly_df.columns:
-            pod_monthly_df[column] = pd.NA
-        pod_monthly_df[column] = pd.to_numeric(pod_monthly_df[column], errors="coerce")
+        if column not in pod_df.columns:
+            updates[column] = float("nan")
+        elif not pd.api.types.is_numeric_dtype(pod_df[column]):
+            updates[column] = pd.to_numeric(pod_df[column], errors="coerce")
+    return updates
+
+
+def _normalize_monthly_df(pod_monthly_df: pd.DataFrame) -> pd.DataFrame:
+    # Dal loader Arrow le colonne hanno gia' il tipo giusto: si converte (e si
+    # copia) solo cio' che non lo ha.
+    updates = _normalize_numeric_columns(pod_monthly_df)
+    if not pd.api.types.is_datetime64_any_dtype(pod_monthly_df["month_start"]):
+        updates["month_start"] = pd.to_datetime(
+            pod_monthly_df["month_start"], errors="coerce"
+        ).dt.to_period("M").dt.to_timestamp()
+    if updates:
+        pod_monthly_df = pod_monthly_df.assign(**updates)
     return pod_monthly_df.dropna(subset=["month_start", "tenant", "total_pods"])
 
 
@@ -93,14 +95,13 @@ def _normalize_daily_df(pod_daily_df: pd.DataFrame) -> pd.DataFrame:
             columns=["date", "tenant", "total_pods", "onboarded_pods"]
         )
 
-    pod_daily_df = pod_daily_df.copy()
-    pod_daily_df["date"] = pd.to_datetime(
-        pod_daily_df["date"], errors="coerce"
-    ).dt.normalize()
-    for column in ("total_pods", "onboarded_pods"):
-        if column not in pod_daily_df.columns:
-            pod_daily_df[column] = pd.NA
-        pod_daily_df[column] = pd.to_numeric(pod_daily_df[column], errors="coerce")
+    updates = _normalize_numeric_columns(pod_daily_df)
+    if not pd.api.types.is_datetime64_any_dtype(pod_daily_df["date"]):
+        updates["date"] = pd.to_datetime(
+            pod_daily_df["date"], errors="coerce"
+        ).dt.normalize()
+    if updates:
+        pod_daily_df = pod_daily_df.assign(**updates)
     return pod_daily_df.dropna(subset=["date", "tenant", "total_pods"])
 
 
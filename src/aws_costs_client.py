@@ -13,14 +13,18 @@ class AwsCostsClient:
     def __init__(self, account):
         self.account = account
         self.expiration = 0
+        # Con gli shard ogni account crea i client in un thread diverso: la
+        # sessione di default di boto3 non e' thread-safe, quindi ogni client
+        # ha la sua.
+        self.session = boto3.session.Session()
         role_arn = roles_arn_map[account]["costs"]
-        self.client = boto3.client("ce", **self.assume_role(role_arn))
+        self.client = self.session.client("ce", **self.assume_role(role_arn))
 
     def role_is_expired(self):
         return datetime.now(timezone.utc) >= self.expiration
 
     def assume_role(self, role_arn, session_name="CollectorSession"):
-        sts_client = boto3.client("sts")
+        sts_client = self.session.client("sts")
         resp = sts_client.assume_role(RoleArn=role_arn, RoleSessionName=session_name)
         creds = resp["Credentials"]
         self.expiration = creds["Expiration"]
@@ -34,7 +38,7 @@ class AwsCostsClient:
     def refresh_connection(self):
         if self.role_is_expired():
             role_arn = roles_arn_map[self.account]["costs"]
-            self.client = boto3.client("ce", **self.assume_role(role_arn))
+            self.client = self.session.client("ce", **self.assume_role(role_arn))
 
     def get_records(self, start, stop, format="dict"):
         self.refresh_connection()
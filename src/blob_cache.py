@@ -0,0 +1,141 @@
+import hashlib
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+from runtime_config import get_blob_cache_dir, get_blob_cache_max_bytes
+
+
+class BlobCache:
+    def __init__(self, root: Path, max_bytes: int):
+        self.root = Path(root).expanduser()
+        self.max_bytes = max_bytes
+
+    def entry_path(self, bucket: str, key: str, etag: str) -> Path:
+        digest = hashlib.sha256(f"{bucket}\0{key}\0{etag}".encode()).hexdigest()
+        return self.root / digest[:2] / digest
+
+    def read_bytes(
+        self, s3_client, bucket: str, key: str, head: dict | None = None
+    ) -> tuple[bytes, str | None]:
+        # Il chiamante puo' passare la HEAD gia' letta (es. per la versione
+        # dello snapshot) ed evitarne una seconda.
+        if head is None:
+            head = s3_client.head_object(Bucket=bucket, Key=key)
+        entry_path = self.entry_path(bucket, key, normalize_etag(head["ETag"]))
+        cached = self._read_entry(entry_path)
+        if cached is not None:
+            return cached, head.get("ContentEncoding")
+
+        response = s3_client.get_object(Bucket=bucket, Key=key)
+        raw_bytes = response["Body"].read()
+        if len(raw_bytes) <= self.max_bytes:
+            self._write_entry(
+                self.entry_path(bucket, key, normalize_etag(response["ETag"])),
+                raw_bytes,
+            )
+        return raw_bytes, response.get("ContentEncoding")
+
+    def download_file(self, s3_client, bucket: str, key: str, destination: Path) -> Path:
+        destination = Path(destination)
+        head = s3_client.head_object(Bucket=bucket, Key=key)
+        if head.get("ContentLength", 0) > self.max_bytes:
+            s3_client.download_file(bucket, key, str(destination))
+            return destination
+
+        entry_path = self.entry_path(bucket, key, normalize_etag(head["ETag"]))
+        if self._copy_entry(entry_path, destination):
+            return destination
+
+        s3_client.download_file(bucket, key, str(destination))
+        self.store_file(entry_path, destination)
+        return destination
+
+    def store_file(self, entry_path: Path, source_path: Path) -> None:
+        if source_path.stat().st_size > self.max_bytes:
+            return
+        entry_path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_name = tempfile.mkstemp(dir=entry_path.parent, suffix=".tmp")
+        os.close(fd)
+        try:
+            shutil.copyfile(source_path, tmp_name)
+            os.replace(tmp_name, entry_path)
+        finally:
+            if os.path.exists(tmp_name):
+                os.unlink(tmp_name)
+        self.evict()
+
+    def store_uploaded_file(self, s3_client, bucket: str, key: str, source_path: Path) -> None:
+        head = s3_client.head_object(Bucket=bucket, Key=key)
+        self.store_file(
+            self.entry_path(bucket, key, normalize_etag(head["ETag"])), Path(source_path)
+        )
+
+    def evict(self) -> None:
+        entries = []
+        total_bytes = 0
+        for entry_path in self.root.glob("*/*"):
+            if entry_path.suffix == ".tmp":
+                continue
+            try:
+                stat = entry_path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, entry_path))
+            total_bytes += stat.st_size
+
+        for _mtime, size, entry_path in sorted(entries):
+            if total_bytes <= self.max_bytes:
+                break
+            try:
+                entry_path.unlink()
+            except FileNotFoundError:
+                pass
+            total_bytes -= size
+
+    def _read_entry(self, entry_path: Path) -> bytes | None:
+        try:
+            raw_bytes = entry_path.read_bytes()
+        except FileNotFoundError:
+            return None
+        self._touch(entry_path)
+        return raw_bytes
+
+    def _copy_entry(self, entry_path: Path, destination: Path) -> bool:
+        try:
+            shutil.copyfile(entry_path, destination)
+        except FileNotFoundError:
+            return False
+        self._touch(entry_path)
+        return True
+
+    def _write_entry(self, entry_path: Path, raw_bytes: bytes) -> None:
+        entry_path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_name = tempfile.mkstemp(dir=entry_path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as file_handle:
+                file_handle.write(raw_bytes)
+            os.replace(tmp_name, entry_path)
+        finally:
+            if os.path.exists(tmp_name):
+                os.unlink(tmp_name)
+        self.evict()
+
+    @staticmethod
+    def _touch(entry_path: Path) -> None:
+        try:
+            os.utime(entry_path)
+        except FileNotFoundError:
+            pass
+
+
+def normalize_etag(etag: str) -> str:
+    return etag.strip().strip('"')
+
+
+def get_blob_cache() -> BlobCache | None:
+    max_bytes = get_blob_cache_max_bytes()
+    if max_bytes <= 0:
+        return None
+    return BlobCache(get_blob_cache_dir(), max_bytes)
@@ -1,9 +1,25 @@
 import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 from datetime import datetime, timedelta, UTC
-from duckdb_client import get_duckdb_client
+from db_artifact import delete_cold_files, upload_cold_files
+from db_compaction import remove_db_file
+from duckdb_client import (
+    COSTS_VIEW_NAME,
+    DuckDBClient,
+    get_costs_prefix_table_name,
+    get_costs_rollup_table_name,
+    get_duckdb_client,
+)
 from aws_costs_client import get_aws_costs_client
-from utils import accounts_map
+from migrations import Migration, add_column, cluster_table, run_migrations
+from runtime_config import (
+    get_cold_storage_dir,
+    get_costs_shard_workers,
+    get_shard_dir,
+)
+from utils import accounts_map, service_map
 
 load_dotenv()
 # AWS_ROLE_ARN_COSTS_DIGIWATT = os.environ["AWS_ROLE_ARN_COSTS_DIGIWATT"]
@@ -15,7 +31,32 @@ load_dotenv()
 # REGION = "eu-central-1"
 DUCKDB_DATABASE = os.environ.get("DUCKDB_DATABASE", "database.duckdb")
 TABLE_NAME = "aws_costs"
+COSTS_ROLLUP_TABLE_NAME = get_costs_rollup_table_name(COSTS_VIEW_NAME)
+COSTS_PREFIX_TABLE_NAME = get_costs_prefix_table_name(COSTS_VIEW_NAME)
 COSTS_BACKFILL_MONTHS = int(os.environ.get("COSTS_BACKFILL_MONTHS", "12"))
+COSTS_MIGRATION_SCOPE = "costs"
+COSTS_MIGRATIONS = [
+    Migration(
+        1,
+        "cluster aws_costs by account, date",
+        cluster_table(TABLE_NAME, "account, date"),
+    ),
+    Migration(
+        2,
+        "cluster costs_rollup by account, month_start",
+        cluster_table(COSTS_ROLLUP_TABLE_NAME, "account, month_start, service, day"),
+    ),
+    Migration(
+        3,
+        "cluster costs_prefix by account, service, date",
+        cluster_table(COSTS_PREFIX_TABLE_NAME, "account, service, date"),
+    ),
+    Migration(
+        4,
+        "add aws_costs.service_label",
+        add_column(TABLE_NAME, "service_label", "VARCHAR"),
+    ),
+]
 
 # Intervallo dei dati: ultimi 7 giorni
 # END_DATE = datetime.now(UTC).date()
@@ -29,21 +70,162 @@ def shift_month_start(value, months_delta: int):
     return value.replace(year=year, month=month_zero_based + 1, day=1)
 
 
+def label_cost_rows(rows: list[tuple]) -> list[tuple]:
+    # (date, account, service, amount) + etichetta risolta da service_map.
+    return [(*row, service_map.get(row[2], row[2])) for row in rows]
+
+
+def refresh_relabeled_costs(duckdb) -> None:
+    # Dopo un cambio di service_map rollup e somme cumulate vengono riscritti
+    # prima nel tier freddo (e su S3), poi dalla prima data del tier caldo di
+    # ogni account, ripartendo dai cumulati freddi gia' rietichettati.
+    written_files, removed_files = duckdb.rewrite_cold_costs_derivatives(
+        COSTS_ROLLUP_TABLE_NAME, COSTS_PREFIX_TABLE_NAME
+    )
+    cold_dir = get_cold_storage_dir(duckdb.db_path)
+    upload_cold_files(cold_dir, written_files)
+    delete_cold_files(cold_dir, removed_files)
+
+    hot_ranges = duckdb.execute(
+        f"SELECT account, MIN(date) AS min_date FROM {TABLE_NAME} GROUP BY account"
+    )
+    for account, min_date in zip(hot_ranges["account"], hot_ranges["min_date"]):
+        from_date = min_date.date()
+        duckdb.refresh_costs_rollup(
+            COSTS_ROLLUP_TABLE_NAME,
+            COSTS_VIEW_NAME,
+            account,
+            from_date.replace(day=1),
+        )
+        duckdb.refresh_costs_prefix(
+            COSTS_PREFIX_TABLE_NAME, COSTS_VIEW_NAME, account, from_date
+        )
+
+
+def fetch_account_costs(account, start, stop) -> list[tuple]:
+    costs_client = get_aws_costs_client(account)
+    return label_cost_rows(costs_client.get_records(start, stop, format="tuple"))
+
+
+def publish_account_costs(
+    duckdb,
+    account,
+    source_table,
+    start,
+    rebuild_rollup: bool,
+    rebuild_prefix: bool,
+    drop_staging: bool = True,
+) -> None:
+    # Il load dell'account e' pubblicato in una sola transazione insieme al
+    # catalogo, al rollup e alle somme cumulate dei giorni toccati
+    # (riscritti da start in poi).
+    with duckdb.transaction():
+        duckdb.publish_staged_rows(
+            TABLE_NAME, source_table, drop_staging=drop_staging
+        )
+        duckdb.refresh_catalog(
+            COSTS_VIEW_NAME,
+            "account",
+            "date",
+            partition=account,
+            from_date=start,
+        )
+        if not rebuild_rollup:
+            duckdb.refresh_costs_rollup(
+                COSTS_ROLLUP_TABLE_NAME,
+                COSTS_VIEW_NAME,
+                account,
+                start.replace(day=1),
+            )
+        if not rebuild_prefix:
+            duckdb.refresh_costs_prefix(
+                COSTS_PREFIX_TABLE_NAME, COSTS_VIEW_NAME, account, start
+            )
+
+
+def write_account_shard(shard_path, account, start, stop):
+    costs = fetch_account_costs(account, start, stop)
+    shard = DuckDBClient(shard_path)
+    try:
+        shard.create_table(TABLE_NAME)
+        shard.execute(f"DELETE FROM {TABLE_NAME}")
+        shard.insert_many(TABLE_NAME, costs)
+        shard.checkpoint()
+    finally:
+        shard.close()
+    return shard_path
+
+
+def load_costs_sharded(
+    duckdb, ranges, rebuild_rollup: bool, rebuild_prefix: bool, workers: int
+) -> None:
+    # Ogni account scrive in parallelo su un proprio file DuckDB; il merge
+    # nel DB principale (un solo writer) e' un INSERT ... SELECT per shard
+    # dal file in ATTACH, nell'ordine degli account.
+    shard_dir = get_shard_dir(duckdb.db_path)
+    shard_dir.mkdir(parents=True, exist_ok=True)
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                account: executor.submit(
+                    write_account_shard,
+                    shard_dir / f"{account}.duckdb",
+                    account,
+                    start,
+                    stop,
+                )
+                for account, (start, stop) in ranges.items()
+            }
+            for account, future in futures.items():
+                shard_path = future.result()
+                with duckdb.attached(shard_path, "costs_shard"):
+                    publish_account_costs(
+                        duckdb,
+                        account,
+                        f"costs_shard.{TABLE_NAME}",
+                        ranges[account][0],
+                        rebuild_rollup,
+                        rebuild_prefix,
+                        drop_staging=False,
+                    )
+                remove_db_file(shard_path)
+    finally:
+        shutil.rmtree(shard_dir, ignore_errors=True)
+
+
 def main() -> None:
     duckdb = get_duckdb_client(DUCKDB_DATABASE)
     try:
         duckdb.create_table(TABLE_NAME)
-        duckdb.create_service_map()
+        duckdb.create_costs_rollup_table(COSTS_ROLLUP_TABLE_NAME)
+        rollup_rows = duckdb.execute(
+            "SELECT COUNT(*) AS total_rows"
+            f" FROM {duckdb.get_tiered_source(COSTS_ROLLUP_TABLE_NAME, 'month_start')}"
+        )
+        rebuild_rollup = int(rollup_rows.iloc[0]["total_rows"]) == 0
+        duckdb.create_costs_prefix_table(COSTS_PREFIX_TABLE_NAME)
+        prefix_rows = duckdb.execute(
+            "SELECT COUNT(*) AS total_rows"
+            f" FROM {duckdb.get_tiered_source(COSTS_PREFIX_TABLE_NAME)}"
+        )
+        rebuild_prefix = int(prefix_rows.iloc[0]["total_rows"]) == 0
+        run_migrations(duckdb, COSTS_MIGRATION_SCOPE, COSTS_MIGRATIONS)
         duckdb.create_costs_view()
+        with duckdb.transaction():
+            if duckdb.sync_service_map():
+                print("Mapping servizi cambiato: etichette e derivati riscritti.")
+                refresh_relabeled_costs(duckdb)
+        duckdb.create_catalog_table()
+        duckdb.ensure_catalog(COSTS_VIEW_NAME, "account", "date")
 
         today = datetime.now(UTC).date()
         month_start = today.replace(day=1)
         query_end = today + timedelta(days=1)
         backfill_start = shift_month_start(month_start, -COSTS_BACKFILL_MONTHS)
 
+        ranges = {}
         for account in accounts_map.keys():
-            costs_client = get_aws_costs_client(account)
-            latest_date = duckdb.get_latest_date(TABLE_NAME, account=account)
+            latest_date = duckdb.get_latest_date(COSTS_VIEW_NAME, account=account)
             start_candidate = (
                 latest_date.date() - timedelta(days=1)
                 if latest_date
@@ -52,18 +234,29 @@ def main() -> None:
             start = min(start_candidate, month_start)
             stop = query_end
             print(account, start, stop)
-            costs = costs_client.get_records(start, stop, format="tuple")
-            duckdb.insert_many(TABLE_NAME, costs)
-
-        summary = duckdb.execute(
-            f"""
-            SELECT
-                COUNT(*) AS total_rows,
-                MIN(date) AS min_date,
-                MAX(date) AS max_date
-            FROM {TABLE_NAME}
-            """
-        )
+            ranges[account] = (start, stop)
+
+        shard_workers = get_costs_shard_workers()
+        if shard_workers:
+            load_costs_sharded(
+                duckdb, ranges, rebuild_rollup, rebuild_prefix, shard_workers
+            )
+        else:
+            for account, (start, stop) in ranges.items():
+                costs = fetch_account_costs(account, start, stop)
+                staging_table = duckdb.stage_rows(TABLE_NAME, costs)
+                publish_account_costs(
+                    duckdb, account, staging_table, start, rebuild_rollup, rebuild_prefix
+                )
+
+        # Al primo avvio (tabelle vuote) rollup e somme cumulate vengono
+        # ricostruiti da tutto lo storico.
+        if rebuild_rollup:
+            duckdb.rebuild_costs_rollup(COSTS_ROLLUP_TABLE_NAME, COSTS_VIEW_NAME)
+        if rebuild_prefix:
+            duckdb.rebuild_costs_prefix(COSTS_PREFIX_TABLE_NAME, COSTS_VIEW_NAME)
+
+        summary = duckdb.get_catalog_summary(COSTS_VIEW_NAME)
         duckdb.checkpoint()
         print(
             "Cost collector completato:"
@@ -3,7 +3,13 @@ from pathlib import Path
 import boto3
 from botocore.exceptions import ClientError
 
-from runtime_config import ensure_db_parent, get_aws_region, get_remote_db_uri
+from blob_cache import get_blob_cache
+from runtime_config import (
+    ensure_db_parent,
+    get_aws_region,
+    get_remote_cold_uri,
+    get_remote_db_uri,
+)
 
 
 MISSING_OBJECT_CODES = {"404", "NoSuchKey", "NotFound"}
@@ -13,6 +19,10 @@ def has_remote_db_artifact() -> bool:
     return get_remote_db_uri() is not None
 
 
+def has_remote_cold_tier() -> bool:
+    return get_remote_cold_uri() is not None
+
+
 def parse_s3_uri(uri: str) -> tuple[str, str]:
     if not uri.startswith("s3://"):
         raise ValueError(f"URI S3 non valido: {uri}")
@@ -50,8 +60,13 @@ def download_remote_db(
     bucket, key = parse_s3_uri(uri)
     tmp_path = db_path.with_suffix(f"{db_path.suffix}.download")
 
+    s3_client = get_s3_client()
+    blob_cache = get_blob_cache()
     try:
-        get_s3_client().download_file(bucket, key, str(tmp_path))
+        if blob_cache is None:
+            s3_client.download_file(bucket, key, str(tmp_path))
+        else:
+            blob_cache.download_file(s3_client, bucket, key, tmp_path)
     except ClientError as exc:
         error_code = exc.response.get("Error", {}).get("Code")
         if allow_missing and error_code in MISSING_OBJECT_CODES:
@@ -82,5 +97,75 @@ def upload_remote_db(
         raise FileNotFoundError(f"File DuckDB locale non trovato: {db_path}")
 
     bucket, key = parse_s3_uri(uri)
-    get_s3_client().upload_file(str(db_path), bucket, key)
+    s3_client = get_s3_client()
+    s3_client.upload_file(str(db_path), bucket, key)
+    blob_cache = get_blob_cache()
+    if blob_cache is not None:
+        blob_cache.store_uploaded_file(s3_client, bucket, key, db_path)
     return db_path
+
+
+def upload_cold_files(cold_dir: Path, paths: list[Path]) -> list[str]:
+    uri = get_remote_cold_uri()
+    if uri is None:
+        return []
+
+    bucket, prefix = parse_s3_uri(uri)
+    s3_client = get_s3_client()
+    uploaded_keys = []
+    for path in paths:
+        key = f"{prefix}/{Path(path).relative_to(cold_dir).as_posix()}"
+        s3_client.upload_file(str(path), bucket, key)
+        uploaded_keys.append(key)
+    return uploaded_keys
+
+
+def delete_cold_files(cold_dir: Path, paths: list[Path]) -> list[str]:
+    uri = get_remote_cold_uri()
+    if uri is None or not paths:
+        return []
+
+    bucket, prefix = parse_s3_uri(uri)
+    s3_client = get_s3_client()
+    deleted_keys = []
+    for path in paths:
+        key = f"{prefix}/{Path(path).relative_to(cold_dir).as_posix()}"
+        s3_client.delete_object(Bucket=bucket, Key=key)
+        deleted_keys.append(key)
+    return deleted_keys
+
+
+def download_cold_tier(cold_dir: Path) -> list[Path]:
+    # Una partizione riscritta mantiene il nome dei file: si scaricano quelli
+    # assenti in locale, con dimensione diversa o piu' recenti in remoto. Nelle
+    # partizioni presenti in remoto i file locali che non esistono piu' in
+    # remoto (partizioni riscritte altrove) vengono rimossi.
+    uri = get_remote_cold_uri()
+    if uri is None:
+        return []
+
+    bucket, prefix = parse_s3_uri(uri)
+    s3_client = get_s3_client()
+    downloaded = []
+    remote_paths = set()
+    paginator = s3_client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket, Prefix=f"{prefix}/"):
+        for item in page.get("Contents", []):
+            local_path = Path(cold_dir) / item["Key"][len(prefix) + 1 :]
+            remote_paths.add(local_path)
+            if (
+                local_path.exists()
+                and local_path.stat().st_size == item["Size"]
+                and local_path.stat().st_mtime >= item["LastModified"].timestamp()
+            ):
+                continue
+            local_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = local_path.with_suffix(f"{local_path.suffix}.download")
+            s3_client.download_file(bucket, item["Key"], str(tmp_path))
+            tmp_path.replace(local_path)
+            downloaded.append(local_path)
+    remote_partitions = {path.parent for path in remote_paths}
+    for local_path in Path(cold_dir).glob("*/*/*/*/*.parquet"):
+        if local_path.parent in remote_partitions and local_path not in remote_paths:
+            local_path.unlink()
+    return downloaded
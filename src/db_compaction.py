@@ -0,0 +1,62 @@
+from pathlib import Path
+
+import duckdb
+
+from runtime_config import (
+    DUCKDB_PROFILE_MAINTENANCE,
+    get_compact_storage_version,
+    get_duckdb_config,
+)
+
+
+def get_db_file_size(db_path: Path) -> int:
+    wal_path = db_path.with_name(f"{db_path.name}.wal")
+    return sum(path.stat().st_size for path in (db_path, wal_path) if path.exists())
+
+
+def build_compact_db_path(db_path: Path) -> Path:
+    return db_path.with_name(f"{db_path.stem}.compact{db_path.suffix}")
+
+
+def remove_db_file(db_path: Path) -> None:
+    for path in (db_path, db_path.with_name(f"{db_path.name}.wal")):
+        if path.exists():
+            path.unlink()
+
+
+def compact_db_file(db_path: Path) -> tuple[int, int]:
+    # Riscrive tabelle, viste e vincoli in un file nuovo: niente blocchi
+    # liberi lasciati da DELETE/INSERT OR REPLACE e row group compressi da
+    # zero. Il file originale viene sostituito con un rename atomico.
+    db_path = Path(db_path)
+    if not db_path.exists():
+        raise FileNotFoundError(f"File DuckDB non trovato: {db_path}")
+
+    compact_path = build_compact_db_path(db_path)
+    remove_db_file(compact_path)
+    storage_version = get_compact_storage_version()
+    target_options = (
+        f" (STORAGE_VERSION '{storage_version}')" if storage_version else ""
+    )
+    size_before = get_db_file_size(db_path)
+
+    connection = duckdb.connect(
+        config=get_duckdb_config(DUCKDB_PROFILE_MAINTENANCE)
+    )
+    try:
+        connection.execute(f"ATTACH '{db_path}' AS source (READ_ONLY)")
+        connection.execute(f"ATTACH '{compact_path}' AS target{target_options}")
+        connection.execute("COPY FROM DATABASE source TO target")
+        connection.execute("DETACH target")
+        connection.execute("DETACH source")
+    except BaseException:
+        connection.close()
+        remove_db_file(compact_path)
+        raise
+    connection.close()
+
+    compact_path.replace(db_path)
+    wal_path = db_path.with_name(f"{db_path.name}.wal")
+    if wal_path.exists():
+        wal_path.unlink()
+    return size_before, get_db_file_size(db_path)
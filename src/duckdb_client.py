@@ -1,13 +1,66 @@
+import hashlib
+import json
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
 import duckdb
 import pandas as pd
+from db_compaction import get_db_file_size
 from utils import service_map
-from runtime_config import ensure_db_parent
+from query_stats import (
+    QUERY_RECORDER,
+    build_query_stat,
+    flush_sidecar_query_log,
+    infer_query_tag,
+    write_query_log,
+)
+from runtime_config import (
+    ensure_db_parent,
+    get_cold_storage_dir,
+    get_costs_average_windows,
+    get_costs_lookback_months,
+    get_duckdb_config,
+    get_in_memory_max_bytes,
+    get_query_log_flush_seconds,
+    get_query_profile_threshold_ms,
+    is_in_memory_db_enabled,
+    is_query_log_enabled,
+)
+
+
+COLD_PARTITION_GLOB = "*/*/*/*.parquet"
+CATALOG_TABLE_NAME = "data_catalog"
+COSTS_VIEW_NAME = "costs"
+SERVICE_MAP_VERSION_TABLE_NAME = "service_map_version"
+
+
+def build_service_map_hash(mapping):
+    payload = json.dumps(sorted(mapping.items()), ensure_ascii=False)
+    return hashlib.sha256(payload.encode()).hexdigest()
 
 
 class DuckDBClient:
-    def __init__(self, database):
+    def __init__(self, database, connection=None):
         self.db_path = ensure_db_parent(database)
-        self.conn = duckdb.connect(str(self.db_path))
+        # Le connessioni scrivibili del client salvano su query_log nel DB; i
+        # cursori del pool READ_ONLY accodano a QUERY_RECORDER, che il pool
+        # scarica sul file sidecar.
+        query_log_enabled = is_query_log_enabled()
+        self.query_log_enabled = connection is None and query_log_enabled
+        self.sidecar_log_enabled = connection is not None and query_log_enabled
+        if connection is None:
+            connection = duckdb.connect(
+                str(self.db_path), config=get_duckdb_config()
+            )
+        self.conn = connection
+        self.profile_threshold_ms = get_query_profile_threshold_ms()
+        self._pending_query_log = []
+        self._transaction_depth = 0
+        if self.profile_threshold_ms is not None:
+            self.conn.execute("SET enable_profiling = 'no_output'")
 
     def create_table(self, table_name):
         self.conn.execute(f"""
@@ -16,6 +69,7 @@ class DuckDBClient:
                 account VARCHAR,
                 service VARCHAR,
                 amount DOUBLE,
+                service_label VARCHAR,
                 UNIQUE(date, account, service)
             )
         """)
@@ -50,80 +104,965 @@ class DuckDBClient:
             )
         """)
 
+    def create_pod_daily_runs_table(self, table_name):
+        self.conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table_name} (
+                tenant VARCHAR,
+                source_backend VARCHAR,
+                valid_from DATE,
+                valid_to DATE,
+                total_pods BIGINT,
+                onboarded_pods BIGINT,
+                updated_at TIMESTAMP,
+                daily_delta BIGINT,
+                daily_onboarded_delta BIGINT,
+                UNIQUE(tenant, valid_from)
+            )
+        """)
+
+    def create_pod_daily_runs_view(self, view_name, runs_table_name):
+        # Espande i run (valori costanti tra valid_from e valid_to) nella serie
+        # giornaliera con lo stesso schema di pod_daily_trend. Il delta e'
+        # salvato sul run e vale solo nel suo primo giorno, quindi non serve
+        # una finestra sullo storico. La macro <vista>_from(start_date) espande
+        # solo i run che arrivano a start_date: le letture su pochi giorni non
+        # crescono con lo storico.
+        range_macro_name = get_pod_daily_range_macro_name(view_name)
+        self.conn.execute(f"""
+            CREATE OR REPLACE MACRO {range_macro_name}(start_date) AS TABLE
+            SELECT
+                date,
+                tenant,
+                source_backend,
+                CASE WHEN date = valid_from THEN daily_delta ELSE 0 END
+                    AS daily_delta,
+                total_pods,
+                CASE WHEN date = valid_from THEN daily_onboarded_delta ELSE 0 END
+                    AS daily_onboarded_delta,
+                onboarded_pods,
+                updated_at
+            FROM (
+                SELECT
+                    CAST(
+                        unnest(
+                            generate_series(
+                                GREATEST(valid_from, start_date),
+                                valid_to,
+                                INTERVAL 1 DAY
+                            )
+                        ) AS DATE
+                    ) AS date,
+                    *
+                FROM {runs_table_name}
+                WHERE valid_to >= start_date
+            )
+        """)
+        self.conn.execute(f"""
+            CREATE OR REPLACE VIEW {view_name} AS
+            SELECT * FROM {range_macro_name}(DATE '0001-01-01')
+        """)
+
+    def has_table_macro(self, name):
+        df = self.execute(
+            """
+            SELECT 1
+            FROM duckdb_functions()
+            WHERE function_name = ?
+              AND function_type = 'table_macro'
+              AND database_name = current_database()
+            LIMIT 1
+            """,
+            [name],
+        )
+        return not df.empty
+
+    def get_relation_type(self, name):
+        df = self.execute(
+            """
+            SELECT table_type
+            FROM information_schema.tables
+            WHERE table_name = ?
+              AND table_schema = 'main'
+              AND table_catalog = current_database()
+            """,
+            [name],
+        )
+        if df.empty:
+            return None
+        return df.iloc[0]["table_type"]
+
+    def create_pod_hourly_trend_table(self, table_name):
+        self.conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table_name} (
+                ts TIMESTAMP,
+                tenant VARCHAR,
+                source_backend VARCHAR,
+                total_pods BIGINT,
+                onboarded_pods BIGINT,
+                updated_at TIMESTAMP,
+                UNIQUE(ts, tenant)
+            )
+        """)
+
+    def create_pod_bootstrap_progress_table(self, table_name):
+        self.conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table_name} (
+                source_backend VARCHAR,
+                path VARCHAR,
+                status VARCHAR,
+                snapshot_rows BIGINT,
+                committed_at TIMESTAMP,
+                UNIQUE(source_backend, path)
+            )
+        """)
+
+    def create_pod_bootstrap_snapshot_table(self, table_name):
+        self.conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table_name} (
+                date DATE,
+                tenant VARCHAR,
+                source_backend VARCHAR,
+                pods BIGINT,
+                onboarded BIGINT,
+                path VARCHAR,
+                UNIQUE(date, tenant, source_backend)
+            )
+        """)
+
+    def create_pod_snapshot_hash_table(self, table_name):
+        self.conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table_name} (
+                source_backend VARCHAR,
+                date DATE,
+                content_hash VARCHAR,
+                updated_at TIMESTAMP,
+                UNIQUE(source_backend, date)
+            )
+        """)
+
+    def create_schema_version_table(self, table_name):
+        self.conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table_name} (
+                scope VARCHAR,
+                version INTEGER,
+                name VARCHAR,
+                applied_at TIMESTAMP,
+                UNIQUE(scope, version)
+            )
+        """)
+
+    def get_schema_versions(self, table_name, scope):
+        df = self.execute(
+            f"SELECT version FROM {table_name} WHERE scope = ?",
+            [scope],
+        )
+        return set(df["version"].astype(int).tolist())
+
+    def record_schema_version(self, table_name, scope, version, name, applied_at):
+        self.execute(
+            f"INSERT INTO {table_name} VALUES (?, ?, ?, ?)",
+            [scope, version, name, applied_at],
+        )
+
+    def rewrite_table_sorted(self, table_name, order_by):
+        # Riscrive la tabella nell'ordine dato mantenendo schema e vincoli: i
+        # row group risultanti hanno min/max stretti e le zone map scartano
+        # piu' blocchi nei filtri. Va eseguita dentro una transazione.
+        sorted_table = f"{table_name}__sorted"
+        self.execute(
+            f"CREATE OR REPLACE TEMP TABLE {sorted_table} AS SELECT * FROM {table_name}"
+        )
+        self.execute(f"DELETE FROM {table_name}")
+        self.execute(
+            f"INSERT INTO {table_name} SELECT * FROM {sorted_table} ORDER BY {order_by}"
+        )
+        self.execute(f"DROP TABLE {sorted_table}")
+
+    @contextmanager
+    def transaction(self):
+        # Le transazioni annidate confluiscono in quella esterna, cosi' un
+        # load pubblicato dentro un job piu' ampio viene committato con esso.
+        if self._transaction_depth:
+            self._transaction_depth += 1
+            try:
+                yield self
+            finally:
+                self._transaction_depth -= 1
+            return
+        self.conn.execute("BEGIN TRANSACTION")
+        self._transaction_depth = 1
+        try:
+            yield self
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        else:
+            self.conn.execute("COMMIT")
+        finally:
+            self._transaction_depth = 0
+
+    @contextmanager
+    def attached(self, db_path, alias, read_only=True):
+        options = " (READ_ONLY)" if read_only else ""
+        self.execute(f"ATTACH '{db_path}' AS {alias}{options}")
+        try:
+            yield alias
+        finally:
+            self.execute(f"DETACH {alias}")
+
     def execute(self, query, params=None):
+        started_at = time.perf_counter()
+        if params is None:
+            result = self.conn.execute(query).df()
+        else:
+            result = self.conn.execute(query, params).df()
+        self._record_query(query, started_at, result)
+        return result
+
+    def execute_arrow(self, query, params=None):
+        # Risultato colonnare senza passare da pandas: la vista DataFrame viene
+        # creata dal chiamante solo quando serve.
+        started_at = time.perf_counter()
         if params is None:
-            return self.conn.execute(query).df()
-        return self.conn.execute(query, params).df()
+            result = self.conn.execute(query).to_arrow_table()
+        else:
+            result = self.conn.execute(query, params).to_arrow_table()
+        self._record_query(query, started_at, result)
+        return result
+
+    def _record_query(self, query, started_at, result=None, row_count=None):
+        elapsed_ms = (time.perf_counter() - started_at) * 1000
+        plan = None
+        if (
+            self.profile_threshold_ms is not None
+            and elapsed_ms >= self.profile_threshold_ms
+        ):
+            plan = self.conn.get_profiling_information(format="json")
+        stat = build_query_stat(
+            infer_query_tag(__file__),
+            elapsed_ms,
+            result,
+            query,
+            plan=plan,
+            row_count=row_count,
+        )
+        if self.query_log_enabled:
+            self._pending_query_log.append(stat)
+        elif self.sidecar_log_enabled:
+            QUERY_RECORDER.record(stat)
+
+    def flush_query_log(self):
+        if not self._pending_query_log:
+            return
+        try:
+            write_query_log(self.conn, self._pending_query_log)
+        except duckdb.Error as exc:
+            print(f"Impossibile salvare query_log: {exc}")
+        self._pending_query_log = []
+
+    def _fetch(self, query, params=None, as_arrow=False):
+        if as_arrow:
+            return self.execute_arrow(query, params)
+        return self.execute(query, params)
+
+    def execute_many(self, query, values):
+        started_at = time.perf_counter()
+        self.conn.executemany(query, values)
+        self._record_query(query, started_at, row_count=len(values))
 
     def read_table(self, table_name, **kwargs):
         columns = kwargs.get("columns", "*")
         query = f"SELECT {columns} FROM {table_name}"
         return self.execute(query)
 
+    def create_catalog_table(self):
+        # Metadati per tabella, partizione (account per i costi, backend per
+        # i pod) e mese, aggiornati dai collector nella transazione del load.
+        self.conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {CATALOG_TABLE_NAME} (
+                table_name VARCHAR,
+                partition_key VARCHAR,
+                month_start DATE,
+                min_date DATE,
+                max_date DATE,
+                row_count BIGINT,
+                updated_at TIMESTAMP,
+                UNIQUE(table_name, partition_key, month_start)
+            )
+        """)
+
+    def refresh_catalog(
+        self,
+        table_name,
+        partition_column,
+        date_column,
+        partition=None,
+        from_date=None,
+    ):
+        catalog_filters = ["table_name = ?"]
+        catalog_params = [table_name]
+        source_filters = []
+        source_params = []
+        if partition is not None:
+            catalog_filters.append("partition_key = ?")
+            catalog_params.append(partition)
+            source_filters.append(f"{partition_column} = ?")
+            source_params.append(partition)
+        if from_date is not None:
+            from_month = "CAST(date_trunc('month', CAST(? AS DATE)) AS DATE)"
+            catalog_filters.append(f"month_start >= {from_month}")
+            catalog_params.append(from_date)
+            source_filters.append(f"{date_column} >= {from_month}")
+            source_params.append(from_date)
+        source_where = (
+            f"WHERE {' AND '.join(source_filters)}" if source_filters else ""
+        )
+        with self.transaction():
+            self.execute(
+                f"DELETE FROM {CATALOG_TABLE_NAME}"
+                f" WHERE {' AND '.join(catalog_filters)}",
+                catalog_params,
+            )
+            self.execute(
+                f"""
+                INSERT INTO {CATALOG_TABLE_NAME}
+                SELECT
+                    ? AS table_name,
+                    CAST({partition_column} AS VARCHAR) AS partition_key,
+                    CAST(date_trunc('month', {date_column}) AS DATE) AS month_start,
+                    CAST(MIN({date_column}) AS DATE) AS min_date,
+                    CAST(MAX({date_column}) AS DATE) AS max_date,
+                    COUNT(*) AS row_count,
+                    CAST(now() AS TIMESTAMP) AS updated_at
+                FROM {self.get_tiered_source(table_name)}
+                {source_where}
+                GROUP BY ALL
+                """,
+                [table_name, *source_params],
+            )
+
+    def has_catalog_entries(self, table_name):
+        if self.get_relation_type(CATALOG_TABLE_NAME) is None:
+            return False
+        df = self.execute(
+            f"SELECT 1 FROM {CATALOG_TABLE_NAME} WHERE table_name = ? LIMIT 1",
+            [table_name],
+        )
+        return not df.empty
+
+    def ensure_catalog(self, table_name, partition_column, date_column):
+        # DB esistenti o tabelle ancora vuote: il catalogo viene ricostruito
+        # con una scansione completa, poi resta aggiornato dai load.
+        if not self.has_catalog_entries(table_name):
+            self.refresh_catalog(table_name, partition_column, date_column)
+
+    def get_catalog_summary(self, table_name):
+        return self.execute(
+            f"""
+            SELECT
+                COALESCE(SUM(row_count), 0) AS total_rows,
+                MIN(min_date) AS min_date,
+                MAX(max_date) AS max_date
+            FROM {CATALOG_TABLE_NAME}
+            WHERE table_name = ?
+            """,
+            [table_name],
+        )
+
+    def _get_catalog_latest_date(self, table_name, partition=None):
+        if not self.has_catalog_entries(table_name):
+            return False, None
+        if partition is None:
+            df = self.execute(
+                f"SELECT MAX(max_date) FROM {CATALOG_TABLE_NAME} WHERE table_name = ?",
+                [table_name],
+            )
+        else:
+            df = self.execute(
+                f"""
+                SELECT MAX(max_date)
+                FROM {CATALOG_TABLE_NAME}
+                WHERE table_name = ? AND partition_key = ?
+                """,
+                [table_name, partition],
+            )
+        return True, None if pd.isna(df.iloc[0, 0]) else df.iloc[0, 0]
+
     def get_latest_date(self, table_name, account=None):
+        found, latest_date = self._get_catalog_latest_date(table_name, account)
+        if found:
+            return latest_date
+        source = self.get_tiered_source(table_name)
         if account:
-            query = f"SELECT MAX(date) as latest_date FROM {table_name} WHERE account = ?"
+            query = f"SELECT MAX(date) as latest_date FROM {source} WHERE account = ?"
             df = self.execute(query, [account])
         else:
-            query = f"SELECT MAX(date) as latest_date FROM {table_name}"
+            query = f"SELECT MAX(date) as latest_date FROM {source}"
             df = self.execute(query)
         return None if pd.isna(df.iloc[0, 0]) else df.iloc[0, 0]
 
     def get_latest_month(self, table_name):
+        found, latest_month = self._get_catalog_latest_date(table_name)
+        if found:
+            return latest_month
         query = f"SELECT MAX(month_start) as latest_month FROM {table_name}"
         df = self.execute(query)
         return None if pd.isna(df.iloc[0, 0]) else df.iloc[0, 0]
 
-    def insert_many(self, table_name, values):
-        query = f"""
+    def get_table_columns(self, table_name):
+        df = self.execute(
+            """
             SELECT column_name
             FROM information_schema.columns
-            WHERE table_name = '{table_name}'
-            ORDER BY ordinal_position;
-        """
-        columns_df = self.execute(query)
-        columns = ", ".join(columns_df["column_name"].tolist())
+            WHERE table_name = ?
+              AND table_schema = 'main'
+              AND table_catalog IN (current_database(), 'temp')
+            ORDER BY ordinal_position
+            """,
+            [table_name],
+        )
+        return df["column_name"].tolist()
 
-        placeholders = ", ".join(["?"] * len(columns_df))
-        query = (
-            f"INSERT OR REPLACE INTO {table_name}({columns}) VALUES ({placeholders})"
+    def get_unique_key_columns(self, table_name):
+        df = self.execute(
+            """
+            SELECT constraint_column_names
+            FROM duckdb_constraints()
+            WHERE table_name = ?
+              AND database_name = current_database()
+              AND constraint_type IN ('PRIMARY KEY', 'UNIQUE')
+            ORDER BY constraint_type = 'UNIQUE'
+            LIMIT 1
+            """,
+            [table_name],
         )
-        self.conn.executemany(query, values)
+        if df.empty:
+            return []
+        return list(df.iloc[0]["constraint_column_names"])
+
+    def append_rows(self, table_name, rows, columns=None):
+        # Un solo INSERT da un DataFrame registrato invece di un'esecuzione
+        # per riga. Le colonne restano object: DuckDB deduce il tipo dai
+        # valori Python e None non diventa NaN negli interi.
+        if not rows:
+            return
+        columns = columns or self.get_table_columns(table_name)
+        frame = pd.DataFrame(
+            {
+                column: pd.Series([row[index] for row in rows], dtype=object)
+                for index, column in enumerate(columns)
+            }
+        )
+        self.conn.register("staged_rows_frame", frame)
+        try:
+            self.execute(
+                f"INSERT INTO {table_name} ({', '.join(columns)})"
+                " SELECT * FROM staged_rows_frame"
+            )
+        finally:
+            self.conn.unregister("staged_rows_frame")
 
-    def create_service_map(self):
-        query = """
+    def stage_rows(self, table_name, rows):
+        columns = self.get_table_columns(table_name)
+        staging_table = f"{table_name}_staging"
+        self.execute(
+            f"""
+            CREATE OR REPLACE TEMP TABLE {staging_table} AS
+            SELECT {', '.join(columns)} FROM {table_name} LIMIT 0
+            """
+        )
+        self.append_rows(staging_table, rows, columns=columns)
+        return staging_table
+
+    def publish_staged_rows(
+        self, table_name, staging_table, where=None, params=None, drop_staging=True
+    ):
+        # DELETE e INSERT dalla staging nella stessa transazione: i lettori
+        # vedono il load intero o niente. A parita' di chiave vince l'ultima
+        # riga, come con gli INSERT OR REPLACE riga per riga.
+        columns = ", ".join(self.get_table_columns(table_name))
+        key_columns = self.get_unique_key_columns(table_name)
+        dedup = (
+            f" QUALIFY ROW_NUMBER() OVER ("
+            f"PARTITION BY {', '.join(key_columns)} ORDER BY rowid DESC) = 1"
+            if key_columns
+            else ""
+        )
+        with self.transaction():
+            if where is not None:
+                self.execute(f"DELETE FROM {table_name} WHERE {where}", params)
+            self.execute(
+                f"INSERT OR REPLACE INTO {table_name} ({columns})"
+                f" SELECT {columns} FROM {staging_table}{dedup}"
+            )
+            if drop_staging:
+                self.execute(f"DROP TABLE {staging_table}")
+
+    def insert_many(self, table_name, values):
+        staging_table = self.stage_rows(table_name, values)
+        self.publish_staged_rows(table_name, staging_table)
+
+    def replace_rows(self, table_name, values, where="TRUE", params=None):
+        staging_table = self.stage_rows(table_name, values)
+        self.publish_staged_rows(table_name, staging_table, where=where, params=params)
+
+    def sync_service_map(self):
+        # service_map viene riscritta solo quando il mapping cambia; in quel
+        # caso le etichette gia' salvate in aws_costs vengono ricalcolate.
+        self.execute("""
             CREATE TABLE IF NOT EXISTS service_map (
                 raw VARCHAR PRIMARY KEY,
                 label VARCHAR
             );
-        """
-        self.execute(query)
-        self.insert_many("service_map", list(service_map.items()))
+        """)
+        self.execute(f"""
+            CREATE TABLE IF NOT EXISTS {SERVICE_MAP_VERSION_TABLE_NAME} (
+                mapping_hash VARCHAR,
+                applied_at TIMESTAMP
+            );
+        """)
+        mapping_hash = build_service_map_hash(service_map)
+        df = self.execute(f"SELECT mapping_hash FROM {SERVICE_MAP_VERSION_TABLE_NAME}")
+        if not df.empty and df.iloc[0]["mapping_hash"] == mapping_hash:
+            return False
 
-    def create_costs_view(self):
-        query = """
-            CREATE OR REPLACE VIEW costs AS
+        with self.transaction():
+            self.replace_rows("service_map", list(service_map.items()))
+            self.execute("""
+                UPDATE aws_costs
+                SET service_label = COALESCE(
+                    (SELECT m.label FROM service_map m WHERE m.raw = aws_costs.service),
+                    service
+                )
+            """)
+            self.execute(f"DELETE FROM {SERVICE_MAP_VERSION_TABLE_NAME}")
+            self.execute(
+                f"""
+                INSERT INTO {SERVICE_MAP_VERSION_TABLE_NAME}
+                VALUES (?, CAST(now() AS TIMESTAMP))
+                """,
+                [mapping_hash],
+            )
+        return True
+
+    def get_labeled_cold_costs_source(self):
+        # I file freddi di aws_costs non si aggiornano: l'etichetta viene
+        # risolta al volo da service_map.
+        cold_source = self.get_cold_source("aws_costs")
+        if cold_source is None:
+            return None
+        return f"""(
             SELECT
                 c.date,
                 c.account,
                 COALESCE(m.label, c.service) AS service,
                 c.amount
-            FROM aws_costs c
+            FROM {cold_source} c
             LEFT JOIN service_map m
-                ON m.raw = c.service;
+                ON m.raw = c.service
+        )"""
+
+    def create_costs_view(self):
+        # Le righe calde hanno l'etichetta risolta in scrittura: la vista non
+        # fa join. La vista salvata nel DB copre solo il tier caldo: il path
+        # del tier freddo dipende dall'host che legge, quindi le righe fredde
+        # si aggiungono a ogni query con get_tiered_source.
+        query = f"""
+            CREATE OR REPLACE VIEW {COSTS_VIEW_NAME} AS
+            SELECT
+                date,
+                account,
+                service_label AS service,
+                amount
+            FROM aws_costs;
         """
         self.execute(query)
 
-    def get_services_metrics(self, table_name, anchor_date=None):
+    def get_cold_table_glob(self, table_name):
+        table_dir = get_cold_storage_dir(self.db_path) / table_name
+        if not any(table_dir.glob(COLD_PARTITION_GLOB)):
+            return None
+        return str(table_dir / COLD_PARTITION_GLOB)
+
+    def get_cold_source(self, table_name, date_column="date"):
+        # I mesi chiusi spostati da tier-db vivono in Parquet partizionato
+        # account=/year=/month=; file scritti in momenti diversi possono avere
+        # colonne diverse (es. service_label), da cui union_by_name. Un mese
+        # ancora presente nel tier caldo (tier-db interrotto o non ancora
+        # promosso) vince sui suoi file freddi, che non vengono letti.
+        cold_glob = self.get_cold_table_glob(table_name)
+        if cold_glob is None:
+            return None
+        return f"""(
+            SELECT c.* EXCLUDE (year, month)
+            FROM read_parquet(
+                '{cold_glob}',
+                hive_partitioning = true,
+                hive_types = {{'account': VARCHAR, 'year': INTEGER, 'month': INTEGER}},
+                union_by_name = true
+            ) c
+            ANTI JOIN (
+                SELECT DISTINCT
+                    account,
+                    CAST(year({date_column}) AS INTEGER) AS year,
+                    CAST(month({date_column}) AS INTEGER) AS month
+                FROM {table_name}
+            ) h
+                ON h.account = c.account
+                AND h.year = c.year
+                AND h.month = c.month
+        )"""
+
+    def get_tiered_source(self, table_name, date_column="date"):
+        # La sorgente unisce tier caldo e freddo; il glob freddo viene risolto
+        # al momento della query rispetto al DB letto.
+        if table_name == COSTS_VIEW_NAME:
+            cold_source = self.get_labeled_cold_costs_source()
+        else:
+            cold_source = self.get_cold_source(table_name, date_column)
+        if cold_source is None:
+            return table_name
+        return f"""(
+            SELECT * FROM {table_name}
+            UNION ALL BY NAME
+            SELECT * FROM {cold_source}
+        )"""
+
+    def write_cold_partitions(self, table_name, date_column, source_query, params=None):
+        # Ogni partizione account/mese scritta sostituisce per intero i file
+        # che aveva: riscrivere un mese (tier-db rieseguito, anche in un mese
+        # successivo) non lascia copie delle stesse righe. I file vengono
+        # prima scritti in una cartella di appoggio fuori dal glob delle
+        # letture. Restituisce righe scritte, file scritti e file rimossi.
+        cold_dir = get_cold_storage_dir(self.db_path)
+        table_dir = cold_dir / table_name
+        staging_dir = cold_dir / f".{table_name}.staging"
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        staging_dir.mkdir(parents=True)
+        try:
+            df = self.execute(
+                f"""
+                COPY (
+                    SELECT
+                        *,
+                        CAST(year({date_column}) AS INTEGER) AS year,
+                        CAST(month({date_column}) AS INTEGER) AS month
+                    FROM ({source_query})
+                    ORDER BY account, {date_column}
+                ) TO '{staging_dir}' (
+                    FORMAT parquet,
+                    PARTITION_BY (account, year, month),
+                    OVERWRITE_OR_IGNORE,
+                    FILENAME_PATTERN 'data_{{i}}',
+                    RETURN_FILES
+                )
+                """,
+                params,
+            )
+            if df.empty or not int(df.iloc[0]["Count"]):
+                return 0, [], []
+
+            staged_files = [Path(path) for path in df.iloc[0]["Files"]]
+            written_files = []
+            removed_files = []
+            for partition_dir in sorted({path.parent for path in staged_files}):
+                target_dir = table_dir / partition_dir.relative_to(staging_dir)
+                target_dir.mkdir(parents=True, exist_ok=True)
+                staged_names = {
+                    path.name for path in staged_files if path.parent == partition_dir
+                }
+                for name in sorted(staged_names):
+                    (partition_dir / name).replace(target_dir / name)
+                    written_files.append(target_dir / name)
+                for stale_file in target_dir.glob("*.parquet"):
+                    if stale_file.name not in staged_names:
+                        stale_file.unlink()
+                        removed_files.append(stale_file)
+            return int(df.iloc[0]["Count"]), written_files, removed_files
+        finally:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+
+    def copy_rows_to_cold_tier(self, table_name, date_column, cutoff):
+        return self.write_cold_partitions(
+            table_name,
+            date_column,
+            f"SELECT * FROM {table_name} WHERE {date_column} < ?",
+            [cutoff],
+        )
+
+    def delete_rows_before(self, table_name, date_column, cutoff):
+        df = self.execute(
+            f"DELETE FROM {table_name} WHERE {date_column} < ?",
+            [cutoff],
+        )
+        return int(df.iloc[0, 0])
+
+    def create_costs_rollup_table(self, table_name):
+        self.conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table_name} (
+                account VARCHAR,
+                service VARCHAR,
+                month_start DATE,
+                day INTEGER,
+                amount DOUBLE,
+                mtd_amount DOUBLE,
+                UNIQUE(account, service, month_start, day)
+            )
+        """)
+
+    def _costs_rollup_select(self, source_table, where=""):
+        # Totale giornaliero per account/servizio e somma cumulata dall'inizio
+        # del mese: il MTD a un certo giorno e' un singolo lookup.
+        return f"""
+            SELECT
+                account,
+                service,
+                CAST(date_trunc('month', date) AS DATE) AS month_start,
+                CAST(EXTRACT(day FROM date) AS INTEGER) AS day,
+                SUM(amount) AS amount,
+                SUM(SUM(amount)) OVER (
+                    PARTITION BY account, service, date_trunc('month', date)
+                    ORDER BY date
+                ) AS mtd_amount
+            FROM {source_table}
+            {where}
+            GROUP BY account, service, date
+        """
+
+    def refresh_costs_rollup(self, rollup_table, source_table, account, from_month):
+        # Riscrive il rollup dei mesi toccati dal collector per un account.
+        with self.transaction():
+            self.execute(
+                f"DELETE FROM {rollup_table} WHERE account = ? AND month_start >= ?",
+                [account, from_month],
+            )
+            self.execute(
+                f"""
+                INSERT INTO {rollup_table} (
+                    account, service, month_start, day, amount, mtd_amount
+                )
+                {self._costs_rollup_select(
+                    self.get_tiered_source(source_table),
+                    "WHERE account = ? AND date >= ?",
+                )}
+                """,
+                [account, from_month],
+            )
+
+    def rebuild_costs_rollup(self, rollup_table, source_table):
+        with self.transaction():
+            self.execute(f"DELETE FROM {rollup_table}")
+            self.execute(
+                f"""
+                INSERT INTO {rollup_table} (
+                    account, service, month_start, day, amount, mtd_amount
+                )
+                {self._costs_rollup_select(self.get_tiered_source(source_table))}
+                """
+            )
+
+    def create_costs_prefix_table(self, table_name):
+        self.conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table_name} (
+                account VARCHAR,
+                service VARCHAR,
+                date DATE,
+                cum_amount DOUBLE,
+                UNIQUE(account, service, date)
+            )
+        """)
+
+    def _costs_prefix_select(self, source_table, where="", base_source=None):
+        # Somma cumulata per account/servizio dall'inizio dello storico: il
+        # totale di un intervallo e' la differenza di due lookup.
+        base_join = ""
+        base_amount = "0"
+        if base_source is not None:
+            base_join = f"LEFT JOIN ({base_source}) b USING (account, service)"
+            base_amount = "COALESCE(b.cum_amount, 0)"
+        return f"""
+            SELECT
+                d.account,
+                d.service,
+                d.date,
+                {base_amount} + SUM(d.amount) OVER (
+                    PARTITION BY d.account, d.service
+                    ORDER BY d.date
+                ) AS cum_amount
+            FROM (
+                SELECT account, service, CAST(date AS DATE) AS date, SUM(amount) AS amount
+                FROM {source_table}
+                {where}
+                GROUP BY account, service, CAST(date AS DATE)
+            ) d
+            {base_join}
+        """
+
+    def refresh_costs_prefix(self, prefix_table, source_table, account, from_date):
+        # Le righe precedenti a from_date restano valide: si riparte dall'ultimo
+        # cumulato di ogni servizio e si riscrive solo la coda.
+        base_source = f"""
+            SELECT account, service, MAX_BY(cum_amount, date) AS cum_amount
+            FROM {self.get_tiered_source(prefix_table)}
+            WHERE account = ? AND date < ?
+            GROUP BY account, service
+        """
+        with self.transaction():
+            self.execute(
+                f"DELETE FROM {prefix_table} WHERE account = ? AND date >= ?",
+                [account, from_date],
+            )
+            self.execute(
+                f"""
+                INSERT INTO {prefix_table} (account, service, date, cum_amount)
+                {self._costs_prefix_select(
+                    self.get_tiered_source(source_table),
+                    "WHERE account = ? AND date >= ?",
+                    base_source,
+                )}
+                """,
+                [account, from_date, account, from_date],
+            )
+
+    def rebuild_costs_prefix(self, prefix_table, source_table):
+        with self.transaction():
+            self.execute(f"DELETE FROM {prefix_table}")
+            self.execute(
+                f"""
+                INSERT INTO {prefix_table} (account, service, date, cum_amount)
+                {self._costs_prefix_select(self.get_tiered_source(source_table))}
+                """
+            )
+
+    def rewrite_cold_costs_derivatives(self, rollup_table, prefix_table):
+        # Rollup e somme cumulate freddi sono salvati per etichetta: dopo un
+        # cambio di service_map vengono ricalcolati dai costi freddi
+        # rietichettati e le loro partizioni riscritte. Lo storico freddo
+        # parte dall'inizio, quindi il cumulato non ha bisogno di una base.
+        cold_costs = self.get_labeled_cold_costs_source()
+        if cold_costs is None:
+            return [], []
+        written_files = []
+        removed_files = []
+        for table_name, date_column, source_query in (
+            (rollup_table, "month_start", self._costs_rollup_select(cold_costs)),
+            (prefix_table, "date", self._costs_prefix_select(cold_costs)),
+        ):
+            _, files, stale_files = self.write_cold_partitions(
+                table_name, date_column, source_query
+            )
+            written_files.extend(files)
+            removed_files.extend(stale_files)
+        return written_files, removed_files
+
+    def _costs_prefix_source(self, table_name):
+        prefix_table = get_costs_prefix_table_name(table_name)
+        if self.get_relation_type(prefix_table) is not None:
+            return self.get_tiered_source(prefix_table)
+        return f"({self._costs_prefix_select(self.get_tiered_source(table_name))})"
+
+    def get_services_range_comparison(
+        self,
+        table_name,
+        current_start,
+        current_end,
+        reference_start,
+        reference_end,
+        as_arrow=False,
+    ):
+        # Quattro lookup ASOF per servizio (cumulato al giorno prima dell'inizio e
+        # alla fine di ogni intervallo) invece di una scansione delle righe.
+        prefix_source = self._costs_prefix_source(table_name)
+        query = f"""
+            WITH bounds AS (
+                SELECT * FROM (
+                    VALUES
+                        ('current_end', CAST(? AS DATE)),
+                        ('current_before', CAST(? AS DATE) - 1),
+                        ('reference_end', CAST(? AS DATE)),
+                        ('reference_before', CAST(? AS DATE) - 1)
+                ) AS b(bound, bound_date)
+            ),
+            prefix AS (
+                SELECT * FROM {prefix_source}
+            ),
+            probes AS (
+                SELECT k.account, k.service, b.bound, b.bound_date
+                FROM (SELECT DISTINCT account, service FROM prefix) k
+                CROSS JOIN bounds b
+            ),
+            lookups AS (
+                SELECT
+                    p.account,
+                    p.service,
+                    p.bound,
+                    COALESCE(s.cum_amount, 0) AS cum_amount
+                FROM probes p
+                ASOF LEFT JOIN prefix s
+                    ON p.account = s.account
+                    AND p.service = s.service
+                    AND p.bound_date >= s.date
+            ),
+            ranges AS (
+                SELECT
+                    account,
+                    service,
+                    MAX(cum_amount) FILTER (WHERE bound = 'current_end')
+                        - MAX(cum_amount) FILTER (WHERE bound = 'current_before')
+                        AS current_amount,
+                    MAX(cum_amount) FILTER (WHERE bound = 'reference_end')
+                        - MAX(cum_amount) FILTER (WHERE bound = 'reference_before')
+                        AS reference_amount
+                FROM lookups
+                GROUP BY account, service
+            )
+            SELECT
+                account,
+                service,
+                current_amount,
+                reference_amount,
+                current_amount - reference_amount AS delta,
+                (current_amount - reference_amount) / NULLIF(reference_amount, 0) AS pct
+            FROM ranges
+            WHERE current_amount <> 0 OR reference_amount <> 0
+            ORDER BY account, service;
+        """
+        return self._fetch(
+            query,
+            params=[current_end, current_start, reference_end, reference_start],
+            as_arrow=as_arrow,
+        )
+
+    def _costs_rollup_source(self, table_name):
+        # Se il collector non ha ancora creato il rollup (DB precedente) lo
+        # stesso calcolo viene fatto al volo sui dati giornalieri.
+        rollup_table = get_costs_rollup_table_name(table_name)
+        if self.get_relation_type(rollup_table) is not None:
+            return self.get_tiered_source(rollup_table, "month_start")
+        return f"({self._costs_rollup_select(self.get_tiered_source(table_name))})"
+
+
+    def get_services_metrics(
+        self,
+        table_name,
+        anchor_date=None,
+        lookback_months=None,
+        average_windows=None,
+        as_arrow=False,
+    ):
+        rollup_source = self._costs_rollup_source(table_name)
         if anchor_date is None:
-            last_cte = f"SELECT MAX(date) AS last_date FROM {table_name}"
+            last_cte = f"""
+                SELECT CAST(MAX(month_start + (day - 1)) AS DATE) AS last_date
+                FROM {rollup_source}
+            """
             params = None
         else:
             last_cte = "SELECT CAST(? AS DATE) AS last_date"
             params = [anchor_date]
 
-        query = f"""
-            WITH last AS (
+        params_cte = f"""
+            last AS (
                 {last_cte}
             ),
             params AS (
@@ -132,269 +1071,63 @@ class DuckDBClient:
                     date_trunc('month', last_date) AS month_start,
                     EXTRACT(day FROM last_date) AS dom
                 FROM last
-            ),
-            mtd AS (
-                SELECT account, service, SUM(amount) AS mtd
-                FROM {table_name}, params
-                WHERE date BETWEEN month_start AND last_date
-                GROUP BY account, service
-            ),
-            prev_mtd AS (
-                SELECT account, service, SUM(amount) AS prev_mtd
-                FROM {table_name}, params
-                WHERE date BETWEEN CAST(month_start - INTERVAL '1 month' AS DATE)
-                    AND CAST(
-                        LEAST(
-                            last_day(month_start - INTERVAL '1 month'),
-                            (month_start - INTERVAL '1 month') + (dom - 1) * INTERVAL '1 day'
-                        ) AS DATE
-                    )
-                GROUP BY account, service
-            ),
-            prev2_mtd AS (
-                SELECT account, service, SUM(amount) AS prev2_mtd
-                FROM {table_name}, params
-                WHERE date BETWEEN CAST(month_start - INTERVAL '2 months' AS DATE)
-                    AND CAST(
-                        LEAST(
-                            last_day(month_start - INTERVAL '2 months'),
-                            (month_start - INTERVAL '2 months') + (dom - 1) * INTERVAL '1 day'
-                        ) AS DATE
-                    )
-                GROUP BY account, service
-            ),
-            prev3_mtd AS (
-                SELECT account, service, SUM(amount) AS prev3_mtd
-                FROM {table_name}, params
-                WHERE date BETWEEN CAST(month_start - INTERVAL '3 months' AS DATE)
-                    AND CAST(
-                        LEAST(
-                            last_day(month_start - INTERVAL '3 months'),
-                            (month_start - INTERVAL '3 months') + (dom - 1) * INTERVAL '1 day'
-                        ) AS DATE
-                    )
-                GROUP BY account, service
-            ),
-            prev4_mtd AS (
-                SELECT account, service, SUM(amount) AS prev4_mtd
-                FROM {table_name}, params
-                WHERE date BETWEEN CAST(month_start - INTERVAL '4 months' AS DATE)
-                    AND CAST(
-                        LEAST(
-                            last_day(month_start - INTERVAL '4 months'),
-                            (month_start - INTERVAL '4 months') + (dom - 1) * INTERVAL '1 day'
-                        ) AS DATE
-                    )
-                GROUP BY account, service
-            ),
-            prev5_mtd AS (
-                SELECT account, service, SUM(amount) AS prev5_mtd
-                FROM {table_name}, params
-                WHERE date BETWEEN CAST(month_start - INTERVAL '5 months' AS DATE)
-                    AND CAST(
-                        LEAST(
-                            last_day(month_start - INTERVAL '5 months'),
-                            (month_start - INTERVAL '5 months') + (dom - 1) * INTERVAL '1 day'
-                        ) AS DATE
-                    )
-                GROUP BY account, service
-            ),
-            avg6 AS (
-                SELECT account, service, AVG(month_sum) AS avg6
-                FROM (
-                    SELECT
-                        account,
-                        service,
-                        date_trunc('month', date) AS m,
-                        SUM(amount) AS month_sum
-                    FROM {table_name}, params
-                    WHERE date >= month_start - INTERVAL '6 months'
-                        AND date < month_start
-                        AND EXTRACT(day FROM date) <= dom
-                    GROUP BY account, service, m
-                ) t
-                GROUP BY account, service
-            ),
-            avg12 AS (
-                SELECT account, service, AVG(month_sum) AS avg12
-                FROM (
-                    SELECT
-                        account,
-                        service,
-                        date_trunc('month', date) AS m,
-                        SUM(amount) AS month_sum
-                    FROM {table_name}, params
-                    WHERE date >= month_start - INTERVAL '12 months'
-                        AND date < month_start
-                        AND EXTRACT(day FROM date) <= dom
-                    GROUP BY account, service, m
-                ) t
-                GROUP BY account, service
             )
-            SELECT
-                mtd.account,
-                mtd.service,
-                mtd.mtd,
-                prev_mtd.prev_mtd,
-                prev2_mtd.prev2_mtd,
-                prev3_mtd.prev3_mtd,
-                prev4_mtd.prev4_mtd,
-                prev5_mtd.prev5_mtd,
-                avg6.avg6,
-                avg12.avg12,
-                (mtd.mtd - prev_mtd.prev_mtd) AS delta_prev,
-                (prev_mtd.prev_mtd - prev2_mtd.prev2_mtd) AS delta_prev2,
-                (prev2_mtd.prev2_mtd - prev3_mtd.prev3_mtd) AS delta_prev3,
-                (prev3_mtd.prev3_mtd - prev4_mtd.prev4_mtd) AS delta_prev4,
-                (prev4_mtd.prev4_mtd - prev5_mtd.prev5_mtd) AS delta_prev5,
-                (mtd.mtd - avg6.avg6) AS delta_avg6,
-                (mtd.mtd - avg12.avg12) AS delta_avg12,
-                (mtd.mtd - prev_mtd.prev_mtd) / NULLIF(prev_mtd.prev_mtd, 0) AS pct_prev,
-                (prev_mtd.prev_mtd - prev2_mtd.prev2_mtd) / NULLIF(prev2_mtd.prev2_mtd, 0) AS pct_prev2,
-                (prev2_mtd.prev2_mtd - prev3_mtd.prev3_mtd) / NULLIF(prev3_mtd.prev3_mtd, 0) AS pct_prev3,
-                (prev3_mtd.prev3_mtd - prev4_mtd.prev4_mtd) / NULLIF(prev4_mtd.prev4_mtd, 0) AS pct_prev4,
-                (prev4_mtd.prev4_mtd - prev5_mtd.prev5_mtd) / NULLIF(prev5_mtd.prev5_mtd, 0) AS pct_prev5,
-                (mtd.mtd - avg6.avg6) / NULLIF(avg6.avg6, 0) AS pct_avg6,
-                (mtd.mtd - avg12.avg12) / NULLIF(avg12.avg12, 0) AS pct_avg12
-            FROM mtd
-            LEFT JOIN prev_mtd ON prev_mtd.account = mtd.account AND prev_mtd.service = mtd.service
-            LEFT JOIN prev2_mtd ON prev2_mtd.account = mtd.account AND prev2_mtd.service = mtd.service
-            LEFT JOIN prev3_mtd ON prev3_mtd.account = mtd.account AND prev3_mtd.service = mtd.service
-            LEFT JOIN prev4_mtd ON prev4_mtd.account = mtd.account AND prev4_mtd.service = mtd.service
-            LEFT JOIN prev5_mtd ON prev5_mtd.account = mtd.account AND prev5_mtd.service = mtd.service
-            LEFT JOIN avg6     ON avg6.account = mtd.account AND avg6.service = mtd.service
-            LEFT JOIN avg12    ON avg12.account = mtd.account AND avg12.service = mtd.service
-            ORDER BY mtd.account, mtd.service;
         """
-        return self.execute(query, params=params)
+        query = build_services_metrics_query(
+            rollup_source,
+            params_cte,
+            "AND r.day <= params.dom",
+            lookback_months or get_costs_lookback_months(),
+            average_windows or get_costs_average_windows(),
+        )
+        return self._fetch(query, params=params, as_arrow=as_arrow)
 
-    def get_services_metrics_for_month(self, table_name, month_start):
-        query = f"""
-            WITH params AS (
+    def get_services_metrics_for_month(
+        self,
+        table_name,
+        month_start,
+        lookback_months=None,
+        average_windows=None,
+        as_arrow=False,
+    ):
+        params_cte = """
+            params AS (
                 SELECT CAST(? AS DATE) AS month_start
-            ),
-            mtd AS (
-                SELECT account, service, SUM(amount) AS mtd
-                FROM {table_name}, params
-                WHERE date >= month_start
-                    AND date < month_start + INTERVAL '1 month'
-                GROUP BY account, service
-            ),
-            prev_mtd AS (
-                SELECT account, service, SUM(amount) AS prev_mtd
-                FROM {table_name}, params
-                WHERE date >= month_start - INTERVAL '1 month'
-                    AND date < month_start
-                GROUP BY account, service
-            ),
-            prev2_mtd AS (
-                SELECT account, service, SUM(amount) AS prev2_mtd
-                FROM {table_name}, params
-                WHERE date >= month_start - INTERVAL '2 months'
-                    AND date < month_start - INTERVAL '1 month'
-                GROUP BY account, service
-            ),
-            prev3_mtd AS (
-                SELECT account, service, SUM(amount) AS prev3_mtd
-                FROM {table_name}, params
-                WHERE date >= month_start - INTERVAL '3 months'
-                    AND date < month_start - INTERVAL '2 months'
-                GROUP BY account, service
-            ),
-            prev4_mtd AS (
-                SELECT account, service, SUM(amount) AS prev4_mtd
-                FROM {table_name}, params
-                WHERE date >= month_start - INTERVAL '4 months'
-                    AND date < month_start - INTERVAL '3 months'
-                GROUP BY account, service
-            ),
-            prev5_mtd AS (
-                SELECT account, service, SUM(amount) AS prev5_mtd
-                FROM {table_name}, params
-                WHERE date >= month_start - INTERVAL '5 months'
-                    AND date < month_start - INTERVAL '4 months'
-                GROUP BY account, service
-            ),
-            avg6 AS (
-                SELECT account, service, AVG(month_sum) AS avg6
-                FROM (
-                    SELECT
-                        account,
-                        service,
-                        date_trunc('month', date) AS m,
-                        SUM(amount) AS month_sum
-                    FROM {table_name}, params
-                    WHERE date >= month_start - INTERVAL '6 months'
-                        AND date < month_start
-                    GROUP BY account, service, m
-                ) t
-                GROUP BY account, service
-            ),
-            avg12 AS (
-                SELECT account, service, AVG(month_sum) AS avg12
-                FROM (
-                    SELECT
-                        account,
-                        service,
-                        date_trunc('month', date) AS m,
-                        SUM(amount) AS month_sum
-                    FROM {table_name}, params
-                    WHERE date >= month_start - INTERVAL '12 months'
-                        AND date < month_start
-                    GROUP BY account, service, m
-                ) t
-                GROUP BY account, service
             )
-            SELECT
-                mtd.account,
-                mtd.service,
-                mtd.mtd,
-                prev_mtd.prev_mtd,
-                prev2_mtd.prev2_mtd,
-                prev3_mtd.prev3_mtd,
-                prev4_mtd.prev4_mtd,
-                prev5_mtd.prev5_mtd,
-                avg6.avg6,
-                avg12.avg12,
-                (mtd.mtd - prev_mtd.prev_mtd) AS delta_prev,
-                (prev_mtd.prev_mtd - prev2_mtd.prev2_mtd) AS delta_prev2,
-                (prev2_mtd.prev2_mtd - prev3_mtd.prev3_mtd) AS delta_prev3,
-                (prev3_mtd.prev3_mtd - prev4_mtd.prev4_mtd) AS delta_prev4,
-                (prev4_mtd.prev4_mtd - prev5_mtd.prev5_mtd) AS delta_prev5,
-                (mtd.mtd - avg6.avg6) AS delta_avg6,
-                (mtd.mtd - avg12.avg12) AS delta_avg12,
-                (mtd.mtd - prev_mtd.prev_mtd) / NULLIF(prev_mtd.prev_mtd, 0) AS pct_prev,
-                (prev_mtd.prev_mtd - prev2_mtd.prev2_mtd) / NULLIF(prev2_mtd.prev2_mtd, 0) AS pct_prev2,
-                (prev2_mtd.prev2_mtd - prev3_mtd.prev3_mtd) / NULLIF(prev3_mtd.prev3_mtd, 0) AS pct_prev3,
-                (prev3_mtd.prev3_mtd - prev4_mtd.prev4_mtd) / NULLIF(prev4_mtd.prev4_mtd, 0) AS pct_prev4,
-                (prev4_mtd.prev4_mtd - prev5_mtd.prev5_mtd) / NULLIF(prev5_mtd.prev5_mtd, 0) AS pct_prev5,
-                (mtd.mtd - avg6.avg6) / NULLIF(avg6.avg6, 0) AS pct_avg6,
-                (mtd.mtd - avg12.avg12) / NULLIF(avg12.avg12, 0) AS pct_avg12
-            FROM mtd
-            LEFT JOIN prev_mtd ON prev_mtd.account = mtd.account AND prev_mtd.service = mtd.service
-            LEFT JOIN prev2_mtd ON prev2_mtd.account = mtd.account AND prev2_mtd.service = mtd.service
-            LEFT JOIN prev3_mtd ON prev3_mtd.account = mtd.account AND prev3_mtd.service = mtd.service
-            LEFT JOIN prev4_mtd ON prev4_mtd.account = mtd.account AND prev4_mtd.service = mtd.service
-            LEFT JOIN prev5_mtd ON prev5_mtd.account = mtd.account AND prev5_mtd.service = mtd.service
-            LEFT JOIN avg6     ON avg6.account = mtd.account AND avg6.service = mtd.service
-            LEFT JOIN avg12    ON avg12.account = mtd.account AND avg12.service = mtd.service
-            ORDER BY mtd.account, mtd.service;
         """
-        return self.execute(query, params=[month_start])
+        query = build_services_metrics_query(
+            self._costs_rollup_source(table_name),
+            params_cte,
+            "",
+            lookback_months or get_costs_lookback_months(),
+            average_windows or get_costs_average_windows(),
+        )
+        return self._fetch(query, params=[month_start], as_arrow=as_arrow)
 
-    def get_available_month_anchors(self, table_name):
+    def get_available_month_anchors(self, table_name, as_arrow=False):
+        if self.has_catalog_entries(table_name):
+            query = f"""
+                SELECT
+                    partition_key AS account,
+                    month_start,
+                    max_date AS anchor_date
+                FROM {CATALOG_TABLE_NAME}
+                WHERE table_name = ?
+                ORDER BY account, month_start DESC;
+            """
+            return self._fetch(query, [table_name], as_arrow=as_arrow)
         query = f"""
             SELECT
                 account,
-                CAST(date_trunc('month', date) AS DATE) AS month_start,
-                CAST(MAX(date) AS DATE) AS anchor_date
-            FROM {table_name}
-            GROUP BY account, date_trunc('month', date)
+                month_start,
+                CAST(MAX(month_start + (day - 1)) AS DATE) AS anchor_date
+            FROM {self._costs_rollup_source(table_name)}
+            GROUP BY account, month_start
             ORDER BY account, month_start DESC;
         """
-        return self.execute(query)
+        return self._fetch(query, as_arrow=as_arrow)
 
-    def get_pod_monthly_trend(self, table_name, months=12):
+    def get_pod_monthly_trend(self, table_name, months=12, as_arrow=False):
         query = f"""
             SELECT
                 month_start,
@@ -412,9 +1145,15 @@ class DuckDBClient:
             )
             ORDER BY month_start, tenant;
         """
-        return self.execute(query)
+        return self._fetch(query, as_arrow=as_arrow)
 
-    def get_pod_daily_trend(self, table_name, days=60):
+    def get_pod_daily_trend(self, table_name, days=60, as_arrow=False):
+        # In modalita' compact si espandono solo i run dell'intervallo.
+        start_date = f"CAST(current_date - INTERVAL '{days - 1} days' AS DATE)"
+        range_macro_name = get_pod_daily_range_macro_name(table_name)
+        source = table_name
+        if self.has_table_macro(range_macro_name):
+            source = f"{range_macro_name}({start_date})"
         query = f"""
             SELECT
                 date,
@@ -425,18 +1164,297 @@ class DuckDBClient:
                 daily_onboarded_delta,
                 onboarded_pods,
                 updated_at
-            FROM {table_name}
-            WHERE date >= CAST(current_date - INTERVAL '{days - 1} days' AS DATE)
+            FROM {source}
+            WHERE date >= {start_date}
             ORDER BY date, tenant;
         """
-        return self.execute(query)
+        return self._fetch(query, as_arrow=as_arrow)
 
     def checkpoint(self):
+        self.flush_query_log()
         self.conn.execute("CHECKPOINT")
 
     def close(self):
+        self.flush_query_log()
         self.conn.close()
 
 
+class ReadOnlyConnectionPool:
+    # Una connessione READ_ONLY per file DuckDB, condivisa dal processo.
+    # Ogni query usa un cursore dedicato; quando il file cambia (mtime
+    # diversa) la connessione viene riaperta appena i cursori in uso sono
+    # stati rilasciati.
+    # Con DUCKDB_IN_MEMORY=1 ogni generazione del file, se non supera
+    # DUCKDB_IN_MEMORY_MAX_BYTES, viene copiata in un DuckDB in memoria: la
+    # copia nuova si carica mentre la precedente continua a servire le query
+    # e poi la sostituisce in un colpo solo.
+    def __init__(self, in_memory=None, in_memory_max_bytes=None):
+        self._in_memory = (
+            is_in_memory_db_enabled() if in_memory is None else in_memory
+        )
+        self._in_memory_max_bytes = (
+            get_in_memory_max_bytes()
+            if in_memory_max_bytes is None
+            else in_memory_max_bytes
+        )
+        self._condition = threading.Condition()
+        self._connections = {}
+        self._leases = {}
+        self._retired = {}
+        self._loading = set()
+        self._file_mode_generations = {}
+        self._last_query_log_flush = time.monotonic()
+
+    def _get_generation(self, db_path):
+        try:
+            return db_path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return 0
+
+    def _use_memory(self, db_path, generation):
+        if not self._in_memory or not generation:
+            return False
+        if self._file_mode_generations.get(db_path) == generation:
+            return False
+        if get_db_file_size(db_path) > self._in_memory_max_bytes:
+            print(
+                f"DuckDB {db_path} oltre {self._in_memory_max_bytes} byte:"
+                " la dashboard legge dal file."
+            )
+            self._file_mode_generations[db_path] = generation
+            return False
+        return True
+
+    def _lease(self, connection):
+        self._leases[id(connection)] = self._leases.get(id(connection), 0) + 1
+        return connection
+
+    def _retire(self, connection):
+        if self._leases.get(id(connection)):
+            self._retired[id(connection)] = connection
+        else:
+            connection.close()
+
+    def _load_in_memory(self, db_path):
+        connection = duckdb.connect(":memory:", config=get_duckdb_config())
+        try:
+            connection.execute(f"ATTACH '{db_path}' AS source (READ_ONLY)")
+            connection.execute("COPY FROM DATABASE source TO memory")
+            connection.execute("DETACH source")
+        except BaseException:
+            connection.close()
+            raise
+        return connection
+
+    def _acquire(self, db_path):
+        while True:
+            with self._condition:
+                generation = self._get_generation(db_path)
+                current = self._connections.get(db_path)
+                if current is not None and current[0] == generation:
+                    return self._lease(current[1])
+                if not self._use_memory(db_path, generation):
+                    if current is None or not self._leases.get(id(current[1])):
+                        # DuckDB riusa l'istanza aperta sullo stesso path: la
+                        # connessione precedente va chiusa prima di riaprire.
+                        if current is not None:
+                            current[1].close()
+                        current = (
+                            generation,
+                            duckdb.connect(
+                                str(db_path),
+                                read_only=True,
+                                config=get_duckdb_config(),
+                            ),
+                        )
+                        self._connections[db_path] = current
+                        return self._lease(current[1])
+                    self._condition.wait()
+                    continue
+                if db_path in self._loading:
+                    if current is not None:
+                        return self._lease(current[1])
+                    self._condition.wait()
+                    continue
+                self._loading.add(db_path)
+
+            try:
+                connection = self._load_in_memory(db_path)
+            except duckdb.Error as exc:
+                print(f"Caricamento in memoria di {db_path} fallito: {exc}")
+                with self._condition:
+                    self._loading.discard(db_path)
+                    self._file_mode_generations[db_path] = generation
+                    self._condition.notify_all()
+                continue
+            with self._condition:
+                self._loading.discard(db_path)
+                previous = self._connections.get(db_path)
+                self._connections[db_path] = (generation, connection)
+                if previous is not None:
+                    self._retire(previous[1])
+                self._condition.notify_all()
+
+    def _release(self, connection):
+        with self._condition:
+            key = id(connection)
+            self._leases[key] -= 1
+            if not self._leases[key]:
+                del self._leases[key]
+                retired = self._retired.pop(key, None)
+                if retired is not None:
+                    retired.close()
+            self._condition.notify_all()
+
+    @contextmanager
+    def client(self, database):
+        db_path = ensure_db_parent(database)
+        connection = self._acquire(db_path)
+        try:
+            client = DuckDBClient(database, connection=connection.cursor())
+            try:
+                yield client
+            finally:
+                client.close()
+        finally:
+            self._release(connection)
+            self._maybe_flush_query_log(db_path)
+
+    def _maybe_flush_query_log(self, db_path, force=False):
+        if not is_query_log_enabled():
+            return
+        now = time.monotonic()
+        with self._condition:
+            if not force and (
+                now - self._last_query_log_flush < get_query_log_flush_seconds()
+            ):
+                return
+            self._last_query_log_flush = now
+        flush_sidecar_query_log(db_path)
+
+    def close(self):
+        for db_path in list(self._connections):
+            self._maybe_flush_query_log(db_path, force=True)
+        with self._condition:
+            for _, connection in self._connections.values():
+                connection.close()
+            for connection in self._retired.values():
+                connection.close()
+            self._connections.clear()
+            self._retired.clear()
+
+
+def get_month_metric_name(months_back):
+    if months_back == 0:
+        return "mtd"
+    if months_back == 1:
+        return "prev_mtd"
+    return f"prev{months_back}_mtd"
+
+
+def get_month_comparison_suffix(months_back):
+    return "prev" if months_back == 1 else f"prev{months_back}"
+
+
+def build_services_metric_defs(lookback_months=None, average_windows=None):
+    # Ogni riga: (metrica, colonna delta, colonna pct, valore, riferimento).
+    # Delta e pct confrontano il valore con il riferimento.
+    lookback_months = lookback_months or get_costs_lookback_months()
+    average_windows = average_windows or get_costs_average_windows()
+    metric_defs = []
+    for months_back in range(lookback_months):
+        suffix = get_month_comparison_suffix(months_back + 1)
+        metric_defs.append(
+            (
+                get_month_metric_name(months_back),
+                f"delta_{suffix}",
+                f"pct_{suffix}",
+                get_month_metric_name(months_back),
+                get_month_metric_name(months_back + 1),
+            )
+        )
+    for window in average_windows:
+        metric_defs.append(
+            (f"avg{window}", f"delta_avg{window}", f"pct_avg{window}", "mtd", f"avg{window}")
+        )
+    return metric_defs
+
+
+def build_services_metrics_query(
+    rollup_source, params_cte, day_filter, lookback_months, average_windows
+):
+    # Una sola lettura del rollup: ogni mese viene ridotto al suo MTD e
+    # assegnato a un offset (0 = mese corrente), poi le colonne vengono
+    # costruite con aggregazioni condizionali sull'offset.
+    metric_defs = build_services_metric_defs(lookback_months, average_windows)
+    max_months_back = max((lookback_months, *average_windows))
+    value_names = [
+        get_month_metric_name(months_back) for months_back in range(lookback_months + 1)
+    ] + [f"avg{window}" for window in average_windows]
+    bucket_columns = [
+        f"MAX(month_sum) FILTER (WHERE months_back = {months_back})"
+        f" AS {get_month_metric_name(months_back)}"
+        for months_back in range(lookback_months + 1)
+    ] + [
+        f"AVG(month_sum) FILTER (WHERE months_back BETWEEN 1 AND {window})"
+        f" AS avg{window}"
+        for window in average_windows
+    ]
+    result_columns = (
+        ["account", "service"]
+        + value_names
+        + [
+            f"({value} - {reference}) AS {delta_col}"
+            for _, delta_col, _, value, reference in metric_defs
+        ]
+        + [
+            f"({value} - {reference}) / NULLIF({reference}, 0) AS {pct_col}"
+            for _, _, pct_col, value, reference in metric_defs
+        ]
+    )
+    column_separator = ",\n                "
+    return f"""
+        WITH {params_cte},
+        monthly AS (
+            SELECT
+                r.account,
+                r.service,
+                CAST(datediff('month', r.month_start, params.month_start) AS INTEGER)
+                    AS months_back,
+                MAX_BY(r.mtd_amount, r.day) AS month_sum
+            FROM {rollup_source} r, params
+            WHERE r.month_start >= params.month_start - INTERVAL '{max_months_back} months'
+                AND r.month_start <= params.month_start
+                {day_filter}
+            GROUP BY r.account, r.service, r.month_start, params.month_start
+        ),
+        buckets AS (
+            SELECT
+                account,
+                service,
+                {column_separator.join(bucket_columns)}
+            FROM monthly
+            GROUP BY account, service
+        )
+        SELECT
+                {column_separator.join(result_columns)}
+        FROM buckets
+        WHERE mtd IS NOT NULL
+        ORDER BY account, service;
+    """
+
+
+def get_pod_daily_range_macro_name(view_name):
+    return f"{view_name}_from"
+
+
+def get_costs_rollup_table_name(table_name):
+    return f"{table_name}_rollup"
+
+
+def get_costs_prefix_table_name(table_name):
+    return f"{table_name}_prefix"
+
+
 def get_duckdb_client(database):
     return DuckDBClient(database)
@@ -0,0 +1,60 @@
+from collections.abc import Callable
+from dataclasses import dataclass
+from datetime import UTC, datetime
+
+
+SCHEMA_VERSION_TABLE_NAME = "schema_version"
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    name: str
+    apply: Callable
+
+
+def cluster_table(table_name: str, order_by: str) -> Callable:
+    def apply(duckdb) -> None:
+        # In modalita' compact alcune relazioni sono viste: si riordinano solo
+        # le tabelle.
+        if duckdb.get_relation_type(table_name) == "BASE TABLE":
+            duckdb.rewrite_table_sorted(table_name, order_by)
+
+    return apply
+
+
+def add_column(table_name: str, column_name: str, column_type: str) -> Callable:
+    def apply(duckdb) -> None:
+        if duckdb.get_relation_type(table_name) == "BASE TABLE":
+            duckdb.execute(
+                f"ALTER TABLE {table_name}"
+                f" ADD COLUMN IF NOT EXISTS {column_name} {column_type}"
+            )
+
+    return apply
+
+
+def run_migrations(duckdb, scope: str, migrations: list[Migration]) -> list[int]:
+    versions = [migration.version for migration in migrations]
+    if versions != sorted(set(versions)):
+        raise ValueError(f"Migrazioni '{scope}' non ordinate o duplicate: {versions}")
+
+    duckdb.create_schema_version_table(SCHEMA_VERSION_TABLE_NAME)
+    applied_versions = duckdb.get_schema_versions(SCHEMA_VERSION_TABLE_NAME, scope)
+    newly_applied = []
+    for migration in migrations:
+        if migration.version in applied_versions:
+            continue
+        print(f"Applico migrazione {scope} v{migration.version}: {migration.name}")
+        # Ogni migrazione e la sua versione vengono committate insieme.
+        with duckdb.transaction():
+            migration.apply(duckdb)
+            duckdb.record_schema_version(
+                SCHEMA_VERSION_TABLE_NAME,
+                scope,
+                migration.version,
+                migration.name,
+                datetime.now(UTC).replace(tzinfo=None),
+            )
+        newly_applied.append(migration.version)
+    return newly_applied
@@ -1,17 +1,35 @@
 import gzip
+import hashlib
 import json
 import os
 import re
 import sys
-from dataclasses import dataclass
-from datetime import UTC, datetime
+import threading
+import time
+from bisect import bisect_right
+from collections import deque
+from collections.abc import Iterable, Iterator
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from dataclasses import dataclass, field
+from datetime import UTC, date, datetime
 
 import boto3
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 from botocore.exceptions import ClientError
 from dotenv import load_dotenv
 
-from duckdb_client import get_duckdb_client
+from blob_cache import get_blob_cache
+from duckdb_client import get_duckdb_client, get_pod_daily_range_macro_name
+from migrations import Migration, add_column, cluster_table, run_migrations
+from runtime_config import get_parsed_snapshot_cache_dir, get_project_root
 from utils import accounts_map, roles_arn_map
 
 
@@ -20,6 +38,46 @@ load_dotenv()
 DUCKDB_DATABASE = os.environ.get("DUCKDB_DATABASE", "database.duckdb")
 POD_MONTHLY_TABLE_NAME = os.environ.get("DUCKDB_POD_TABLE", "pod_monthly_trend")
 POD_DAILY_TABLE_NAME = os.environ.get("DUCKDB_POD_DAILY_TABLE", "pod_daily_trend")
+POD_SNAPSHOT_HASH_TABLE_NAME = os.environ.get(
+    "DUCKDB_POD_SNAPSHOT_HASH_TABLE", "pod_snapshot_hashes"
+)
+POD_DAILY_RUNS_TABLE_NAME = os.environ.get(
+    "DUCKDB_POD_DAILY_RUNS_TABLE", "pod_daily_runs"
+)
+POD_HOURLY_TABLE_NAME = os.environ.get("DUCKDB_POD_HOURLY_TABLE", "pod_hourly_trend")
+POD_BOOTSTRAP_PROGRESS_TABLE_NAME = os.environ.get(
+    "DUCKDB_POD_BOOTSTRAP_PROGRESS_TABLE", "pod_bootstrap_progress"
+)
+POD_BOOTSTRAP_SNAPSHOT_TABLE_NAME = os.environ.get(
+    "DUCKDB_POD_BOOTSTRAP_SNAPSHOT_TABLE", "pod_bootstrap_snapshots"
+)
+POD_MIGRATION_SCOPE = "pod"
+POD_MIGRATIONS = [
+    Migration(
+        1,
+        "cluster pod_daily_trend by tenant, date",
+        cluster_table(POD_DAILY_TABLE_NAME, "tenant, date"),
+    ),
+    Migration(
+        2,
+        "cluster pod_monthly_trend by tenant, month_start",
+        cluster_table(POD_MONTHLY_TABLE_NAME, "tenant, month_start"),
+    ),
+    Migration(
+        3,
+        "cluster pod_daily_runs by tenant, valid_from",
+        cluster_table(POD_DAILY_RUNS_TABLE_NAME, "tenant, valid_from"),
+    ),
+    Migration(
+        4,
+        "cluster pod_hourly_trend by tenant, ts",
+        cluster_table(POD_HOURLY_TABLE_NAME, "tenant, ts"),
+    ),
+]
+POD_CATALOG_TABLES = (
+    (POD_DAILY_TABLE_NAME, "date"),
+    (POD_MONTHLY_TABLE_NAME, "month_start"),
+)
 AWS_REGION = os.environ.get(
     "AWS_REGION", os.environ.get("AWS_DEFAULT_REGION", "eu-central-1")
 )
@@ -30,46 +88,274 @@ POD_BOOTSTRAP_START_YEAR = int(os.environ.get("POD_BOOTSTRAP_START_YEAR", "2024"
 POD_AWS_ROLE_SESSION_NAME = os.environ.get(
     "POD_AWS_ROLE_SESSION_NAME", "PodCollectorSession"
 )
+POD_SOURCES_CONFIG = os.environ.get(
+    "POD_SOURCES_CONFIG", str(get_project_root() / "config" / "pod_sources.json")
+)
+POD_SOURCE_MAX_CONCURRENCY = int(os.environ.get("POD_SOURCE_MAX_CONCURRENCY", "2"))
+POD_FETCH_MAX_WORKERS = int(os.environ.get("POD_FETCH_MAX_WORKERS", "16"))
+POD_VALIDATION_SAMPLE_SIZE = int(os.environ.get("POD_VALIDATION_SAMPLE_SIZE", "5"))
+POD_PARSE_WORKERS = int(os.environ.get("POD_PARSE_WORKERS", "0"))
+POD_PARSED_CACHE = os.environ.get("POD_PARSED_CACHE", "1").strip() != "0"
+PARSED_SNAPSHOT_CACHE_FORMAT = "1"
+POD_DAILY_STORAGE = os.environ.get("POD_DAILY_STORAGE", "full").strip().lower()
+POD_HOURLY_RETENTION_DAYS = int(os.environ.get("POD_HOURLY_RETENTION_DAYS", "35"))
+POD_HOURLY_COMPACT_AFTER_DAYS = int(
+    os.environ.get("POD_HOURLY_COMPACT_AFTER_DAYS", "7")
+)
+POD_HOURLY_REWRITE_HOURS = int(os.environ.get("POD_HOURLY_REWRITE_HOURS", "6"))
 PARTITION_YEAR_PATTERN = re.compile(r"(?:^|/)year=(\d{4})(?:/|$)")
 REQUIRED_SNAPSHOT_COLUMNS = ("date", "tenant", "source_backend", "pods", "onboarded")
+BOOTSTRAP_STATUS_LOADED = "loaded"
+BOOTSTRAP_STATUS_MISSING = "missing"
+DAILY_STORAGE_FULL = "full"
+DAILY_STORAGE_COMPACT = "compact"
+GRANULARITY_DAILY = "daily"
+GRANULARITY_HOURLY = "hourly"
+REBUILD_DERIVED_COMMAND = "rebuild-derived"
+DEFAULT_TENANT_SOURCE_KEYS = ("digiwatt", "fastweb", "sinapsi")
+TENANT_SOURCE_CONFIG_FIELDS = (
+    "source_key",
+    "bucket",
+    "prefix",
+    "filename",
+    "path_template",
+    "role_arn",
+    "account",
+    "max_concurrency",
+    "granularity",
+)
 
 
 @dataclass(frozen=True)
 class TenantSource:
     source_key: str
-    path_template_env: str
-    legacy_path_env: str
-    bucket_env: str
-    prefix_env: str
-    filename_env: str
-
-
-TENANT_SOURCES = (
-    TenantSource(
-        "digiwatt",
-        "POD_DIGIWATT_PATH_TEMPLATE",
-        "POD_DIGIWATT_PATHS",
-        "POD_DIGIWATT_S3_BUCKET",
-        "POD_DIGIWATT_S3_PREFIX",
-        "POD_DIGIWATT_SNAPSHOT_FILENAME",
-    ),
-    TenantSource(
-        "fastweb",
-        "POD_FASTWEB_PATH_TEMPLATE",
-        "POD_FASTWEB_PATHS",
-        "POD_FASTWEB_S3_BUCKET",
-        "POD_FASTWEB_S3_PREFIX",
-        "POD_FASTWEB_SNAPSHOT_FILENAME",
-    ),
-    TenantSource(
-        "sinapsi",
-        "POD_SINAPSI_PATH_TEMPLATE",
-        "POD_SINAPSI_PATHS",
-        "POD_SINAPSI_S3_BUCKET",
-        "POD_SINAPSI_S3_PREFIX",
-        "POD_SINAPSI_SNAPSHOT_FILENAME",
-    ),
-)
+    bucket: str | None = None
+    prefix: str | None = None
+    filename: str | None = None
+    path_template: str | None = None
+    role_arn: str | None = None
+    account: str | None = None
+    max_concurrency: int = POD_SOURCE_MAX_CONCURRENCY
+    granularity: str = GRANULARITY_DAILY
+
+    @property
+    def env_prefix(self) -> str:
+        return f"POD_{self.source_key.upper()}"
+
+    @property
+    def path_template_env(self) -> str:
+        return f"{self.env_prefix}_PATH_TEMPLATE"
+
+    @property
+    def legacy_path_env(self) -> str:
+        return f"{self.env_prefix}_PATHS"
+
+    @property
+    def bucket_env(self) -> str:
+        return f"{self.env_prefix}_S3_BUCKET"
+
+    @property
+    def prefix_env(self) -> str:
+        return f"{self.env_prefix}_S3_PREFIX"
+
+    @property
+    def filename_env(self) -> str:
+        return f"{self.env_prefix}_SNAPSHOT_FILENAME"
+
+    @property
+    def is_hourly(self) -> bool:
+        return self.granularity == GRANULARITY_HOURLY
+
+
+@dataclass
+class SourceMetrics:
+    source_key: str
+    files: int = 0
+    cached_files: int = 0
+    missing_files: int = 0
+    bytes_read: int = 0
+    rows: int = 0
+    fetch_seconds: float = 0.0
+    parse_seconds: float = 0.0
+
+    def summary(self) -> str:
+        return (
+            f"{self.source_key}: file={self.files}, da_cache={self.cached_files},"
+            f" mancanti={self.missing_files},"
+            f" bytes={self.bytes_read}, righe={self.rows},"
+            f" fetch={self.fetch_seconds:.2f}s, parse={self.parse_seconds:.2f}s"
+        )
+
+
+@dataclass(frozen=True)
+class SnapshotFile:
+    source: TenantSource
+    path: str
+    raw_bytes: bytes | None
+    content_encoding: str | None = None
+    version: str | None = None
+    columns: "SnapshotColumns | None" = None
+
+    @property
+    def is_missing(self) -> bool:
+        return self.raw_bytes is None and self.columns is None
+
+
+@dataclass(frozen=True)
+class SnapshotColumns:
+    source_backend: str
+    dates: np.ndarray
+    tenants: np.ndarray
+    pods: np.ndarray
+    onboarded: np.ndarray
+    parse_seconds: float = 0.0
+
+    @classmethod
+    def from_records(
+        cls, source_backend: str, records: list[dict], parse_seconds: float = 0.0
+    ) -> "SnapshotColumns":
+        return cls(
+            source_backend=source_backend,
+            parse_seconds=parse_seconds,
+            dates=np.array([record["date"] for record in records], dtype="datetime64[ns]"),
+            tenants=np.array([record["tenant"] for record in records], dtype=object),
+            pods=np.fromiter(
+                (record["pods"] for record in records), dtype=np.int64, count=len(records)
+            ),
+            onboarded=np.fromiter(
+                (record["onboarded"] for record in records),
+                dtype=np.int64,
+                count=len(records),
+            ),
+        )
+
+    @classmethod
+    def from_arrow(cls, source_backend: str, table: pa.Table) -> "SnapshotColumns":
+        return cls(
+            source_backend=source_backend,
+            dates=table.column("date").to_numpy(),
+            tenants=table.column("tenant").to_numpy(zero_copy_only=False),
+            pods=table.column("pods").to_numpy(),
+            onboarded=table.column("onboarded").to_numpy(),
+        )
+
+    def to_arrow(self) -> pa.Table:
+        return pa.table(
+            {
+                "date": pa.array(self.dates, type=pa.timestamp("ns")),
+                "tenant": pa.array(self.tenants, type=pa.string()),
+                "pods": pa.array(self.pods, type=pa.int64()),
+                "onboarded": pa.array(self.onboarded, type=pa.int64()),
+            },
+            metadata={"source_backend": self.source_backend},
+        )
+
+    def __len__(self) -> int:
+        return len(self.dates)
+
+
+@dataclass
+class SnapshotValidationReport:
+    total_rows: int = 0
+    invalid_rows: int = 0
+    negative_rows: int = 0
+    clamped_onboarded_rows: int = 0
+    duplicate_pairs: int = 0
+    conflicting_pairs: int = 0
+    negative_samples: list[tuple] = field(default_factory=list)
+    duplicate_samples: list[tuple] = field(default_factory=list)
+    conflict_samples: list[tuple] = field(default_factory=list)
+
+    @property
+    def has_errors(self) -> bool:
+        return bool(self.negative_rows or self.duplicate_pairs or self.conflicting_pairs)
+
+    def summary(self) -> str:
+        return (
+            f"righe={self.total_rows}, scartate={self.invalid_rows},"
+            f" negative={self.negative_rows},"
+            f" onboarded_clamped={self.clamped_onboarded_rows},"
+            f" coppie_duplicate={self.duplicate_pairs},"
+            f" coppie_in_conflitto={self.conflicting_pairs}"
+        )
+
+    def raise_for_errors(self) -> None:
+        if self.conflicting_pairs:
+            snapshot_date, tenant = self.conflict_samples[0]
+            raise ValueError(
+                "Trovati snapshot duplicati con valori diversi per la stessa coppia date/tenant: "
+                f"date={snapshot_date.date()} tenant={tenant}"
+                f" ({self.conflicting_pairs} coppie, esempi: {format_offenders(self.conflict_samples)})"
+            )
+        if self.duplicate_pairs:
+            snapshot_date, tenant = self.duplicate_samples[0]
+            raise ValueError(
+                "Trovati più snapshot per la stessa coppia date/tenant: "
+                f"date={snapshot_date.date()} tenant={tenant}. "
+                "Controlla i file annuali configurati."
+                f" ({self.duplicate_pairs} coppie, esempi: {format_offenders(self.duplicate_samples)})"
+            )
+        if self.negative_rows:
+            snapshot_date, tenant = self.negative_samples[0]
+            raise ValueError(
+                "Trovati snapshot con pods/onboarded negativi: "
+                f"date={snapshot_date.date()} tenant={tenant}"
+                f" ({self.negative_rows} righe, esempi: {format_offenders(self.negative_samples)})"
+            )
+
+
+def build_tenant_source(config: dict, defaults: dict | None = None) -> TenantSource:
+    values = {**(defaults or {}), **config}
+    unknown = sorted(set(values) - set(TENANT_SOURCE_CONFIG_FIELDS))
+    if unknown:
+        raise ValueError(
+            "Campi non supportati nella configurazione sorgenti pod: "
+            + ", ".join(unknown)
+        )
+    source_key = str(values.get("source_key") or "").strip()
+    if not source_key:
+        raise ValueError("Ogni sorgente pod configurata deve avere un source_key.")
+    values["source_key"] = source_key
+    values["max_concurrency"] = max(
+        1, int(values.get("max_concurrency", POD_SOURCE_MAX_CONCURRENCY))
+    )
+    values["granularity"] = (
+        str(values.get("granularity") or GRANULARITY_DAILY).strip().lower()
+    )
+    if values["granularity"] not in (GRANULARITY_DAILY, GRANULARITY_HOURLY):
+        raise ValueError(
+            f"Granularita' non supportata per la sorgente pod '{source_key}': "
+            f"{values['granularity']}. Valori ammessi: daily, hourly."
+        )
+    return TenantSource(**values)
+
+
+def load_tenant_sources(config_path: str = POD_SOURCES_CONFIG) -> tuple[TenantSource, ...]:
+    if not config_path or not os.path.exists(config_path):
+        return tuple(TenantSource(source_key) for source_key in DEFAULT_TENANT_SOURCE_KEYS)
+
+    with open(config_path, encoding="utf-8") as file_handle:
+        config = json.load(file_handle)
+    if not isinstance(config, dict) or not isinstance(config.get("sources"), list):
+        raise ValueError(
+            f"Il file '{config_path}' deve contenere un oggetto con la lista 'sources'."
+        )
+
+    defaults = config.get("defaults", {})
+    sources = tuple(
+        build_tenant_source(source_config, defaults)
+        for source_config in config["sources"]
+    )
+    source_keys = [source.source_key for source in sources]
+    duplicated = sorted({key for key in source_keys if source_keys.count(key) > 1})
+    if duplicated:
+        raise ValueError(
+            f"Source duplicate nel file '{config_path}': " + ", ".join(duplicated)
+        )
+    return sources
+
+
+TENANT_SOURCES = load_tenant_sources()
 
 
 def month_start(value) -> pd.Timestamp:
@@ -94,8 +380,13 @@ def parse_s3_uri(uri: str) -> tuple[str, str]:
     return bucket, key
 
 
-def assume_role(role_arn: str, session_name: str = POD_AWS_ROLE_SESSION_NAME) -> dict:
-    sts_client = boto3.client("sts", region_name=AWS_REGION)
+def assume_role(
+    role_arn: str,
+    session_name: str = POD_AWS_ROLE_SESSION_NAME,
+    session: boto3.session.Session | None = None,
+) -> dict:
+    session = session or boto3.session.Session()
+    sts_client = session.client("sts", region_name=AWS_REGION)
     resp = sts_client.assume_role(RoleArn=role_arn, RoleSessionName=session_name)
     creds = resp["Credentials"]
     return {
@@ -125,6 +416,8 @@ def get_source_account_name(source: TenantSource) -> str | None:
     explicit_account_name = os.environ.get(get_source_account_env_name(source))
     if explicit_account_name:
         return explicit_account_name
+    if source.account:
+        return source.account
 
     if source.source_key in roles_arn_map:
         return source.source_key
@@ -136,6 +429,8 @@ def get_source_role_arn(source: TenantSource) -> str | None:
     explicit_role_arn = os.environ.get(get_source_role_arn_env_name(source))
     if explicit_role_arn:
         return explicit_role_arn
+    if source.role_arn:
+        return source.role_arn
 
     account_name = get_source_account_name(source)
     if account_name is None:
@@ -148,30 +443,36 @@ def get_source_role_arn(source: TenantSource) -> str | None:
 
 
 def get_s3_client(source: TenantSource | None = None):
+    # I client vengono creati in parallelo dai thread di fetch delle sorgenti:
+    # ognuno usa una Session boto3 propria, perche' quella di default non e'
+    # thread-safe.
+    session = boto3.session.Session()
     if source is None:
-        return boto3.client("s3", region_name=AWS_REGION)
+        return session.client("s3", region_name=AWS_REGION)
 
     role_arn = get_source_role_arn(source)
     if role_arn is None:
-        return boto3.client("s3", region_name=AWS_REGION)
+        return session.client("s3", region_name=AWS_REGION)
 
     print(
         f"AssumeRole per source={source.source_key}: role_arn={role_arn}",
         file=sys.stderr,
     )
-    return boto3.client("s3", **assume_role(role_arn))
+    return session.client("s3", **assume_role(role_arn, session=session))
 
 
 def get_source_bucket(source: TenantSource) -> str:
-    return os.environ.get(source.bucket_env, POD_S3_BUCKET)
+    return os.environ.get(source.bucket_env, source.bucket or POD_S3_BUCKET)
 
 
 def get_source_prefix(source: TenantSource) -> str:
-    return os.environ.get(source.prefix_env, POD_S3_PREFIX).strip("/")
+    return os.environ.get(source.prefix_env, source.prefix or POD_S3_PREFIX).strip("/")
 
 
 def get_source_snapshot_filename(source: TenantSource) -> str:
-    return os.environ.get(source.filename_env, POD_SNAPSHOT_FILENAME)
+    return os.environ.get(
+        source.filename_env, source.filename or POD_SNAPSHOT_FILENAME
+    )
 
 
 def get_default_path_template(source: TenantSource) -> str:
@@ -184,7 +485,10 @@ def get_default_path_template(source: TenantSource) -> str:
 def get_path_template(source: TenantSource) -> str:
     template = os.environ.get(
         source.path_template_env,
-        os.environ.get(source.legacy_path_env, get_default_path_template(source)),
+        os.environ.get(
+            source.legacy_path_env,
+            source.path_template or get_default_path_template(source),
+        ),
     )
     if "{year}" not in template:
         raise ValueError(
@@ -228,7 +532,9 @@ def maybe_decompress(
     return raw_bytes.decode("utf-8")
 
 
-def read_json_payload(path: str, s3_client, source_key: str | None = None) -> dict:
+def read_snapshot_bytes(
+    path: str, s3_client, source_key: str | None = None, head: dict | None = None
+) -> tuple[bytes, str | None]:
     bucket: str | None = None
     key: str | None = None
     source_label = source_key or "unknown"
@@ -240,33 +546,105 @@ def read_json_payload(path: str, s3_client, source_key: str | None = None) -> di
                 f" source={source_label}, bucket={bucket}, key={key}, path={path}",
                 file=sys.stderr,
             )
+            blob_cache = get_blob_cache()
+            if blob_cache is not None:
+                return blob_cache.read_bytes(s3_client, bucket, key, head=head)
             response = s3_client.get_object(Bucket=bucket, Key=key)
-            raw_content = maybe_decompress(
-                response["Body"].read(),
-                path,
-                content_encoding=response.get("ContentEncoding"),
-            )
-        else:
-            print(
-                f"Lettura snapshot locale: source={source_label}, path={path}",
-                file=sys.stderr,
-            )
-            with open(path, "rb") as file_handle:
-                raw_content = maybe_decompress(file_handle.read(), path)
+            return response["Body"].read(), response.get("ContentEncoding")
+
+        print(
+            f"Lettura snapshot locale: source={source_label}, path={path}",
+            file=sys.stderr,
+        )
+        with open(path, "rb") as file_handle:
+            return file_handle.read(), None
     except ClientError as exc:
-        error_code = exc.response.get("Error", {}).get("Code")
-        if bucket is not None and key is not None:
-            print(
-                "Errore S3 leggendo snapshot:"
-                f" source={source_label}, bucket={bucket}, key={key}, path={path},"
-                f" code={error_code or 'unknown'}",
-                file=sys.stderr,
-            )
-        if error_code in {"NoSuchKey", "404"}:
-            raise FileNotFoundError(f"File snapshot non trovato: {path}") from exc
-        raise
+        raise_snapshot_client_error(exc, path, bucket, key, source_label)
+
+
+def raise_snapshot_client_error(
+    exc: ClientError,
+    path: str,
+    bucket: str | None,
+    key: str | None,
+    source_label: str,
+):
+    error_code = exc.response.get("Error", {}).get("Code")
+    if bucket is not None and key is not None:
+        print(
+            "Errore S3 leggendo snapshot:"
+            f" source={source_label}, bucket={bucket}, key={key}, path={path},"
+            f" code={error_code or 'unknown'}",
+            file=sys.stderr,
+        )
+    if error_code in {"NoSuchKey", "404"}:
+        raise FileNotFoundError(f"File snapshot non trovato: {path}") from exc
+    raise exc
+
+
+def read_snapshot_head(
+    path: str, s3_client, source_key: str | None = None
+) -> dict | None:
+    if not is_s3_path(path):
+        return None
+
+    bucket, key = parse_s3_uri(path)
+    try:
+        return s3_client.head_object(Bucket=bucket, Key=key)
+    except ClientError as exc:
+        raise_snapshot_client_error(exc, path, bucket, key, source_key or "unknown")
+
+
+def read_snapshot_version(
+    path: str, s3_client, source_key: str | None = None, head: dict | None = None
+) -> str:
+    if not is_s3_path(path):
+        stat = os.stat(path)
+        return f"{stat.st_size}-{stat.st_mtime_ns}"
 
-    payload = json.loads(raw_content)
+    if head is None:
+        head = read_snapshot_head(path, s3_client, source_key=source_key)
+    return head["ETag"].strip().strip('"')
+
+
+def get_parsed_snapshot_path(path: str, version: str):
+    path_digest = hashlib.sha256(path.encode()).hexdigest()[:32]
+    version_digest = hashlib.sha256(
+        f"{PARSED_SNAPSHOT_CACHE_FORMAT}\0{version}".encode()
+    ).hexdigest()[:16]
+    return get_parsed_snapshot_cache_dir() / f"{path_digest}-{version_digest}.parquet"
+
+
+def read_parsed_snapshot(
+    source_key: str, path: str, version: str
+) -> SnapshotColumns | None:
+    cache_path = get_parsed_snapshot_path(path, version)
+    try:
+        table = pq.read_table(cache_path, memory_map=True)
+    except (FileNotFoundError, pa.ArrowInvalid):
+        return None
+    return SnapshotColumns.from_arrow(source_key, table)
+
+
+def write_parsed_snapshot(path: str, version: str, columns: SnapshotColumns) -> None:
+    # Una sola versione per path: le versioni precedenti vengono rimosse.
+    cache_path = get_parsed_snapshot_path(path, version)
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = cache_path.with_name(f"{cache_path.name}.{os.getpid()}.tmp")
+    pq.write_table(columns.to_arrow(), tmp_path)
+    tmp_path.replace(cache_path)
+    path_prefix = cache_path.name.split("-", 1)[0]
+    for stale_path in cache_path.parent.glob(f"{path_prefix}-*.parquet"):
+        if stale_path != cache_path:
+            stale_path.unlink(missing_ok=True)
+
+
+def decode_json_payload(
+    raw_bytes: bytes, path: str, content_encoding: str | None = None
+) -> dict:
+    payload = json.loads(
+        maybe_decompress(raw_bytes, path, content_encoding=content_encoding)
+    )
     if not isinstance(payload, dict):
         raise ValueError(
             f"Il file '{path}' deve contenere un oggetto JSON al top level."
@@ -274,6 +652,13 @@ def read_json_payload(path: str, s3_client, source_key: str | None = None) -> di
     return payload
 
 
+def read_json_payload(path: str, s3_client, source_key: str | None = None) -> dict:
+    raw_bytes, content_encoding = read_snapshot_bytes(
+        path, s3_client, source_key=source_key
+    )
+    return decode_json_payload(raw_bytes, path, content_encoding=content_encoding)
+
+
 def get_partition_year(path: str) -> int | None:
     match = PARTITION_YEAR_PATTERN.search(path)
     if match is None:
@@ -294,7 +679,12 @@ def flatten_snapshot_payload(
         if pd.isna(parsed_date):
             raise ValueError(f"Data non valida '{raw_date}' nel file '{source_path}'")
 
-        snapshot_date = parsed_date.tz_convert(None).normalize()
+        # Le sorgenti orarie mantengono l'ora; il rollup giornaliero avviene
+        # dopo il parsing (vedi rollup_daily_columns).
+        if source.is_hourly:
+            snapshot_date = parsed_date.tz_convert(None).floor("h")
+        else:
+            snapshot_date = parsed_date.tz_convert(None).normalize()
         if partition_year is not None and snapshot_date.year != partition_year:
             raise ValueError(
                 f"Data {snapshot_date.date()} non coerente con partizione year={partition_year} in '{source_path}'"
@@ -369,54 +759,341 @@ def flatten_snapshot_payload(
     return records
 
 
-def load_snapshot_df(
-    input_paths_by_source: dict[str, list[str]],
-    skip_missing_leading_paths: bool = False,
-) -> tuple[pd.DataFrame, dict[str, list[str]]]:
-    source_by_key = {source.source_key: source for source in TENANT_SOURCES}
-    records: list[dict] = []
-    loaded_paths_by_source = {
-        source_key: [] for source_key in input_paths_by_source.keys()
-    }
+class SourceFetcher:
+    # Scarica i file di una singola sorgente con al massimo max_concurrency
+    # richieste in volo e li restituisce nell'ordine dei path configurati.
+    def __init__(
+        self,
+        source: TenantSource,
+        paths: list[str],
+        metrics: SourceMetrics,
+        global_slots: threading.BoundedSemaphore,
+        skip_missing_leading_paths: bool,
+        found_snapshot: bool,
+    ) -> None:
+        self.source = source
+        self.remaining_paths = deque(paths)
+        self.metrics = metrics
+        self.global_slots = global_slots
+        self.skip_missing_leading_paths = skip_missing_leading_paths
+        self.found_snapshot = found_snapshot
+        self.pending: deque = deque()
+        self.executor = ThreadPoolExecutor(
+            max_workers=source.max_concurrency,
+            thread_name_prefix=f"pod-fetch-{source.source_key}",
+        )
+        self.client_future = None
+
+    def fill(self) -> None:
+        while self.remaining_paths and len(self.pending) < self.source.max_concurrency:
+            if self.client_future is None:
+                self.client_future = self.executor.submit(get_s3_client, self.source)
+            path = self.remaining_paths.popleft()
+            self.pending.append((path, self.executor.submit(self.fetch, path)))
+
+    def fetch(self, path: str) -> tuple[SnapshotFile, float]:
+        s3_client = self.client_future.result()
+        source_key = self.source.source_key
+        with self.global_slots:
+            started_at = time.perf_counter()
+            version = None
+            head = None
+            if POD_PARSED_CACHE:
+                # La granularita' cambia il risultato del parsing: fa parte
+                # della chiave della cache parsed. La HEAD letta per la
+                # versione serve anche alla blob cache in caso di miss.
+                head = read_snapshot_head(path, s3_client, source_key=source_key)
+                version = "-".join(
+                    (
+                        self.source.granularity,
+                        read_snapshot_version(
+                            path, s3_client, source_key=source_key, head=head
+                        ),
+                    )
+                )
+                columns = read_parsed_snapshot(source_key, path, version)
+                if columns is not None:
+                    print(
+                        f"Snapshot letto da cache parsed: source={source_key}, path={path}",
+                        file=sys.stderr,
+                    )
+                    snapshot_file = SnapshotFile(
+                        self.source, path, None, version=version, columns=columns
+                    )
+                    return snapshot_file, time.perf_counter() - started_at
+            raw_bytes, content_encoding = read_snapshot_bytes(
+                path, s3_client, source_key=source_key, head=head
+            )
+            snapshot_file = SnapshotFile(
+                self.source, path, raw_bytes, content_encoding, version=version
+            )
+            return snapshot_file, time.perf_counter() - started_at
 
-    for source_key, input_paths in input_paths_by_source.items():
-        source = source_by_key[source_key]
-        s3_client = get_s3_client(source)
-        found_snapshot_for_source = False
-        for path in input_paths:
+    def has_pending(self) -> bool:
+        return bool(self.pending or self.remaining_paths)
+
+    def head_future(self):
+        return self.pending[0][1] if self.pending else None
+
+    def pop_ready(self) -> Iterator[SnapshotFile]:
+        while self.pending and self.pending[0][1].done():
+            path, future = self.pending.popleft()
             try:
-                payload = read_json_payload(path, s3_client, source_key=source_key)
+                snapshot_file, elapsed = future.result()
             except FileNotFoundError:
-                if skip_missing_leading_paths and not found_snapshot_for_source:
+                if self.skip_missing_leading_paths and not self.found_snapshot:
                     print(
                         "Snapshot non trovato durante bootstrap,"
-                        f" salto path iniziale per source={source_key}: {path}",
+                        f" salto path iniziale per source={self.source.source_key}: {path}",
                         file=sys.stderr,
                     )
+                    self.metrics.missing_files += 1
+                    yield SnapshotFile(self.source, path, None)
                     continue
                 raise
-            found_snapshot_for_source = True
-            loaded_paths_by_source[source_key].append(path)
-            records.extend(flatten_snapshot_payload(payload, path, source))
+            self.found_snapshot = True
+            self.metrics.files += 1
+            if snapshot_file.columns is not None:
+                self.metrics.cached_files += 1
+            else:
+                self.metrics.bytes_read += len(snapshot_file.raw_bytes)
+            self.metrics.fetch_seconds += elapsed
+            yield snapshot_file
+        self.fill()
 
-        if skip_missing_leading_paths and not found_snapshot_for_source:
-            print(
-                "Nessuno snapshot trovato per source="
-                f"{source_key} negli anni richiesti; source ignorata.",
-                file=sys.stderr,
+    def close(self) -> None:
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def fetch_snapshot_files(
+    input_paths_by_source: dict[str, list[str]],
+    skip_missing_leading_paths: bool = False,
+    sources_with_snapshots: frozenset[str] = frozenset(),
+    metrics: dict[str, SourceMetrics] | None = None,
+) -> Iterator[SnapshotFile]:
+    # Le sorgenti vengono scaricate in parallelo, ognuna col proprio limite di
+    # concorrenza. I path iniziali mancanti tollerati vengono restituiti con
+    # raw_bytes=None cosi' il chiamante puo' registrarli.
+    source_by_key = {source.source_key: source for source in TENANT_SOURCES}
+    metrics = {} if metrics is None else metrics
+    global_slots = threading.BoundedSemaphore(max(1, POD_FETCH_MAX_WORKERS))
+    fetchers = [
+        SourceFetcher(
+            source_by_key[source_key],
+            input_paths,
+            metrics.setdefault(source_key, SourceMetrics(source_key)),
+            global_slots,
+            skip_missing_leading_paths,
+            source_key in sources_with_snapshots,
+        )
+        for source_key, input_paths in input_paths_by_source.items()
+    ]
+    try:
+        for fetcher in fetchers:
+            fetcher.fill()
+        active = [fetcher for fetcher in fetchers if fetcher.has_pending()]
+        while active:
+            wait(
+                [fetcher.head_future() for fetcher in active],
+                return_when=FIRST_COMPLETED,
             )
+            for fetcher in active:
+                yield from fetcher.pop_ready()
+            active = [fetcher for fetcher in active if fetcher.has_pending()]
+    finally:
+        for fetcher in fetchers:
+            fetcher.close()
+
+    if skip_missing_leading_paths:
+        for fetcher in fetchers:
+            if not fetcher.found_snapshot:
+                print(
+                    "Nessuno snapshot trovato per source="
+                    f"{fetcher.source.source_key} negli anni richiesti; source ignorata.",
+                    file=sys.stderr,
+                )
+
+
+def parse_snapshot_file(snapshot_file: SnapshotFile) -> SnapshotColumns:
+    started_at = time.perf_counter()
+    payload = decode_json_payload(
+        snapshot_file.raw_bytes,
+        snapshot_file.path,
+        content_encoding=snapshot_file.content_encoding,
+    )
+    records = flatten_snapshot_payload(payload, snapshot_file.path, snapshot_file.source)
+    columns = SnapshotColumns.from_records(
+        snapshot_file.source.source_key,
+        records,
+        parse_seconds=time.perf_counter() - started_at,
+    )
+    if snapshot_file.version is not None:
+        write_parsed_snapshot(snapshot_file.path, snapshot_file.version, columns)
+    return columns
+
+
+def record_parsed_snapshot(
+    metrics: dict[str, SourceMetrics] | None, columns: SnapshotColumns
+) -> None:
+    if metrics is None:
+        return
+    source_metrics = metrics.setdefault(
+        columns.source_backend, SourceMetrics(columns.source_backend)
+    )
+    source_metrics.rows += len(columns)
+    source_metrics.parse_seconds += columns.parse_seconds
+
+
+def parse_snapshot_files(
+    snapshot_files: Iterable[SnapshotFile],
+    workers: int = POD_PARSE_WORKERS,
+) -> Iterator[tuple[SnapshotFile, SnapshotColumns | None]]:
+    # Con workers > 1 decodifica e flatten girano in un ProcessPoolExecutor;
+    # i risultati vengono restituiti nell'ordine di input.
+    # I file gia' presenti nella cache parsed vengono restituiti senza parsing.
+    if workers <= 1:
+        for snapshot_file in snapshot_files:
+            if snapshot_file.is_missing:
+                yield snapshot_file, None
+            elif snapshot_file.columns is not None:
+                yield snapshot_file, snapshot_file.columns
+            else:
+                yield snapshot_file, parse_snapshot_file(snapshot_file)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for snapshot_file in snapshot_files:
+            result = snapshot_file.columns
+            if snapshot_file.raw_bytes is not None:
+                result = executor.submit(parse_snapshot_file, snapshot_file)
+            pending.append((snapshot_file.path, snapshot_file.source, result))
+            if len(pending) >= workers * 2:
+                yield resolve_parsed_snapshot(*pending.popleft())
+        while pending:
+            yield resolve_parsed_snapshot(*pending.popleft())
+
+
+def resolve_parsed_snapshot(
+    path: str, source: TenantSource, result
+) -> tuple[SnapshotFile, SnapshotColumns | None]:
+    snapshot_file = SnapshotFile(source, path, None)
+    if result is None or isinstance(result, SnapshotColumns):
+        return snapshot_file, result
+    return snapshot_file, result.result()
+
+
+def merge_snapshot_columns(columns_list: list[SnapshotColumns]) -> pd.DataFrame:
+    columns_list = [columns for columns in columns_list if len(columns)]
+    if not columns_list:
+        return pd.DataFrame(columns=list(REQUIRED_SNAPSHOT_COLUMNS))
+    return pd.DataFrame(
+        {
+            "date": np.concatenate([columns.dates for columns in columns_list]),
+            "tenant": np.concatenate([columns.tenants for columns in columns_list]),
+            "source_backend": np.repeat(
+                [columns.source_backend for columns in columns_list],
+                [len(columns) for columns in columns_list],
+            ),
+            "pods": np.concatenate([columns.pods for columns in columns_list]),
+            "onboarded": np.concatenate(
+                [columns.onboarded for columns in columns_list]
+            ),
+        },
+        columns=list(REQUIRED_SNAPSHOT_COLUMNS),
+    )
+
+
+def rollup_daily_columns(columns: SnapshotColumns) -> SnapshotColumns:
+    # Il valore giornaliero di una sorgente oraria e' l'ultimo snapshot del
+    # giorno per ogni tenant.
+    if not len(columns):
+        return columns
+    frame = pd.DataFrame(
+        {
+            "ts": columns.dates,
+            "tenant": columns.tenants,
+            "pods": columns.pods,
+            "onboarded": columns.onboarded,
+        }
+    )
+    frame["date"] = frame["ts"].dt.floor("D")
+    frame.sort_values(["tenant", "ts"], inplace=True, kind="stable")
+    frame.drop_duplicates(["date", "tenant"], keep="last", inplace=True)
+    return SnapshotColumns(
+        source_backend=columns.source_backend,
+        dates=frame["date"].to_numpy(),
+        tenants=frame["tenant"].to_numpy(),
+        pods=frame["pods"].to_numpy(),
+        onboarded=frame["onboarded"].to_numpy(),
+        parse_seconds=columns.parse_seconds,
+    )
+
 
-    if not records:
-        return pd.DataFrame(columns=list(REQUIRED_SNAPSHOT_COLUMNS)), loaded_paths_by_source
+def load_snapshot_df(
+    input_paths_by_source: dict[str, list[str]],
+    skip_missing_leading_paths: bool = False,
+    metrics: dict[str, SourceMetrics] | None = None,
+    hourly_columns: list[SnapshotColumns] | None = None,
+) -> tuple[pd.DataFrame, dict[str, list[str]]]:
+    columns_list: list[SnapshotColumns] = []
+    loaded_paths_by_source = {
+        source_key: [] for source_key in input_paths_by_source.keys()
+    }
+
+    snapshot_files = fetch_snapshot_files(
+        input_paths_by_source,
+        skip_missing_leading_paths=skip_missing_leading_paths,
+        metrics=metrics,
+    )
+    for snapshot_file, columns in parse_snapshot_files(snapshot_files):
+        if columns is None:
+            continue
+        record_parsed_snapshot(metrics, columns)
+        loaded_paths_by_source[snapshot_file.source.source_key].append(
+            snapshot_file.path
+        )
+        if snapshot_file.source.is_hourly:
+            if hourly_columns is not None:
+                hourly_columns.append(columns)
+            columns = rollup_daily_columns(columns)
+        columns_list.append(columns)
+
+    return merge_snapshot_columns(columns_list), loaded_paths_by_source
+
+
+def format_offenders(samples: list[tuple]) -> str:
+    return ", ".join(f"{snapshot_date.date()}/{tenant}" for snapshot_date, tenant in samples)
+
+
+def _coerce_snapshot_dates(values: pd.Series, frequency: str = "D") -> pd.Series:
+    if pd.api.types.is_datetime64_dtype(values.dtype):
+        return values.dt.floor(frequency)
     return (
-        pd.DataFrame.from_records(records, columns=list(REQUIRED_SNAPSHOT_COLUMNS)),
-        loaded_paths_by_source,
+        pd.to_datetime(values, utc=True, errors="coerce")
+        .dt.tz_convert(None)
+        .dt.floor(frequency)
     )
 
 
-def normalize_snapshot_df(snapshot_df: pd.DataFrame) -> pd.DataFrame:
+def _coerce_snapshot_numbers(values: pd.Series) -> pd.Series:
+    if pd.api.types.is_integer_dtype(values.dtype):
+        return values
+    return pd.to_numeric(values, errors="coerce")
+
+
+def _sample_keys(dates: pd.Series, tenants: pd.Series, limit: int) -> list[tuple]:
+    return list(zip(dates.head(limit), tenants.head(limit)))
+
+
+def validate_snapshot_df(
+    snapshot_df: pd.DataFrame,
+    max_offenders: int = POD_VALIDATION_SAMPLE_SIZE,
+    frequency: str = "D",
+) -> tuple[pd.DataFrame, SnapshotValidationReport]:
+    report = SnapshotValidationReport(total_rows=len(snapshot_df))
     if snapshot_df.empty:
-        return pd.DataFrame(columns=list(REQUIRED_SNAPSHOT_COLUMNS))
+        return pd.DataFrame(columns=list(REQUIRED_SNAPSHOT_COLUMNS)), report
 
     missing = [
         column
@@ -430,64 +1107,93 @@ def normalize_snapshot_df(snapshot_df: pd.DataFrame) -> pd.DataFrame:
             + ". Attese: date, tenant, source_backend, pods, onboarded."
         )
 
-    normalized = snapshot_df.loc[:, list(REQUIRED_SNAPSHOT_COLUMNS)].copy()
-    normalized["date"] = (
-        pd.to_datetime(normalized["date"], utc=True, errors="coerce")
-        .dt.tz_convert(None)
-        .dt.normalize()
+    # Ogni colonna viene convertita una sola volta; il frame normalizzato
+    # viene costruito direttamente dalle colonne valide.
+    dates = _coerce_snapshot_dates(snapshot_df["date"], frequency)
+    tenants = snapshot_df["tenant"].astype("string").str.strip()
+    sources = snapshot_df["source_backend"].astype("string").str.strip()
+    pods = _coerce_snapshot_numbers(snapshot_df["pods"])
+    onboarded = _coerce_snapshot_numbers(snapshot_df["onboarded"])
+
+    valid = (
+        dates.notna()
+        & tenants.notna()
+        & sources.notna()
+        & pods.notna()
+        & onboarded.notna()
     )
-    normalized["tenant"] = normalized["tenant"].astype("string").str.strip()
-    normalized["source_backend"] = (
-        normalized["source_backend"].astype("string").str.strip()
+    valid &= (tenants != "").fillna(False) & (sources != "").fillna(False)
+    report.invalid_rows = int((~valid).sum())
+    if not valid.any():
+        return pd.DataFrame(columns=list(REQUIRED_SNAPSHOT_COLUMNS)), report
+
+    normalized = pd.DataFrame(
+        {
+            "date": dates[valid],
+            "tenant": tenants[valid],
+            "source_backend": sources[valid],
+            "pods": pods[valid].astype("int64"),
+            "onboarded": onboarded[valid].astype("int64"),
+        },
+        columns=list(REQUIRED_SNAPSHOT_COLUMNS),
     )
-    normalized["pods"] = pd.to_numeric(normalized["pods"], errors="coerce")
-    normalized["onboarded"] = pd.to_numeric(normalized["onboarded"], errors="coerce")
-    normalized = normalized.dropna(
-        subset=["date", "tenant", "source_backend", "pods", "onboarded"]
+    normalized.sort_values(
+        ["date", "tenant", "source_backend"], inplace=True, ignore_index=True
     )
-    normalized = normalized[
-        (normalized["tenant"] != "") & (normalized["source_backend"] != "")
-    ]
-
-    if normalized.empty:
-        return pd.DataFrame(columns=list(REQUIRED_SNAPSHOT_COLUMNS))
 
-    normalized["pods"] = normalized["pods"].astype("int64")
-    normalized["onboarded"] = normalized["onboarded"].astype("int64")
-    normalized["onboarded"] = normalized[["onboarded", "pods"]].min(axis=1)
-    normalized = normalized.sort_values(
-        ["date", "tenant", "source_backend"]
-    ).reset_index(drop=True)
+    pods_values = normalized["pods"].to_numpy()
+    onboarded_values = normalized["onboarded"].to_numpy()
+    negative = (pods_values < 0) | (onboarded_values < 0)
+    clamped = onboarded_values > pods_values
+    report.negative_rows = int(negative.sum())
+    report.clamped_onboarded_rows = int(clamped.sum())
+    if report.clamped_onboarded_rows:
+        onboarded_values = np.minimum(onboarded_values, pods_values)
+        normalized["onboarded"] = onboarded_values
+    if report.negative_rows:
+        report.negative_samples = _sample_keys(
+            normalized.loc[negative, "date"],
+            normalized.loc[negative, "tenant"],
+            max_offenders,
+        )
 
-    conflicts = normalized.groupby(["date", "tenant"], as_index=False).agg(
-        distinct_pods=("pods", "nunique"),
-        distinct_onboarded=("onboarded", "nunique"),
-    )
-    conflicts = conflicts[
-        (conflicts["distinct_pods"] > 1) | (conflicts["distinct_onboarded"] > 1)
-    ]
-    if not conflicts.empty:
-        sample = conflicts.iloc[0]
-        raise ValueError(
-            "Trovati snapshot duplicati con valori diversi per la stessa coppia date/tenant: "
-            f"date={sample['date'].date()} tenant={sample['tenant']}"
+    # Dopo l'ordinamento le righe con la stessa coppia date/tenant sono
+    # adiacenti: basta confrontare ogni riga con la precedente.
+    same_key = np.zeros(len(normalized), dtype=bool)
+    different_values = np.zeros(len(normalized), dtype=bool)
+    if len(normalized) > 1:
+        date_values = normalized["date"].to_numpy()
+        tenant_values = normalized["tenant"].to_numpy()
+        same_key[1:] = (date_values[1:] == date_values[:-1]) & (
+            tenant_values[1:] == tenant_values[:-1]
+        )
+        different_values[1:] = (pods_values[1:] != pods_values[:-1]) | (
+            onboarded_values[1:] != onboarded_values[:-1]
         )
 
-    duplicates = (
-        normalized.groupby(["date", "tenant"], as_index=False)
-        .size()
-        .rename(columns={"size": "count_rows"})
-    )
-    duplicates = duplicates[duplicates["count_rows"] > 1]
-    if not duplicates.empty:
-        sample = duplicates.iloc[0]
-        raise ValueError(
-            "Trovati più snapshot per la stessa coppia date/tenant: "
-            f"date={sample['date'].date()} tenant={sample['tenant']}. "
-            "Controlla i file annuali configurati."
+    if same_key.any():
+        duplicate_keys = normalized.loc[same_key, ["date", "tenant"]].drop_duplicates()
+        report.duplicate_pairs = len(duplicate_keys)
+        report.duplicate_samples = _sample_keys(
+            duplicate_keys["date"], duplicate_keys["tenant"], max_offenders
         )
+        conflicting = same_key & different_values
+        if conflicting.any():
+            conflict_keys = normalized.loc[
+                conflicting, ["date", "tenant"]
+            ].drop_duplicates()
+            report.conflicting_pairs = len(conflict_keys)
+            report.conflict_samples = _sample_keys(
+                conflict_keys["date"], conflict_keys["tenant"], max_offenders
+            )
+
+    return normalized, report
+
 
-    return normalized.reset_index(drop=True)
+def normalize_snapshot_df(snapshot_df: pd.DataFrame, frequency: str = "D") -> pd.DataFrame:
+    normalized, report = validate_snapshot_df(snapshot_df, frequency=frequency)
+    report.raise_for_errors()
+    return normalized
 
 
 def build_daily_rows(
@@ -581,6 +1287,19 @@ def build_monthly_rows(
     ]
 
 
+def ensure_pod_catalog(duckdb) -> None:
+    duckdb.create_catalog_table()
+    for table_name, date_column in POD_CATALOG_TABLES:
+        duckdb.ensure_catalog(table_name, "source_backend", date_column)
+
+
+def refresh_pod_catalog(duckdb, from_date=None) -> None:
+    for table_name, date_column in POD_CATALOG_TABLES:
+        duckdb.refresh_catalog(
+            table_name, "source_backend", date_column, from_date=from_date
+        )
+
+
 def get_latest_loaded_date(duckdb) -> pd.Timestamp | None:
     latest_date = duckdb.get_latest_date(POD_DAILY_TABLE_NAME)
     if latest_date is not None:
@@ -644,9 +1363,258 @@ def get_previous_month_values(
 
 
 def replace_all_rows(duckdb, table_name: str, rows: list[tuple]) -> None:
-    duckdb.execute(f"DELETE FROM {table_name}")
-    if rows:
-        duckdb.insert_many(table_name, rows)
+    duckdb.replace_rows(table_name, rows)
+
+
+def is_compact_daily_storage() -> bool:
+    return POD_DAILY_STORAGE == DAILY_STORAGE_COMPACT
+
+
+def insert_daily_runs(duckdb, source_relation: str) -> None:
+    # Giorni consecutivi con gli stessi valori per tenant diventano un unico
+    # run: nella partizione per valori, date - ROW_NUMBER() e' costante
+    # finche' i giorni sono contigui.
+    duckdb.execute(
+        f"""
+        INSERT INTO {POD_DAILY_RUNS_TABLE_NAME} (
+            tenant, source_backend, valid_from, valid_to,
+            total_pods, onboarded_pods, updated_at
+        )
+        SELECT
+            tenant,
+            source_backend,
+            MIN(date) AS valid_from,
+            MAX(date) AS valid_to,
+            total_pods,
+            onboarded_pods,
+            MAX(updated_at) AS updated_at
+        FROM (
+            SELECT
+                date,
+                tenant,
+                source_backend,
+                total_pods,
+                onboarded_pods,
+                updated_at,
+                date - CAST(
+                    ROW_NUMBER() OVER (
+                        PARTITION BY tenant, source_backend, total_pods, onboarded_pods
+                        ORDER BY date
+                    ) AS INTEGER
+                ) AS run_key
+            FROM {source_relation}
+        )
+        GROUP BY tenant, source_backend, total_pods, onboarded_pods, run_key
+        """
+    )
+    refresh_daily_run_deltas(duckdb)
+
+
+def refresh_daily_run_deltas(duckdb) -> None:
+    # Il delta giornaliero di un run e' la differenza con il run precedente
+    # dello stesso tenant (0 se manca): ricalcolarlo sui run, molto meno
+    # numerosi dei giorni, evita la finestra nella vista. Si aggiornano solo
+    # i run il cui delta e' cambiato.
+    duckdb.execute(
+        f"""
+        UPDATE {POD_DAILY_RUNS_TABLE_NAME} AS runs
+        SET
+            daily_delta = deltas.daily_delta,
+            daily_onboarded_delta = deltas.daily_onboarded_delta
+        FROM (
+            SELECT
+                tenant,
+                valid_from,
+                total_pods - COALESCE(LAG(total_pods) OVER tenant_runs, 0)
+                    AS daily_delta,
+                onboarded_pods - COALESCE(LAG(onboarded_pods) OVER tenant_runs, 0)
+                    AS daily_onboarded_delta
+            FROM {POD_DAILY_RUNS_TABLE_NAME}
+            WINDOW tenant_runs AS (PARTITION BY tenant ORDER BY valid_from)
+        ) AS deltas
+        WHERE runs.tenant = deltas.tenant
+          AND runs.valid_from = deltas.valid_from
+          AND (
+              runs.daily_delta IS DISTINCT FROM deltas.daily_delta
+              OR runs.daily_onboarded_delta IS DISTINCT FROM deltas.daily_onboarded_delta
+          )
+        """
+    )
+
+
+def stage_daily_rows(duckdb, rows: list[tuple]) -> None:
+    duckdb.execute(
+        """
+        CREATE OR REPLACE TEMP TABLE pod_daily_run_rows (
+            date DATE,
+            tenant VARCHAR,
+            source_backend VARCHAR,
+            daily_delta BIGINT,
+            total_pods BIGINT,
+            daily_onboarded_delta BIGINT,
+            onboarded_pods BIGINT,
+            updated_at TIMESTAMP
+        )
+        """
+    )
+    duckdb.append_rows("pod_daily_run_rows", rows)
+
+
+def ensure_daily_storage(duckdb) -> None:
+    # In modalita' compact pod_daily_trend e' una vista sui run di
+    # pod_daily_runs; cambiando modalita' i dati esistenti vengono convertiti.
+    if POD_DAILY_STORAGE not in (DAILY_STORAGE_FULL, DAILY_STORAGE_COMPACT):
+        raise ValueError(
+            f"POD_DAILY_STORAGE non supportato: {POD_DAILY_STORAGE}."
+            " Valori ammessi: full, compact."
+        )
+    relation_type = duckdb.get_relation_type(POD_DAILY_TABLE_NAME)
+
+    if not is_compact_daily_storage():
+        if relation_type != "VIEW":
+            duckdb.create_pod_daily_trend_table(POD_DAILY_TABLE_NAME)
+            return
+        with duckdb.transaction():
+            duckdb.execute(
+                f"""
+                CREATE OR REPLACE TEMP TABLE pod_daily_expanded AS
+                SELECT * FROM {POD_DAILY_TABLE_NAME}
+                """
+            )
+            duckdb.execute(f"DROP VIEW {POD_DAILY_TABLE_NAME}")
+            duckdb.execute(
+                "DROP MACRO TABLE IF EXISTS"
+                f" {get_pod_daily_range_macro_name(POD_DAILY_TABLE_NAME)}"
+            )
+            duckdb.create_pod_daily_trend_table(POD_DAILY_TABLE_NAME)
+            duckdb.execute(
+                f"INSERT INTO {POD_DAILY_TABLE_NAME} SELECT * FROM pod_daily_expanded"
+            )
+            duckdb.execute(f"DROP TABLE {POD_DAILY_RUNS_TABLE_NAME}")
+            duckdb.execute("DROP TABLE pod_daily_expanded")
+        print(
+            f"Storage giornaliero pod convertito in tabella '{POD_DAILY_TABLE_NAME}'.",
+            file=sys.stderr,
+        )
+        return
+
+    duckdb.create_pod_daily_runs_table(POD_DAILY_RUNS_TABLE_NAME)
+    if "daily_delta" not in duckdb.get_table_columns(POD_DAILY_RUNS_TABLE_NAME):
+        # Run salvati prima dei delta per run: colonne aggiunte e calcolate
+        # prima di ricreare la vista che le legge.
+        with duckdb.transaction():
+            for column_name in ("daily_delta", "daily_onboarded_delta"):
+                add_column(POD_DAILY_RUNS_TABLE_NAME, column_name, "BIGINT")(duckdb)
+            refresh_daily_run_deltas(duckdb)
+    if relation_type != "BASE TABLE":
+        duckdb.create_pod_daily_runs_view(POD_DAILY_TABLE_NAME, POD_DAILY_RUNS_TABLE_NAME)
+        return
+    with duckdb.transaction():
+        duckdb.execute(f"DELETE FROM {POD_DAILY_RUNS_TABLE_NAME}")
+        insert_daily_runs(duckdb, POD_DAILY_TABLE_NAME)
+        duckdb.execute(f"DROP TABLE {POD_DAILY_TABLE_NAME}")
+        duckdb.create_pod_daily_runs_view(POD_DAILY_TABLE_NAME, POD_DAILY_RUNS_TABLE_NAME)
+    print(
+        f"Storage giornaliero pod convertito in run su '{POD_DAILY_RUNS_TABLE_NAME}'.",
+        file=sys.stderr,
+    )
+
+
+def replace_all_daily_rows(duckdb, rows: list[tuple]) -> None:
+    if not is_compact_daily_storage():
+        replace_all_rows(duckdb, POD_DAILY_TABLE_NAME, rows)
+        return
+    duckdb.execute(f"DELETE FROM {POD_DAILY_RUNS_TABLE_NAME}")
+    stage_daily_rows(duckdb, rows)
+    insert_daily_runs(duckdb, "pod_daily_run_rows")
+    duckdb.execute("DROP TABLE pod_daily_run_rows")
+
+
+def replace_daily_rows_for_keys(
+    duckdb, keys: set[tuple[str, date]], rows: list[tuple]
+) -> None:
+    if not is_compact_daily_storage():
+        replace_rows_for_keys(duckdb, POD_DAILY_TABLE_NAME, "date", keys, rows)
+        return
+    if not keys:
+        return
+
+    # I run che toccano le date riscritte (piu' un giorno per lato, per poter
+    # fondere i run adiacenti) vengono espansi, aggiornati e ricompressi.
+    duckdb.execute(
+        """
+        CREATE OR REPLACE TEMP TABLE pod_daily_run_keys (
+            source_backend VARCHAR,
+            date DATE
+        )
+        """
+    )
+    duckdb.execute_many("INSERT INTO pod_daily_run_keys VALUES (?, ?)", sorted(keys))
+    stage_daily_rows(duckdb, rows)
+    duckdb.execute(
+        f"""
+        CREATE OR REPLACE TEMP TABLE pod_daily_run_touched AS
+        SELECT runs.*
+        FROM {POD_DAILY_RUNS_TABLE_NAME} AS runs
+        JOIN (
+            SELECT
+                source_backend,
+                MIN(date) - 1 AS span_start,
+                MAX(date) + 1 AS span_end
+            FROM pod_daily_run_keys
+            GROUP BY source_backend
+        ) AS spans
+          ON runs.source_backend = spans.source_backend
+        WHERE runs.valid_to >= spans.span_start
+          AND runs.valid_from <= spans.span_end
+        """
+    )
+    duckdb.execute(
+        """
+        CREATE OR REPLACE TEMP TABLE pod_daily_run_days AS
+        SELECT
+            CAST(
+                unnest(generate_series(valid_from, valid_to, INTERVAL 1 DAY)) AS DATE
+            ) AS date,
+            tenant,
+            source_backend,
+            total_pods,
+            onboarded_pods,
+            updated_at
+        FROM pod_daily_run_touched
+        """
+    )
+    duckdb.execute(
+        """
+        DELETE FROM pod_daily_run_days AS days
+        USING pod_daily_run_keys AS run_keys
+        WHERE days.source_backend = run_keys.source_backend
+          AND days.date = run_keys.date
+        """
+    )
+    duckdb.execute(
+        """
+        INSERT INTO pod_daily_run_days
+        SELECT date, tenant, source_backend, total_pods, onboarded_pods, updated_at
+        FROM pod_daily_run_rows
+        """
+    )
+    duckdb.execute(
+        f"""
+        DELETE FROM {POD_DAILY_RUNS_TABLE_NAME} AS runs
+        USING pod_daily_run_touched AS touched
+        WHERE runs.tenant = touched.tenant
+          AND runs.valid_from = touched.valid_from
+        """
+    )
+    insert_daily_runs(duckdb, "pod_daily_run_days")
+    for temp_table in (
+        "pod_daily_run_keys",
+        "pod_daily_run_rows",
+        "pod_daily_run_touched",
+        "pod_daily_run_days",
+    ):
+        duckdb.execute(f"DROP TABLE {temp_table}")
 
 
 def replace_rows_in_range(
@@ -657,15 +1625,512 @@ def replace_rows_in_range(
     end_value,
     rows: list[tuple],
 ) -> None:
-    duckdb.execute(
+    duckdb.replace_rows(
+        table_name,
+        rows,
+        where=f"{date_column} >= ? AND {date_column} <= ?",
+        params=[start_value, end_value],
+    )
+
+
+def compute_snapshot_hashes(snapshot_df: pd.DataFrame) -> dict[tuple[str, date], str]:
+    hashes: dict[tuple[str, date], str] = {}
+    if snapshot_df.empty:
+        return hashes
+
+    ordered = snapshot_df.sort_values(["source_backend", "date", "tenant"])
+    for (source_key, snapshot_date), group in ordered.groupby(
+        ["source_backend", "date"], sort=False
+    ):
+        digest = hashlib.sha256()
+        for tenant, pods, onboarded in zip(
+            group["tenant"], group["pods"], group["onboarded"]
+        ):
+            digest.update(f"{tenant}\x1f{int(pods)}\x1f{int(onboarded)}\n".encode())
+        hashes[(source_key, snapshot_date.date())] = digest.hexdigest()
+    return hashes
+
+
+def get_stored_snapshot_hashes(
+    duckdb, start_value, end_value
+) -> dict[tuple[str, date], str]:
+    df = duckdb.execute(
         f"""
-        DELETE FROM {table_name}
-        WHERE {date_column} >= ? AND {date_column} <= ?
+        SELECT source_backend, date, content_hash
+        FROM {POD_SNAPSHOT_HASH_TABLE_NAME}
+        WHERE date >= ? AND date <= ?
         """,
         [start_value, end_value],
     )
+    return {
+        (source_key, pd.Timestamp(snapshot_date).date()): content_hash
+        for source_key, snapshot_date, content_hash in zip(
+            df["source_backend"], df["date"], df["content_hash"]
+        )
+    }
+
+
+def get_changed_snapshot_keys(
+    current_hashes: dict[tuple[str, date], str],
+    stored_hashes: dict[tuple[str, date], str],
+) -> set[tuple[str, date]]:
+    changed = {
+        key
+        for key, content_hash in current_hashes.items()
+        if stored_hashes.get(key) != content_hash
+    }
+    changed.update(key for key in stored_hashes.keys() if key not in current_hashes)
+    return changed
+
+
+def select_affected_rows(
+    rows: list[tuple],
+    changed_keys: set[tuple[str, date]],
+) -> tuple[list[tuple], set[tuple[str, date]]]:
+    # Le righe arrivano ordinate per tenant e periodo (vedi build_*_rows): il
+    # delta di una riga dipende dal suo periodo e dal precedente dello stesso
+    # tenant, quindi va riscritta se una chiave modificata cade in quel range.
+    # Poiche' la riscrittura cancella per (source, periodo), si restituiscono
+    # poi tutte le righe delle chiavi coinvolte.
+    changed_periods_by_source: dict[str, list[date]] = {}
+    for source_key, period in changed_keys:
+        changed_periods_by_source.setdefault(source_key, []).append(period)
+    for periods in changed_periods_by_source.values():
+        periods.sort()
+
+    affected_keys = set(changed_keys)
+    previous_tenant = None
+    previous_period = None
+    for row in rows:
+        period, tenant, source_key = row[0], row[1], row[2]
+        if tenant != previous_tenant:
+            previous_period = None
+        changed_periods = changed_periods_by_source.get(source_key)
+        if changed_periods:
+            index = bisect_right(changed_periods, period)
+            if index > 0 and (
+                previous_period is None
+                or changed_periods[index - 1] >= previous_period
+            ):
+                affected_keys.add((source_key, period))
+        previous_tenant = tenant
+        previous_period = period
+
+    affected_rows = [row for row in rows if (row[2], row[0]) in affected_keys]
+    return affected_rows, affected_keys
+
+
+def replace_rows_for_keys(
+    duckdb,
+    table_name: str,
+    date_column: str,
+    keys: set[tuple[str, date]],
+    rows: list[tuple],
+) -> None:
+    staging_table = duckdb.stage_rows(table_name, rows)
+    with duckdb.transaction():
+        if keys:
+            duckdb.execute_many(
+                f"""
+                DELETE FROM {table_name}
+                WHERE source_backend = ? AND {date_column} = ?
+                """,
+                sorted(keys),
+            )
+        duckdb.publish_staged_rows(table_name, staging_table)
+
+
+def store_snapshot_hashes(
+    duckdb,
+    current_hashes: dict[tuple[str, date], str],
+    changed_keys: set[tuple[str, date]],
+    updated_at: datetime,
+) -> None:
+    removed_keys = sorted(key for key in changed_keys if key not in current_hashes)
+    if removed_keys:
+        duckdb.execute_many(
+            f"""
+            DELETE FROM {POD_SNAPSHOT_HASH_TABLE_NAME}
+            WHERE source_backend = ? AND date = ?
+            """,
+            removed_keys,
+        )
+    rows = [
+        (source_key, snapshot_date, current_hashes[(source_key, snapshot_date)], updated_at)
+        for source_key, snapshot_date in sorted(changed_keys)
+        if (source_key, snapshot_date) in current_hashes
+    ]
     if rows:
-        duckdb.insert_many(table_name, rows)
+        duckdb.insert_many(POD_SNAPSHOT_HASH_TABLE_NAME, rows)
+
+
+def get_hourly_retention_start(updated_at: datetime) -> pd.Timestamp:
+    return pd.Timestamp(updated_at).tz_convert(None).floor("h") - pd.Timedelta(
+        days=POD_HOURLY_RETENTION_DAYS
+    )
+
+
+def get_latest_hourly_ts(duckdb) -> dict[str, pd.Timestamp]:
+    df = duckdb.execute(
+        f"""
+        SELECT source_backend, MAX(ts) AS latest_ts
+        FROM {POD_HOURLY_TABLE_NAME}
+        GROUP BY source_backend
+        """
+    )
+    return {
+        source_key: pd.Timestamp(latest_ts)
+        for source_key, latest_ts in zip(df["source_backend"], df["latest_ts"])
+    }
+
+
+def store_hourly_snapshots(
+    duckdb,
+    hourly_columns: list[SnapshotColumns],
+    updated_at: datetime,
+) -> int:
+    # Scrittura incrementale: per ogni sorgente vengono riscritte solo le ore
+    # successive all'ultima salvata, meno una finestra di POD_HOURLY_REWRITE_HOURS
+    # per assorbire correzioni tardive. Le ore fuori retention non vengono scritte.
+    hourly_df = normalize_snapshot_df(merge_snapshot_columns(hourly_columns), "h")
+    if hourly_df.empty:
+        return 0
+
+    retention_start = get_hourly_retention_start(updated_at)
+    latest_ts = get_latest_hourly_ts(duckdb)
+    rewrite_from: dict[str, pd.Timestamp] = {}
+    for source_key, source_df in hourly_df.groupby("source_backend"):
+        start = max(retention_start, source_df["date"].min())
+        if source_key in latest_ts:
+            start = max(
+                start, latest_ts[source_key] - pd.Timedelta(hours=POD_HOURLY_REWRITE_HOURS)
+            )
+        rewrite_from[source_key] = start
+
+    hourly_df = hourly_df[
+        hourly_df["date"] >= hourly_df["source_backend"].map(rewrite_from)
+    ]
+    rows = [
+        (
+            row.date.to_pydatetime(),
+            row.tenant,
+            row.source_backend,
+            int(row.pods),
+            int(row.onboarded),
+            updated_at,
+        )
+        for row in hourly_df.itertuples(index=False)
+    ]
+    with duckdb.transaction():
+        duckdb.execute_many(
+            f"""
+            DELETE FROM {POD_HOURLY_TABLE_NAME}
+            WHERE source_backend = ? AND ts >= ?
+            """,
+            [
+                (source_key, start.to_pydatetime())
+                for source_key, start in sorted(rewrite_from.items())
+            ],
+        )
+        if rows:
+            duckdb.insert_many(POD_HOURLY_TABLE_NAME, rows)
+    return len(rows)
+
+
+def compact_hourly_snapshots(duckdb, updated_at: datetime) -> tuple[int, int]:
+    # Retention: le ore piu' vecchie di POD_HOURLY_RETENTION_DAYS vengono
+    # eliminate (il rollup giornaliero resta in pod_daily_trend).
+    # Compattazione: oltre POD_HOURLY_COMPACT_AFTER_DAYS si tengono solo le ore
+    # in cui i valori cambiano rispetto all'ora precedente salvata.
+    retention_start = get_hourly_retention_start(updated_at)
+    compact_before = pd.Timestamp(updated_at).tz_convert(None).floor("h") - pd.Timedelta(
+        days=POD_HOURLY_COMPACT_AFTER_DAYS
+    )
+    with duckdb.transaction():
+        expired = duckdb.execute(
+            f"""
+            DELETE FROM {POD_HOURLY_TABLE_NAME}
+            WHERE ts < ?
+            RETURNING ts
+            """,
+            [retention_start.to_pydatetime()],
+        )
+        compacted = duckdb.execute(
+            f"""
+            DELETE FROM {POD_HOURLY_TABLE_NAME} AS hourly
+            USING (
+                SELECT tenant, ts
+                FROM (
+                    SELECT
+                        tenant,
+                        ts,
+                        total_pods,
+                        onboarded_pods,
+                        LAG(total_pods) OVER tenant_hours AS previous_total,
+                        LAG(onboarded_pods) OVER tenant_hours AS previous_onboarded
+                    FROM {POD_HOURLY_TABLE_NAME}
+                    WHERE ts < ?
+                    WINDOW tenant_hours AS (PARTITION BY tenant ORDER BY ts)
+                )
+                WHERE total_pods = previous_total
+                  AND onboarded_pods = previous_onboarded
+            ) AS unchanged
+            WHERE hourly.tenant = unchanged.tenant AND hourly.ts = unchanged.ts
+            RETURNING hourly.ts
+            """,
+            [compact_before.to_pydatetime()],
+        )
+    return len(expired), len(compacted)
+
+
+def get_bootstrap_progress(duckdb) -> dict[str, dict[str, str]]:
+    df = duckdb.execute(
+        f"""
+        SELECT source_backend, path, status
+        FROM {POD_BOOTSTRAP_PROGRESS_TABLE_NAME}
+        """
+    )
+    progress: dict[str, dict[str, str]] = {}
+    for source_key, path, status in zip(df["source_backend"], df["path"], df["status"]):
+        progress.setdefault(source_key, {})[path] = status
+    return progress
+
+
+def is_closed_partition(path: str, current_year: int) -> bool:
+    partition_year = get_partition_year(path)
+    return partition_year is not None and partition_year < current_year
+
+
+def commit_bootstrap_partition(
+    duckdb,
+    source_key: str,
+    path: str,
+    status: str,
+    partition_df: pd.DataFrame,
+    committed_at: datetime,
+) -> None:
+    rows = [
+        (
+            row.date.date(),
+            row.tenant,
+            row.source_backend,
+            int(row.pods),
+            int(row.onboarded),
+            path,
+        )
+        for row in partition_df.itertuples(index=False)
+    ]
+    with duckdb.transaction():
+        duckdb.execute(
+            f"""
+            DELETE FROM {POD_BOOTSTRAP_SNAPSHOT_TABLE_NAME}
+            WHERE source_backend = ? AND path = ?
+            """,
+            [source_key, path],
+        )
+        if rows:
+            duckdb.insert_many(POD_BOOTSTRAP_SNAPSHOT_TABLE_NAME, rows)
+        duckdb.insert_many(
+            POD_BOOTSTRAP_PROGRESS_TABLE_NAME,
+            [(source_key, path, status, len(rows), committed_at)],
+        )
+
+
+def load_bootstrap_partitions(
+    duckdb,
+    input_paths_by_source: dict[str, list[str]],
+    current_year: int,
+    metrics: dict[str, SourceMetrics] | None = None,
+) -> dict[str, list[str]]:
+    # Le partizioni di anni chiusi gia' committate vengono saltate; l'anno
+    # corrente viene sempre riletto perche' il file continua a crescere.
+    progress = get_bootstrap_progress(duckdb)
+    loaded_paths_by_source = {
+        source_key: [] for source_key in input_paths_by_source.keys()
+    }
+    pending_paths_by_source: dict[str, list[str]] = {}
+    sources_with_snapshots = set()
+
+    for source_key, input_paths in input_paths_by_source.items():
+        source_progress = progress.get(source_key, {})
+        pending_paths_by_source[source_key] = []
+        for path in input_paths:
+            status = source_progress.get(path)
+            if status is not None and is_closed_partition(path, current_year):
+                print(
+                    "Bootstrap ripreso, partizione gia' committata:"
+                    f" source={source_key}, status={status}, path={path}",
+                    file=sys.stderr,
+                )
+                if status == BOOTSTRAP_STATUS_LOADED:
+                    sources_with_snapshots.add(source_key)
+                    loaded_paths_by_source[source_key].append(path)
+                continue
+            pending_paths_by_source[source_key].append(path)
+
+    snapshot_files = fetch_snapshot_files(
+        pending_paths_by_source,
+        skip_missing_leading_paths=True,
+        sources_with_snapshots=frozenset(sources_with_snapshots),
+        metrics=metrics,
+    )
+    for snapshot_file, columns in parse_snapshot_files(snapshot_files):
+        source_key = snapshot_file.source.source_key
+        if columns is None:
+            commit_bootstrap_partition(
+                duckdb,
+                source_key,
+                snapshot_file.path,
+                BOOTSTRAP_STATUS_MISSING,
+                pd.DataFrame(columns=list(REQUIRED_SNAPSHOT_COLUMNS)),
+                datetime.now(UTC),
+            )
+            continue
+
+        record_parsed_snapshot(metrics, columns)
+        if snapshot_file.source.is_hourly:
+            store_hourly_snapshots(duckdb, [columns], datetime.now(UTC))
+            columns = rollup_daily_columns(columns)
+        commit_bootstrap_partition(
+            duckdb,
+            source_key,
+            snapshot_file.path,
+            BOOTSTRAP_STATUS_LOADED,
+            normalize_snapshot_df(merge_snapshot_columns([columns])),
+            datetime.now(UTC),
+        )
+        loaded_paths_by_source[source_key].append(snapshot_file.path)
+
+    return loaded_paths_by_source
+
+
+def read_bootstrap_snapshot_df(duckdb) -> pd.DataFrame:
+    return duckdb.execute(
+        f"""
+        SELECT date, tenant, source_backend, pods, onboarded
+        FROM {POD_BOOTSTRAP_SNAPSHOT_TABLE_NAME}
+        """
+    )
+
+
+def clear_bootstrap_progress(duckdb) -> None:
+    duckdb.execute(f"DELETE FROM {POD_BOOTSTRAP_SNAPSHOT_TABLE_NAME}")
+    duckdb.execute(f"DELETE FROM {POD_BOOTSTRAP_PROGRESS_TABLE_NAME}")
+
+
+def rebuild_derived_tables(duckdb, updated_at: datetime) -> tuple[int, int]:
+    # Ricalcola delta giornalieri e tabella mensile dai totali gia' salvati in
+    # pod_daily_trend, con la stessa semantica del bootstrap.
+    duckdb.execute(
+        f"""
+        CREATE OR REPLACE TEMP TABLE pod_daily_rebuild AS
+        SELECT
+            date,
+            tenant,
+            source_backend,
+            total_pods - COALESCE(LAG(total_pods) OVER tenant_days, 0) AS daily_delta,
+            total_pods,
+            onboarded_pods - COALESCE(LAG(onboarded_pods) OVER tenant_days, 0)
+                AS daily_onboarded_delta,
+            onboarded_pods,
+            updated_at
+        FROM {POD_DAILY_TABLE_NAME}
+        WINDOW tenant_days AS (PARTITION BY tenant ORDER BY date)
+        """
+    )
+    duckdb.execute(
+        """
+        CREATE OR REPLACE TEMP TABLE pod_monthly_rebuild AS
+        WITH month_last AS (
+            SELECT
+                CAST(date_trunc('month', date) AS DATE) AS month_start,
+                tenant,
+                source_backend,
+                total_pods,
+                onboarded_pods
+            FROM pod_daily_rebuild
+            QUALIFY ROW_NUMBER() OVER (
+                PARTITION BY tenant, date_trunc('month', date)
+                ORDER BY date DESC
+            ) = 1
+        )
+        SELECT
+            month_start,
+            tenant,
+            source_backend,
+            total_pods - COALESCE(LAG(total_pods) OVER tenant_months, 0)
+                AS monthly_delta,
+            total_pods,
+            onboarded_pods - COALESCE(LAG(onboarded_pods) OVER tenant_months, 0)
+                AS monthly_onboarded_delta,
+            onboarded_pods,
+            CAST(? AS TIMESTAMP) AS updated_at
+        FROM month_last
+        WINDOW tenant_months AS (PARTITION BY tenant ORDER BY month_start)
+        """,
+        [updated_at.replace(tzinfo=None)],
+    )
+    with duckdb.transaction():
+        # In modalita' compact i delta giornalieri sono gia' calcolati dalla vista.
+        if not is_compact_daily_storage():
+            duckdb.execute(f"DELETE FROM {POD_DAILY_TABLE_NAME}")
+            duckdb.execute(
+                f"""
+                INSERT INTO {POD_DAILY_TABLE_NAME} (
+                    date, tenant, source_backend, daily_delta, total_pods,
+                    daily_onboarded_delta, onboarded_pods, updated_at
+                )
+                SELECT
+                    date, tenant, source_backend, daily_delta, total_pods,
+                    daily_onboarded_delta, onboarded_pods, updated_at
+                FROM pod_daily_rebuild
+                """
+            )
+        duckdb.execute(f"DELETE FROM {POD_MONTHLY_TABLE_NAME}")
+        duckdb.execute(
+            f"""
+            INSERT INTO {POD_MONTHLY_TABLE_NAME} (
+                month_start, tenant, source_backend, monthly_delta, total_pods,
+                monthly_onboarded_delta, onboarded_pods, updated_at
+            )
+            SELECT
+                month_start, tenant, source_backend, monthly_delta, total_pods,
+                monthly_onboarded_delta, onboarded_pods, updated_at
+            FROM pod_monthly_rebuild
+            """
+        )
+        refresh_pod_catalog(duckdb)
+    counts = duckdb.execute(
+        """
+        SELECT
+            (SELECT COUNT(*) FROM pod_daily_rebuild) AS daily_rows,
+            (SELECT COUNT(*) FROM pod_monthly_rebuild) AS monthly_rows
+        """
+    )
+    duckdb.execute("DROP TABLE pod_daily_rebuild")
+    duckdb.execute("DROP TABLE pod_monthly_rebuild")
+    return int(counts.iloc[0]["daily_rows"]), int(counts.iloc[0]["monthly_rows"])
+
+
+def rebuild_derived_main() -> None:
+    duckdb = get_duckdb_client(DUCKDB_DATABASE)
+    try:
+        duckdb.create_pod_trend_table(POD_MONTHLY_TABLE_NAME)
+        ensure_daily_storage(duckdb)
+        run_migrations(duckdb, POD_MIGRATION_SCOPE, POD_MIGRATIONS)
+        ensure_pod_catalog(duckdb)
+        started_at = time.perf_counter()
+        daily_count, monthly_count = rebuild_derived_tables(duckdb, datetime.now(UTC))
+        duckdb.checkpoint()
+        print(
+            "Rebuild derivati pod completato:"
+            f" database={duckdb.db_path},"
+            f" {daily_count} righe ricalcolate su '{POD_DAILY_TABLE_NAME}',"
+            f" {monthly_count} righe ricostruite su '{POD_MONTHLY_TABLE_NAME}'"
+            f" in {time.perf_counter() - started_at:.2f}s."
+        )
+    finally:
+        duckdb.close()
 
 
 def summarize_loaded_sources(input_paths_by_source: dict[str, list[str]]) -> str:
@@ -678,41 +2143,81 @@ def summarize_loaded_sources(input_paths_by_source: dict[str, list[str]]) -> str
 
 
 def main() -> None:
+    if sys.argv[1:] == [REBUILD_DERIVED_COMMAND]:
+        rebuild_derived_main()
+        return
     if sys.argv[1:]:
         raise ValueError(
-            "Il pod collector non accetta argomenti posizionali. "
+            "Il pod collector accetta solo l'argomento opzionale "
+            f"'{REBUILD_DERIVED_COMMAND}'. "
             "Configura eventualmente i template via env."
         )
 
     duckdb = get_duckdb_client(DUCKDB_DATABASE)
     try:
         duckdb.create_pod_trend_table(POD_MONTHLY_TABLE_NAME)
-        duckdb.create_pod_daily_trend_table(POD_DAILY_TABLE_NAME)
+        ensure_daily_storage(duckdb)
+        duckdb.create_pod_hourly_trend_table(POD_HOURLY_TABLE_NAME)
+        duckdb.create_pod_snapshot_hash_table(POD_SNAPSHOT_HASH_TABLE_NAME)
+        duckdb.create_pod_bootstrap_progress_table(POD_BOOTSTRAP_PROGRESS_TABLE_NAME)
+        duckdb.create_pod_bootstrap_snapshot_table(POD_BOOTSTRAP_SNAPSHOT_TABLE_NAME)
+        run_migrations(duckdb, POD_MIGRATION_SCOPE, POD_MIGRATIONS)
+        ensure_pod_catalog(duckdb)
 
         current_year = datetime.now(UTC).year
         target_years, is_bootstrap = get_target_years(duckdb, current_year)
         input_paths_by_source = build_input_paths_by_source(target_years)
 
-        raw_snapshot_df, loaded_paths_by_source = load_snapshot_df(
-            input_paths_by_source,
-            skip_missing_leading_paths=is_bootstrap,
+        source_metrics: dict[str, SourceMetrics] = {}
+        hourly_columns: list[SnapshotColumns] = []
+        if is_bootstrap:
+            loaded_paths_by_source = load_bootstrap_partitions(
+                duckdb, input_paths_by_source, current_year, metrics=source_metrics
+            )
+            raw_snapshot_df = read_bootstrap_snapshot_df(duckdb)
+        else:
+            raw_snapshot_df, loaded_paths_by_source = load_snapshot_df(
+                input_paths_by_source,
+                metrics=source_metrics,
+                hourly_columns=hourly_columns,
+            )
+        for metrics in source_metrics.values():
+            print(f"Metriche sorgente pod {metrics.summary()}", file=sys.stderr)
+        snapshot_df, validation_report = validate_snapshot_df(raw_snapshot_df)
+        print(
+            f"Validazione snapshot pod: {validation_report.summary()}",
+            file=sys.stderr,
         )
-        snapshot_df = normalize_snapshot_df(raw_snapshot_df)
+        validation_report.raise_for_errors()
         if snapshot_df.empty:
             print("Nessuno snapshot pod valido disponibile.")
             return
 
         run_ts = datetime.now(UTC)
+        # In bootstrap le ore sono gia' state salvate partizione per partizione.
+        if hourly_columns:
+            hourly_rows = store_hourly_snapshots(duckdb, hourly_columns, run_ts)
+            print(
+                f"Snapshot orari scritti su '{POD_HOURLY_TABLE_NAME}': {hourly_rows}.",
+                file=sys.stderr,
+            )
         current_year_start = pd.Timestamp(year=current_year, month=1, day=1)
         current_year_end = pd.Timestamp(year=current_year, month=12, day=31)
         current_year_month_start = month_start(current_year_start)
-        current_year_month_end = month_start(current_year_end)
 
         if is_bootstrap:
             daily_rows = build_daily_rows(snapshot_df, run_ts)
             monthly_rows = build_monthly_rows(snapshot_df, run_ts)
-            replace_all_rows(duckdb, POD_DAILY_TABLE_NAME, daily_rows)
-            replace_all_rows(duckdb, POD_MONTHLY_TABLE_NAME, monthly_rows)
+            with duckdb.transaction():
+                replace_all_daily_rows(duckdb, daily_rows)
+                replace_all_rows(duckdb, POD_MONTHLY_TABLE_NAME, monthly_rows)
+                current_hashes = compute_snapshot_hashes(snapshot_df)
+                duckdb.execute(f"DELETE FROM {POD_SNAPSHOT_HASH_TABLE_NAME}")
+                store_snapshot_hashes(
+                    duckdb, current_hashes, set(current_hashes.keys()), run_ts
+                )
+                clear_bootstrap_progress(duckdb)
+                refresh_pod_catalog(duckdb)
             load_mode = "bootstrap"
         else:
             daily_seed_totals = get_previous_day_values(
@@ -742,21 +2247,41 @@ def main() -> None:
                 seed_totals=monthly_seed_totals,
                 seed_onboarded=monthly_seed_onboarded,
             )
-            replace_rows_in_range(
-                duckdb,
-                POD_DAILY_TABLE_NAME,
-                "date",
-                current_year_start.date(),
-                current_year_end.date(),
-                daily_rows,
+            current_hashes = compute_snapshot_hashes(snapshot_df)
+            changed_keys = get_changed_snapshot_keys(
+                current_hashes,
+                get_stored_snapshot_hashes(
+                    duckdb, current_year_start.date(), current_year_end.date()
+                ),
             )
-            replace_rows_in_range(
-                duckdb,
-                POD_MONTHLY_TABLE_NAME,
-                "month_start",
-                current_year_month_start.date(),
-                current_year_month_end.date(),
+            daily_rows, daily_keys = select_affected_rows(daily_rows, changed_keys)
+            monthly_rows, monthly_keys = select_affected_rows(
                 monthly_rows,
+                {
+                    (source_key, month_start(snapshot_date).date())
+                    for source_key, snapshot_date in changed_keys
+                },
+            )
+            with duckdb.transaction():
+                replace_daily_rows_for_keys(duckdb, daily_keys, daily_rows)
+                replace_rows_for_keys(
+                    duckdb,
+                    POD_MONTHLY_TABLE_NAME,
+                    "month_start",
+                    monthly_keys,
+                    monthly_rows,
+                )
+                store_snapshot_hashes(duckdb, current_hashes, changed_keys, run_ts)
+                if changed_keys:
+                    refresh_pod_catalog(
+                        duckdb,
+                        from_date=min(snapshot_date for _, snapshot_date in changed_keys),
+                    )
+            print(
+                f"Date snapshot modificate: {len(changed_keys)},"
+                f" chiavi giornaliere riscritte: {len(daily_keys)},"
+                f" chiavi mensili riscritte: {len(monthly_keys)}.",
+                file=sys.stderr,
             )
             load_mode = "refresh"
 
@@ -792,6 +2317,13 @@ def main() -> None:
             LIMIT 20
             """
         )
+        expired_hours, compacted_hours = compact_hourly_snapshots(duckdb, run_ts)
+        if expired_hours or compacted_hours:
+            print(
+                f"Snapshot orari rimossi: {expired_hours} oltre retention,"
+                f" {compacted_hours} compattati.",
+                file=sys.stderr,
+            )
         duckdb.checkpoint()
 
         print(
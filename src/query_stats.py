@@ -0,0 +1,210 @@
+import sys
+import threading
+from collections import deque
+from dataclasses import dataclass
+from datetime import UTC, datetime
+from pathlib import Path
+
+import duckdb
+
+from runtime_config import (
+    get_query_log_retention_days,
+    get_query_log_sidecar_path,
+    get_query_ring_size,
+)
+
+
+QUERY_LOG_TABLE_NAME = "query_log"
+QUERY_TEXT_MAX_CHARS = 2000
+CLIENT_INTERNAL_FRAMES = {
+    "execute",
+    "execute_arrow",
+    "execute_many",
+    "_fetch",
+    "_record_query",
+}
+
+
+@dataclass
+class QueryStat:
+    logged_at: datetime
+    tag: str
+    elapsed_ms: float
+    row_count: int
+    result_bytes: int
+    query: str
+    plan: str | None = None
+
+
+class QueryRecorder:
+    # Buffer in-process delle query dei cursori READ_ONLY in attesa di essere
+    # salvate sul sidecar; se il salvataggio non avviene restano le ultime
+    # max_records.
+    def __init__(self, max_records):
+        self._lock = threading.Lock()
+        self._records = deque(maxlen=max_records)
+
+    def record(self, stat):
+        with self._lock:
+            self._records.append(stat)
+
+    def drain(self):
+        with self._lock:
+            records = list(self._records)
+            self._records.clear()
+            return records
+
+    def clear(self):
+        with self._lock:
+            self._records.clear()
+
+
+QUERY_RECORDER = QueryRecorder(get_query_ring_size())
+SIDECAR_WRITE_LOCK = threading.Lock()
+
+
+def infer_query_tag(client_file: str) -> str:
+    # Il tag e' il metodo di DuckDBClient che ha lanciato la query; per le
+    # query eseguite direttamente da fuori e' modulo.funzione del chiamante.
+    frame = sys._getframe(1)
+    while frame is not None:
+        code = frame.f_code
+        if code.co_filename != client_file:
+            return f"{Path(code.co_filename).stem}.{code.co_name}"
+        if code.co_name not in CLIENT_INTERNAL_FRAMES:
+            return code.co_name
+        frame = frame.f_back
+    return "unknown"
+
+
+def compact_query_text(query: str) -> str:
+    return " ".join(query.split())[:QUERY_TEXT_MAX_CHARS]
+
+
+def measure_result(result) -> tuple[int, int]:
+    if result is None:
+        return 0, 0
+    if hasattr(result, "nbytes"):
+        return result.num_rows, int(result.nbytes)
+    return len(result), int(result.memory_usage(index=True).sum())
+
+
+def build_query_stat(tag, elapsed_ms, result, query, plan=None, row_count=None):
+    measured_rows, result_bytes = measure_result(result)
+    return QueryStat(
+        logged_at=datetime.now(UTC).replace(tzinfo=None),
+        tag=tag,
+        elapsed_ms=elapsed_ms,
+        row_count=measured_rows if row_count is None else row_count,
+        result_bytes=result_bytes,
+        query=compact_query_text(query),
+        plan=plan,
+    )
+
+
+def write_query_log(connection, stats: list[QueryStat]) -> None:
+    # Scrittura diretta sulla connessione: le query del log non vengono
+    # a loro volta registrate.
+    connection.execute(f"""
+        CREATE TABLE IF NOT EXISTS {QUERY_LOG_TABLE_NAME} (
+            logged_at TIMESTAMP,
+            tag VARCHAR,
+            elapsed_ms DOUBLE,
+            row_count BIGINT,
+            result_bytes BIGINT,
+            query VARCHAR,
+            plan VARCHAR
+        )
+    """)
+    connection.executemany(
+        f"INSERT INTO {QUERY_LOG_TABLE_NAME} VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [
+            (
+                stat.logged_at,
+                stat.tag,
+                stat.elapsed_ms,
+                stat.row_count,
+                stat.result_bytes,
+                stat.query,
+                stat.plan,
+            )
+            for stat in stats
+        ],
+    )
+    connection.execute(
+        f"""
+        DELETE FROM {QUERY_LOG_TABLE_NAME}
+        WHERE logged_at < CAST(? AS TIMESTAMP) - to_days(CAST(? AS INTEGER))
+        """,
+        [datetime.now(UTC).replace(tzinfo=None), get_query_log_retention_days()],
+    )
+
+
+def flush_sidecar_query_log(db_path: Path) -> int:
+    # Il DB della dashboard e' READ_ONLY e viene sostituito a ogni refresh: le
+    # sue query finiscono in un file DuckDB scrivibile accanto al DB.
+    stats = QUERY_RECORDER.drain()
+    if not stats:
+        return 0
+    sidecar_path = get_query_log_sidecar_path(db_path)
+    with SIDECAR_WRITE_LOCK:
+        try:
+            connection = duckdb.connect(str(sidecar_path))
+            try:
+                write_query_log(connection, stats)
+            finally:
+                connection.close()
+        except duckdb.Error as exc:
+            print(f"Impossibile salvare query_log su {sidecar_path}: {exc}")
+            return 0
+    return len(stats)
+
+
+def load_query_stats(db_path: Path, since_days: int = 7):
+    # query_log del DB (collector) e del sidecar (dashboard), distinti per
+    # origine.
+    connection = duckdb.connect()
+    try:
+        sources = []
+        for origin, path in (
+            ("collector", db_path),
+            ("dashboard", get_query_log_sidecar_path(db_path)),
+        ):
+            if not path.exists():
+                continue
+            connection.execute(f"ATTACH '{path}' AS {origin} (READ_ONLY)")
+            table_exists = connection.execute(
+                """
+                SELECT COUNT(*)
+                FROM information_schema.tables
+                WHERE table_catalog = ? AND table_schema = 'main' AND table_name = ?
+                """,
+                [origin, QUERY_LOG_TABLE_NAME],
+            ).fetchone()[0]
+            if table_exists:
+                sources.append(
+                    f"SELECT '{origin}' AS origin, * FROM {origin}.{QUERY_LOG_TABLE_NAME}"
+                )
+        if not sources:
+            return None
+        return connection.execute(
+            f"""
+            SELECT
+                origin,
+                tag,
+                COUNT(*) AS queries,
+                quantile_cont(elapsed_ms, 0.5) AS p50_ms,
+                quantile_cont(elapsed_ms, 0.95) AS p95_ms,
+                MAX(elapsed_ms) AS max_ms,
+                AVG(row_count) AS avg_rows,
+                SUM(result_bytes) AS total_bytes,
+                COUNT(plan) AS plans
+            FROM ({" UNION ALL ".join(sources)})
+            WHERE logged_at >= CAST(? AS TIMESTAMP) - to_days(CAST(? AS INTEGER))
+            GROUP BY origin, tag
+            ORDER BY p95_ms DESC
+            """,
+            [datetime.now(UTC).replace(tzinfo=None), since_days],
+        ).df()
+    finally:
+        connection.close()
@@ -3,6 +3,37 @@ from pathlib import Path
 
 
 DEFAULT_DB_NAME = "database.duckdb"
+DEFAULT_BLOB_CACHE_MAX_BYTES = 1024 * 1024 * 1024
+DEFAULT_COSTS_LOOKBACK_MONTHS = 5
+DEFAULT_COSTS_AVERAGE_WINDOWS = (6, 12)
+DEFAULT_QUERY_RING_SIZE = 500
+DEFAULT_IN_MEMORY_MAX_BYTES = 512 * 1024 * 1024
+# Profili di risorse DuckDB per entry point: nello stesso container i job di
+# refresh usano meta' dei core e un limite di memoria proprio, cosi' la
+# dashboard resta reattiva. preserve_insertion_order resta attivo dove le
+# scritture devono mantenere l'ordinamento (clustering, tiering).
+DUCKDB_PROFILE_DASHBOARD = "dashboard"
+DUCKDB_PROFILE_COLLECTOR = "collector"
+DUCKDB_PROFILE_MAINTENANCE = "maintenance"
+DUCKDB_PROFILES = {
+    DUCKDB_PROFILE_DASHBOARD: {
+        "threads": 0,
+        "memory_limit": "1GB",
+        "preserve_insertion_order": False,
+    },
+    DUCKDB_PROFILE_COLLECTOR: {
+        "threads": -2,
+        "memory_limit": "2GB",
+        "preserve_insertion_order": True,
+    },
+    DUCKDB_PROFILE_MAINTENANCE: {
+        "threads": -2,
+        "memory_limit": "2GB",
+        "preserve_insertion_order": True,
+    },
+}
+DEFAULT_QUERY_LOG_RETENTION_DAYS = 30
+DEFAULT_QUERY_LOG_FLUSH_SECONDS = 30
 
 
 def get_project_root() -> Path:
@@ -21,7 +52,10 @@ def get_database_dir() -> Path:
     return get_project_root() / "db"
 
 
-def get_db_path(database: str | None = None) -> Path:
+def get_db_path(database: str | Path | None = None) -> Path:
+    # Un Path esplicito (es. un file shard) non passa da DUCKDB_PATH.
+    if isinstance(database, Path):
+        return database
     configured_path = os.environ.get("DUCKDB_PATH", "").strip()
     if configured_path:
         return Path(configured_path).expanduser()
@@ -30,7 +64,7 @@ def get_db_path(database: str | None = None) -> Path:
     return get_database_dir() / database_name
 
 
-def ensure_db_parent(database: str | None = None) -> Path:
+def ensure_db_parent(database: str | Path | None = None) -> Path:
     db_path = get_db_path(database)
     db_path.parent.mkdir(parents=True, exist_ok=True)
     return db_path
@@ -46,9 +80,175 @@ def get_remote_db_uri() -> str | None:
     return uri or None
 
 
+def get_remote_cold_uri() -> str | None:
+    uri = os.environ.get("DUCKDB_COLD_S3_URI", "").strip()
+    return uri.rstrip("/") or None
+
+
+def get_cold_storage_dir(db_path: Path | None = None) -> Path:
+    configured_dir = os.environ.get("DUCKDB_COLD_DIR", "").strip()
+    if configured_dir:
+        return Path(configured_dir).expanduser()
+    return (db_path or get_db_path()).parent / "cold"
+
+
+def get_costs_shard_workers() -> int:
+    configured_workers = os.environ.get("COSTS_SHARD_WORKERS", "").strip()
+    if not configured_workers:
+        return 0
+    return max(0, int(configured_workers))
+
+
+def get_shard_dir(db_path: Path) -> Path:
+    return db_path.with_name(f"{db_path.stem}.shards")
+
+
+def get_compact_storage_version() -> str | None:
+    configured_version = os.environ.get("DUCKDB_COMPACT_STORAGE_VERSION", "").strip()
+    return configured_version or None
+
+
 def get_db_mtime_ns(database: str | None = None) -> int:
     db_path = get_db_path(database)
     try:
         return db_path.stat().st_mtime_ns
     except FileNotFoundError:
         return 0
+
+
+def get_cache_dir() -> Path:
+    configured_dir = os.environ.get("CHECKER_CACHE_DIR", "").strip()
+    if configured_dir:
+        return Path(configured_dir).expanduser()
+    return get_project_root() / ".cache"
+
+
+def get_blob_cache_dir() -> Path:
+    configured_dir = os.environ.get("CHECKER_BLOB_CACHE_DIR", "").strip()
+    if configured_dir:
+        return Path(configured_dir).expanduser()
+    return get_cache_dir() / "blobs"
+
+
+def get_blob_cache_max_bytes() -> int:
+    configured_size = os.environ.get("CHECKER_BLOB_CACHE_MAX_BYTES", "").strip()
+    if not configured_size:
+        return DEFAULT_BLOB_CACHE_MAX_BYTES
+    return int(configured_size)
+
+
+def get_parsed_snapshot_cache_dir() -> Path:
+    configured_dir = os.environ.get("POD_PARSED_CACHE_DIR", "").strip()
+    if configured_dir:
+        return Path(configured_dir).expanduser()
+    return get_cache_dir() / "parsed"
+
+
+def get_costs_lookback_months() -> int:
+    configured_months = os.environ.get("COSTS_METRICS_LOOKBACK_MONTHS", "").strip()
+    if not configured_months:
+        return DEFAULT_COSTS_LOOKBACK_MONTHS
+    return max(1, int(configured_months))
+
+
+def get_costs_average_windows() -> tuple[int, ...]:
+    configured_windows = os.environ.get("COSTS_METRICS_AVERAGE_MONTHS", "").strip()
+    if not configured_windows:
+        return DEFAULT_COSTS_AVERAGE_WINDOWS
+    return tuple(
+        sorted({max(1, int(value)) for value in configured_windows.split(",") if value.strip()})
+    )
+
+
+def get_query_ring_size() -> int:
+    configured_size = os.environ.get("DUCKDB_QUERY_RING_SIZE", "").strip()
+    if not configured_size:
+        return DEFAULT_QUERY_RING_SIZE
+    return max(1, int(configured_size))
+
+
+def is_query_log_enabled() -> bool:
+    configured_flag = os.environ.get("DUCKDB_QUERY_LOG", "").strip().lower()
+    return configured_flag in {"1", "true", "yes"}
+
+
+def get_query_log_retention_days() -> int:
+    configured_days = os.environ.get("DUCKDB_QUERY_LOG_RETENTION_DAYS", "").strip()
+    if not configured_days:
+        return DEFAULT_QUERY_LOG_RETENTION_DAYS
+    return max(1, int(configured_days))
+
+
+def get_query_log_flush_seconds() -> float:
+    configured_seconds = os.environ.get("DUCKDB_QUERY_LOG_FLUSH_SECONDS", "").strip()
+    if not configured_seconds:
+        return DEFAULT_QUERY_LOG_FLUSH_SECONDS
+    return max(0.0, float(configured_seconds))
+
+
+def get_query_log_sidecar_path(db_path: Path) -> Path:
+    return db_path.with_name(f"{db_path.stem}.query_log{db_path.suffix}")
+
+
+def get_query_profile_threshold_ms() -> float | None:
+    configured_threshold = os.environ.get("DUCKDB_QUERY_PROFILE_MS", "").strip()
+    if not configured_threshold:
+        return None
+    return float(configured_threshold)
+
+
+def is_in_memory_db_enabled() -> bool:
+    configured_flag = os.environ.get("DUCKDB_IN_MEMORY", "").strip().lower()
+    return configured_flag in {"1", "true", "yes"}
+
+
+def get_in_memory_max_bytes() -> int:
+    configured_size = os.environ.get("DUCKDB_IN_MEMORY_MAX_BYTES", "").strip()
+    if not configured_size:
+        return DEFAULT_IN_MEMORY_MAX_BYTES
+    return int(configured_size)
+
+
+def resolve_profile_threads(threads: int) -> int:
+    # 0 = tutti i core, -n = 1/n dei core.
+    cpu_count = os.cpu_count() or 1
+    if threads == 0:
+        return cpu_count
+    if threads < 0:
+        return max(1, cpu_count // -threads)
+    return threads
+
+
+def get_duckdb_profile_name() -> str | None:
+    configured_profile = os.environ.get("DUCKDB_PROFILE", "").strip()
+    return configured_profile or None
+
+
+def get_duckdb_config(profile: str | None = None) -> dict:
+    profile_name = profile or get_duckdb_profile_name()
+    if profile_name is None:
+        return {}
+    if profile_name not in DUCKDB_PROFILES:
+        raise ValueError(
+            f"DUCKDB_PROFILE non supportato: {profile_name}."
+            f" Valori ammessi: {', '.join(DUCKDB_PROFILES)}."
+        )
+
+    settings = dict(DUCKDB_PROFILES[profile_name])
+    env_prefix = f"DUCKDB_{profile_name.upper()}_"
+    configured_threads = os.environ.get(f"{env_prefix}THREADS", "").strip()
+    if configured_threads:
+        settings["threads"] = int(configured_threads)
+    settings["threads"] = resolve_profile_threads(settings["threads"])
+    configured_memory = os.environ.get(f"{env_prefix}MEMORY_LIMIT", "").strip()
+    if configured_memory:
+        settings["memory_limit"] = configured_memory
+
+    configured_temp_dir = os.environ.get("DUCKDB_TEMP_DIR", "").strip()
+    temp_root = (
+        Path(configured_temp_dir).expanduser()
+        if configured_temp_dir
+        else get_cache_dir() / "duckdb_tmp"
+    )
+    settings["temp_directory"] = str(temp_root / profile_name)
+    return settings
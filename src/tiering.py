@@ -0,0 +1,107 @@
+import argparse
+import os
+from dataclasses import dataclass
+from datetime import UTC, datetime
+
+from collector import (
+    COSTS_PREFIX_TABLE_NAME,
+    COSTS_ROLLUP_TABLE_NAME,
+    TABLE_NAME,
+    shift_month_start,
+)
+from db_artifact import delete_cold_files, upload_cold_files
+from duckdb_client import get_duckdb_client
+from runtime_config import get_cold_storage_dir
+
+
+DUCKDB_DATABASE = os.environ.get("DUCKDB_DATABASE", "database.duckdb")
+DEFAULT_KEEP_MONTHS = 13
+
+
+@dataclass(frozen=True)
+class TieredTable:
+    table_name: str
+    date_column: str
+
+
+# Solo le tabelle costi: i trend pod leggono i giorni precedenti per i delta
+# e il rebuild dei derivati richiede lo storico completo nel DB.
+TIERED_TABLES = [
+    TieredTable(TABLE_NAME, "date"),
+    TieredTable(COSTS_ROLLUP_TABLE_NAME, "month_start"),
+    TieredTable(COSTS_PREFIX_TABLE_NAME, "date"),
+]
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Sposta i mesi chiusi piu' vecchi in Parquet partizionato."
+    )
+    parser.add_argument(
+        "--keep-months",
+        type=int,
+        default=DEFAULT_KEEP_MONTHS,
+        help=(
+            "Mesi chiusi da mantenere nel DB oltre al corrente. "
+            f"Default: {DEFAULT_KEEP_MONTHS}"
+        ),
+    )
+    return parser
+
+
+def main() -> None:
+    args = build_parser().parse_args()
+    if args.keep_months < 1:
+        raise ValueError("--keep-months deve essere almeno 1.")
+
+    cutoff = shift_month_start(datetime.now(UTC).date(), -args.keep_months)
+    duckdb = get_duckdb_client(DUCKDB_DATABASE)
+    try:
+        cold_dir = get_cold_storage_dir(duckdb.db_path)
+        tiered_tables = [
+            tiered_table
+            for tiered_table in TIERED_TABLES
+            if duckdb.get_relation_type(tiered_table.table_name) == "BASE TABLE"
+        ]
+
+        # Prima i file (e l'upload su S3), poi la cancellazione dal DB caldo.
+        # Finche' un mese resta nel DB caldo le letture ignorano i suoi file
+        # freddi; ogni esecuzione, anche in un mese successivo, riscrive per
+        # intero le partizioni dei mesi che copia.
+        written_files = []
+        removed_files = []
+        copied_rows = {}
+        for tiered_table in tiered_tables:
+            row_count, files, stale_files = duckdb.copy_rows_to_cold_tier(
+                tiered_table.table_name,
+                tiered_table.date_column,
+                cutoff,
+            )
+            copied_rows[tiered_table.table_name] = row_count
+            written_files.extend(files)
+            removed_files.extend(stale_files)
+        upload_cold_files(cold_dir, written_files)
+        delete_cold_files(cold_dir, removed_files)
+
+        with duckdb.transaction():
+            for tiered_table in tiered_tables:
+                duckdb.delete_rows_before(
+                    tiered_table.table_name, tiered_table.date_column, cutoff
+                )
+        duckdb.create_costs_view()
+        duckdb.checkpoint()
+        print(
+            "Tiering completato:"
+            f" database={duckdb.db_path},"
+            f" cold={cold_dir},"
+            f" taglio={cutoff},"
+            f" file={len(written_files)},"
+            " righe="
+            + ", ".join(f"{name}={count}" for name, count in copied_rows.items())
+        )
+    finally:
+        duckdb.close()
+
+
+if __name__ == "__main__":
+    main()